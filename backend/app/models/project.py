@@ -1,8 +1,10 @@
-from sqlalchemy import Column, String, Integer, JSON, ForeignKey, DateTime, MetaData, Boolean, Float
+from sqlalchemy import Column, String, Integer, SmallInteger, BigInteger, JSON, ForeignKey, DateTime, MetaData, Boolean, Float, Index, Computed
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from geoalchemy2 import Geometry
+from app.utils.geojson_output import simplified_boundary_sql
 
 Base = declarative_base()
 
@@ -14,6 +16,10 @@ class Project(Base):
     status = Column(String, default="IN_PROGRESS")
     boundary_geom = Column(Geometry('GEOMETRY', srid=4326))  # Legacy - will migrate to areas
     config = Column(JSONB, default={})
+    grid_version = Column(Integer, default=0)  # Bumped whenever the project's grid cells may change (tile cache key)
+    areas_version = Column(Integer, default=0)  # Bumped on any area change (area list ETag)
+    schema_version = Column(Integer, default=0)  # Bumped on column, form and assignment changes
+    responses_version = Column(Integer, default=0)  # Bumped on any response change (response tile ETag)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     admin_id = Column(Integer, ForeignKey("users.id"))
 
@@ -21,16 +27,29 @@ class Project(Base):
 class ProjectArea(Base):
     """Represents a distinct geographic area within a project"""
     __tablename__ = "project_areas"
+    __table_args__ = (
+        Index("idx_project_areas_project_id", "project_id"),
+        Index("idx_project_areas_boundary_geom", "boundary_geom", postgresql_using="gist"),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
     project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"))
     name = Column(String, nullable=False)
     description = Column(String)
-    boundary_geom = Column(Geometry('GEOMETRY', srid=4326))
+    boundary_geom = Column(Geometry('GEOMETRY', srid=4326, spatial_index=False))
+    # Outlines simplified to half a pixel at zooms 6, 10 and 14 (BOUNDARY_SIMPLIFIED_ZOOMS), computed by Postgres
+    # whenever the boundary is written; deferred so loading an area does not fetch them
+    boundary_z6 = deferred(Column(Geometry('GEOMETRY', srid=4326, spatial_index=False), Computed(simplified_boundary_sql(6), persisted=True)))
+    boundary_z10 = deferred(Column(Geometry('GEOMETRY', srid=4326, spatial_index=False), Computed(simplified_boundary_sql(10), persisted=True)))
+    boundary_z14 = deferred(Column(Geometry('GEOMETRY', srid=4326, spatial_index=False), Computed(simplified_boundary_sql(14), persisted=True)))
     # Grid configuration for this area (in km²)
     min_cell_area_km2 = Column(Float, default=0.0003)  # ~300 m² = 0.0003 km²
     max_cell_area_km2 = Column(Float, default=5.0)     # 5 km²
     num_resolutions = Column(Integer, default=8)
+    num_virtual_resolutions = Column(Integer, default=0)  # Finest levels computed on demand instead of stored
     grids_generated = Column(Boolean, default=False)
+    virtual_resolutions = Column(JSONB, default=[])  # Levels the last generation left virtual
+    is_project_boundary = Column(Boolean, default=False)  # Holds the grid generated from Project.boundary_geom
+    version = Column(Integer, default=0)  # Bumped when the area or its grid changes (ETag of area endpoints)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
@@ -70,13 +89,64 @@ class FormAssignment(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class ProjectGridCell(Base):
+    """
+    One H3 cell of an area's grid. Cells are stored as their 64-bit H3 value under a compact natural key;
+    the project comes from project_areas and the hex string form only exists at the API boundary
+    (to_hex(h3) in SQL, int(h, 16) / format(h, "x") in Python).
+    """
     __tablename__ = "project_grid_cells"
+    __table_args__ = (
+        # The primary key serves area/resolution scans and tile ranges; this one serves lookups by cell across areas
+        Index("idx_project_grid_cells_resolution_h3", "resolution", "h3"),
+        Index("idx_project_grid_cells_geometry", "geometry", postgresql_using="gist"),
+        Index("idx_project_grid_cells_geom_3857", "geom_3857", postgresql_using="gist"),
+    )
+    area_id = Column(UUID(as_uuid=True), ForeignKey("project_areas.id", ondelete="CASCADE"), primary_key=True)
+    resolution = Column(SmallInteger, primary_key=True)  # H3 resolution level
+    h3 = Column(BigInteger, primary_key=True)  # H3 cell index (always < 2^63, so it fits a signed BIGINT)
+    geometry = Column(Geometry('POLYGON', srid=4326, spatial_index=False))
+    # Web Mercator copy for tile rendering, computed by Postgres as cells are loaded
+    geom_3857 = Column(
+        Geometry('POLYGON', srid=3857, spatial_index=False),
+        Computed("ST_Transform(geometry, 3857)", persisted=True)
+    )
+
+class GridCatalogEntry(Base):
+    """Summary of one stored resolution of an area's grid, written by the generator so readers never aggregate cells"""
+    __tablename__ = "grid_catalog"
+    area_id = Column(UUID(as_uuid=True), ForeignKey("project_areas.id", ondelete="CASCADE"), primary_key=True)
+    resolution = Column(SmallInteger, primary_key=True)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), index=True)
+    cell_count = Column(BigInteger, nullable=False)
+    # Extent of the stored cells in lng/lat
+    min_lng = Column(Float)
+    min_lat = Column(Float)
+    max_lng = Column(Float)
+    max_lat = Column(Float)
+    grid_version = Column(Integer)  # Project.grid_version the entry was written at
+    generated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class GridJob(Base):
+    """Durable grid generation job; progress is committed alongside the cells so a job can resume"""
+    __tablename__ = "grid_jobs"
     id = Column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
     project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"))
-    area_id = Column(UUID(as_uuid=True), ForeignKey("project_areas.id", ondelete="CASCADE"), nullable=True)  # New: link to specific area
-    h3_index = Column(String, nullable=False)
-    resolution = Column(Integer, nullable=False, default=8)  # H3 resolution level
-    geometry = Column(Geometry('POLYGON', srid=4326))
+    area_id = Column(UUID(as_uuid=True), ForeignKey("project_areas.id", ondelete="CASCADE"), nullable=True)
+    status = Column(String, default="PENDING")  # PENDING, RUNNING, CANCELLING, SUCCESS, FAILED, CANCELLED
+    params = Column(JSONB, default={})  # resolutions, mode, inclusion, incremental
+    state = Column(JSONB, default={})   # cleared, completed_resolutions, timings, dropped_response_cells
+    current_resolution = Column(Integer)
+    cells_written = Column(BigInteger, default=0)
+    cells_removed = Column(BigInteger, default=0)
+    progress = Column(Integer, default=0)
+    message = Column(String)
+    error = Column(String)
+    result = Column(JSONB)
+    attempts = Column(Integer, default=0)
+    worker_id = Column(String)
+    heartbeat_at = Column(DateTime(timezone=True))
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class FormSchema(Base): # Legacy, keeping for compatibility for now
@@ -88,11 +158,17 @@ class FormSchema(Base): # Legacy, keeping for compatibility for now
 
 class StakeholderResponse(Base):
     __tablename__ = "stakeholder_responses"
+    __table_args__ = (
+        Index("idx_stakeholder_responses_project_h3", "project_id", "h3_index"),
+        Index("idx_stakeholder_responses_area_id", "area_id"),
+        Index("idx_stakeholder_responses_geom", "geom", postgresql_using="gist"),
+        Index("idx_stakeholder_responses_response_data", "response_data", postgresql_using="gin"),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
     project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"))
     area_id = Column(UUID(as_uuid=True), ForeignKey("project_areas.id", ondelete="SET NULL"), nullable=True)  # New: link to specific area
     user_id = Column(Integer, ForeignKey("users.id"))
     h3_index = Column(String, nullable=True)
     response_data = Column(JSONB, nullable=False)
-    geom = Column(Geometry('GEOMETRY', srid=4326))
+    geom = Column(Geometry('GEOMETRY', srid=4326, spatial_index=False))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
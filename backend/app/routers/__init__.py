@@ -1 +1 @@
-from . import projects, grids, responses, schema, auth, users, areas, mvt
+from . import projects, grids, responses, schema, auth, users, areas, mvt, jobs
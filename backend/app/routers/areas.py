@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func, delete
+from sqlalchemy import func, delete, text
 from app.database import get_db
 from app.models.project import ProjectArea, ProjectGridCell, StakeholderResponse
+from app.utils.geo import H3_RES_OFFSET
+from app.utils.grid_store import h3_index_to_bigint_sql
+from app.utils.tile_cache import bump_grid_version
+from app.utils.geojson_output import boundary_output
+from app.utils.versions import (
+    project_version, area_version, bump_project_version, bump_area_version, make_etag, etag_matches, etag_headers, not_modified
+)
 from geoalchemy2.elements import WKTElement
 from shapely.geometry import shape, mapping
 import json
@@ -22,6 +29,7 @@ class AreaCreate(BaseModel):
     min_cell_area_km2: float = 0.0003  # ~300 m²
     max_cell_area_km2: float = 5.0     # 5 km²
     num_resolutions: int = 8
+    num_virtual_resolutions: int = 0
 
 
 class AreaUpdate(BaseModel):
@@ -31,14 +39,40 @@ class AreaUpdate(BaseModel):
     min_cell_area_km2: Optional[float] = None
     max_cell_area_km2: Optional[float] = None
     num_resolutions: Optional[int] = None
+    num_virtual_resolutions: Optional[int] = None
+
+
+def boundary_geojson(zoom: Optional[float], precision: Optional[int], simplify: Optional[float]):
+    """ST_AsGeoJSON of the boundary as detailed as drawing it at `zoom` needs (see app.utils.geojson_output)"""
+    digits, tolerance, stored_zoom = boundary_output(zoom, precision, simplify)
+    geometry = ProjectArea.boundary_geom
+    if tolerance is not None:
+        geometry = func.ST_SimplifyPreserveTopology(geometry, tolerance)
+    elif stored_zoom is not None:
+        geometry = getattr(ProjectArea, f"boundary_z{stored_zoom}")
+    return func.ST_AsGeoJSON(geometry, digits).label("geojson")
 
 
 @router.get("/{project_id}")
 async def get_project_areas(
     project_id: UUID,
+    request: Request,
+    response: Response,
+    zoom: Optional[float] = Query(None, ge=0, le=24, description="Sınırın çizileceği zoom; hassasiyet ve sadeleştirme buna göre seçilir"),
+    precision: Optional[int] = Query(None, ge=0, le=15, description="Koordinat ondalık basamağı"),
+    simplify: Optional[float] = Query(None, ge=0, description="Sadeleştirme toleransı (derece)"),
+    include_boundary: bool = Query(False, description="Proje sınırı gridini tutan iç alanı da listele"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all areas for a project"""
+    """
+    Get all areas for a project; boundaries are simplified for `zoom` when it is given, and sent in full otherwise.
+    The area holding the legacy project-boundary grid is internal and only listed with include_boundary.
+    """
+    etag = make_etag("areas", project_id, include_boundary, await project_version(db, project_id, "areas_version"))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+
     query = select(
         ProjectArea.id,
         ProjectArea.name,
@@ -46,10 +80,15 @@ async def get_project_areas(
         ProjectArea.min_cell_area_km2,
         ProjectArea.max_cell_area_km2,
         ProjectArea.num_resolutions,
+        ProjectArea.num_virtual_resolutions,
+        ProjectArea.virtual_resolutions,
         ProjectArea.grids_generated,
+        ProjectArea.is_project_boundary,
         ProjectArea.created_at,
-        func.ST_AsGeoJSON(ProjectArea.boundary_geom).label("geojson")
+        boundary_geojson(zoom, precision, simplify)
     ).where(ProjectArea.project_id == project_id).order_by(ProjectArea.created_at)
+    if not include_boundary:
+        query = query.where(ProjectArea.is_project_boundary.isnot(True))
     
     result = await db.execute(query)
     rows = result.all()
@@ -63,7 +102,10 @@ async def get_project_areas(
             "min_cell_area_km2": row.min_cell_area_km2,
             "max_cell_area_km2": row.max_cell_area_km2,
             "num_resolutions": row.num_resolutions,
+            "num_virtual_resolutions": row.num_virtual_resolutions or 0,
+            "virtual_resolutions": row.virtual_resolutions or [],
             "grids_generated": row.grids_generated,
+            "is_project_boundary": bool(row.is_project_boundary),
             "created_at": row.created_at.isoformat() if row.created_at else None,
             "boundary_geom": json.loads(row.geojson) if row.geojson else None
         }
@@ -76,9 +118,19 @@ async def get_project_areas(
 async def get_area(
     project_id: UUID,
     area_id: UUID,
+    request: Request,
+    response: Response,
+    zoom: Optional[float] = Query(None, ge=0, le=24, description="Sınırın çizileceği zoom; hassasiyet ve sadeleştirme buna göre seçilir"),
+    precision: Optional[int] = Query(None, ge=0, le=15, description="Koordinat ondalık basamağı"),
+    simplify: Optional[float] = Query(None, ge=0, description="Sadeleştirme toleransı (derece)"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get a specific area"""
+    """Get a specific area; its boundary is simplified for `zoom` when it is given, and sent in full otherwise"""
+    etag = make_etag("area", area_id, await area_version(db, area_id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+
     query = select(
         ProjectArea.id,
         ProjectArea.name,
@@ -86,9 +138,12 @@ async def get_area(
         ProjectArea.min_cell_area_km2,
         ProjectArea.max_cell_area_km2,
         ProjectArea.num_resolutions,
+        ProjectArea.num_virtual_resolutions,
+        ProjectArea.virtual_resolutions,
         ProjectArea.grids_generated,
+        ProjectArea.is_project_boundary,
         ProjectArea.created_at,
-        func.ST_AsGeoJSON(ProjectArea.boundary_geom).label("geojson")
+        boundary_geojson(zoom, precision, simplify)
     ).where(
         ProjectArea.project_id == project_id,
         ProjectArea.id == area_id
@@ -107,7 +162,10 @@ async def get_area(
         "min_cell_area_km2": row.min_cell_area_km2,
         "max_cell_area_km2": row.max_cell_area_km2,
         "num_resolutions": row.num_resolutions,
+        "num_virtual_resolutions": row.num_virtual_resolutions or 0,
+        "virtual_resolutions": row.virtual_resolutions or [],
         "grids_generated": row.grids_generated,
+        "is_project_boundary": bool(row.is_project_boundary),
         "created_at": row.created_at.isoformat() if row.created_at else None,
         "boundary_geom": json.loads(row.geojson) if row.geojson else None
     }
@@ -125,7 +183,8 @@ async def create_area(
         description=area.description,
         min_cell_area_km2=area.min_cell_area_km2,
         max_cell_area_km2=area.max_cell_area_km2,
-        num_resolutions=area.num_resolutions
+        num_resolutions=area.num_resolutions,
+        num_virtual_resolutions=area.num_virtual_resolutions
     )
     
     if area.boundary_geom:
@@ -133,6 +192,7 @@ async def create_area(
         new_area.boundary_geom = WKTElement(geom_shape.wkt, srid=4326)
     
     db.add(new_area)
+    await bump_project_version(db, area.project_id, "areas_version")
     await db.commit()
     await db.refresh(new_area)
     
@@ -168,9 +228,14 @@ async def update_area(
         area.max_cell_area_km2 = update.max_cell_area_km2
     if update.num_resolutions is not None:
         area.num_resolutions = update.num_resolutions
+    if update.num_virtual_resolutions is not None:
+        area.num_virtual_resolutions = update.num_virtual_resolutions
     if update.boundary_geom is not None:
         geom_shape = shape(update.boundary_geom)
         area.boundary_geom = WKTElement(geom_shape.wkt, srid=4326)
+        # Virtual levels are cut from the boundary, so its cached tiles are stale now
+        await bump_grid_version(db, project_id)
+    await bump_area_version(db, project_id, area_id)
     
     await db.commit()
     return {"message": "Alan başarıyla güncellendi"}
@@ -195,7 +260,8 @@ async def delete_area(
             ProjectArea.id == area_id
         )
     )
-    
+    await bump_grid_version(db, project_id)
+    await bump_project_version(db, project_id, "areas_version")
     await db.commit()
     return {"message": "Alan ve gridleri silindi"}
 
@@ -214,20 +280,17 @@ async def check_area_data(
     result = await db.execute(count_query)
     area_response_count = result.scalar() or 0
     
-    # Also check for responses linked to grid cells in this area
-    grid_cells_query = select(ProjectGridCell.h3_index).where(
-        ProjectGridCell.area_id == area_id
-    )
-    grid_result = await db.execute(grid_cells_query)
-    h3_indices = [row[0] for row in grid_result.all()]
-    
-    grid_response_count = 0
-    if h3_indices:
-        grid_count_query = select(func.count(StakeholderResponse.id)).where(
-            StakeholderResponse.h3_index.in_(h3_indices)
+    # Also check for responses linked to grid cells in this area: one primary-key probe per response
+    grid_count_query = text(f"""
+        SELECT count(*) FROM stakeholder_responses r
+        CROSS JOIN LATERAL (SELECT {h3_index_to_bigint_sql("r.h3_index")} AS h3) v
+        WHERE r.project_id = :project_id AND v.h3 IS NOT NULL AND EXISTS (
+            SELECT 1 FROM project_grid_cells c
+            WHERE c.area_id = :area_id AND c.resolution = (v.h3 >> {H3_RES_OFFSET}) & 15 AND c.h3 = v.h3
         )
-        grid_result = await db.execute(grid_count_query)
-        grid_response_count = grid_result.scalar() or 0
+    """)
+    grid_result = await db.execute(grid_count_query, {"project_id": project_id, "area_id": area_id})
+    grid_response_count = grid_result.scalar() or 0
     
     total_count = area_response_count + grid_response_count
     
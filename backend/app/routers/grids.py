@@ -1,19 +1,38 @@
 from sqlalchemy.dialects.postgresql import JSON, JSONB
-from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func, delete, insert, update, text
+from sqlalchemy import func, text
 from fastapi.responses import StreamingResponse
 import asyncio
-import math
-from app.database import get_db
+import os
+from app.database import get_db, AsyncSessionLocal
 from app.models.project import Project, ProjectGridCell, ProjectArea, StakeholderResponse
-from geoalchemy2.elements import WKTElement
-import h3
+from app.utils.geo import (
+    INCLUSION_RULES, H3_RES_OFFSET, cells_to_polygons, compact_cell_array
+)
+from app.utils.grid_workers import (
+    run_in_pool, polyfill_resolution, surviving_cells, GRID_GENERATION_MODE, GRID_INCLUSION_RULE, GENERATION_MODES
+)
+from app.utils.grid_store import (
+    dropped_cells_report, grid_scope, get_project_boundary_area, h3_index_to_bigint_sql, h3_to_int, h3_to_str,
+    H3_INDEX_SQL, PROJECT_CELLS_SQL
+)
+from app.utils.grid_jobs import enqueue_grid_job, stream_job_ndjson, job_to_dict, ActiveJobConflict
+from app.utils.grid_catalog import project_catalog, area_catalog, resolution_counts
+from app.utils.mvt_tiles import resolution_for_zoom, get_tile_bbox_4326
+from app.utils.versions import project_version, area_version, make_etag, etag_matches, etag_headers, not_modified
+from app.utils.compression import cached_stream_response
+from app.utils.geojson_output import output_precision
+from app.utils.virtual_grid import (
+    load_grid_areas, virtual_levels, virtual_resolution_entries, selection_cells as virtual_selection_cells
+)
 import json
-import time
+import numpy as np
+import shapely
+from shapely.geometry import mapping
 from uuid import UUID
-from typing import List, Optional
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/grids", tags=["grids"])
@@ -38,10 +57,9 @@ H3_RESOLUTION_AREAS_KM2 = {
     15: 0.000000895      # ~0.9 m²
 }
 
-# Zoom to H3 Resolution mapping
-ZOOM_TO_H3_RESOLUTION = {
-    5: 3, 6: 4, 7: 5, 8: 6, 9: 7, 10: 8, 11: 9, 12: 10, 13: 11, 14: 12
-}
+# Finest resolution areas may be generated at; grid jobs stream tile by tile, so this is a storage
+# limit rather than a memory one (13 = ~44 m² cells)
+MAX_GRID_RESOLUTION = int(os.getenv("GRID_MAX_RESOLUTION", "13"))
 
 
 def get_resolution_for_area_km2(area_km2: float) -> int:
@@ -58,11 +76,14 @@ def get_resolution_for_area_km2(area_km2: float) -> int:
     return best_res
 
 
-def calculate_resolution_range_km2(min_area_km2: float, max_area_km2: float, num_levels: int = 8) -> List[int]:
+def calculate_resolution_range_km2(
+    min_area_km2: float, max_area_km2: float, num_levels: int = 8, max_resolution: Optional[int] = None
+) -> List[int]:
     """
     Calculate H3 resolutions that produce evenly distributed cell areas
     between min and max areas (in km²).
     """
+    max_resolution = max_resolution if max_resolution is not None else MAX_GRID_RESOLUTION
     # Get resolutions for min and max areas
     min_res = get_resolution_for_area_km2(min_area_km2)  # Smallest area = highest res
     max_res = get_resolution_for_area_km2(max_area_km2)  # Largest area = lowest res
@@ -72,9 +93,8 @@ def calculate_resolution_range_km2(min_area_km2: float, max_area_km2: float, num
         min_res, max_res = max_res, min_res
     
     # Clamp to valid H3 range
-    # Capped at 11 (15m) to prevent generating millions of cells for large project areas
-    min_res = min(max(min_res, 3), 11)
-    max_res = min(max(max_res, 0), 11)
+    min_res = min(max(min_res, 3), max_resolution)
+    max_res = min(max(max_res, 0), max_resolution)
     
     # Generate evenly spaced resolutions
     available_range = min_res - max_res + 1
@@ -99,32 +119,45 @@ def calculate_resolution_range_km2(min_area_km2: float, max_area_km2: float, num
     return sorted(set(resolutions))
 
 
+def split_virtual_resolutions(
+    min_area_km2: float, max_area_km2: float, num_levels: int = 8, num_virtual: int = 0
+) -> Tuple[List[int], List[int]]:
+    """
+    (stored, virtual) resolutions of a grid configuration. The finest `num_virtual` levels are computed
+    on demand (see app.utils.virtual_grid) and, since they are never stored, may go beyond
+    MAX_GRID_RESOLUTION up to H3's finest level; at least one level is always stored.
+    """
+    if not num_virtual or num_virtual <= 0:
+        return calculate_resolution_range_km2(min_area_km2, max_area_km2, num_levels), []
+    resolutions = calculate_resolution_range_km2(min_area_km2, max_area_km2, num_levels, max_resolution=15)
+    split = max(len(resolutions) - num_virtual, 1)
+    stored = [res for res in resolutions[:split] if res <= MAX_GRID_RESOLUTION]
+    virtual = [res for res in resolutions if res not in stored]
+    if not stored:
+        stored, virtual = [MAX_GRID_RESOLUTION], [res for res in virtual if res != MAX_GRID_RESOLUTION]
+    return stored, virtual
+
+
+def area_resolutions(area: ProjectArea) -> Tuple[List[int], List[int]]:
+    """(stored, virtual) resolutions for an area's saved configuration"""
+    return split_virtual_resolutions(
+        area.min_cell_area_km2 or 0.0003,
+        area.max_cell_area_km2 or 5.0,
+        area.num_resolutions or 8,
+        area.num_virtual_resolutions or 0
+    )
+
+
 def get_resolution_for_zoom(zoom: int) -> int:
-    """Get appropriate H3 resolution for a given map zoom level"""
-    if zoom <= 5:
-        return 3
-    elif zoom >= 14:
-        return 11  # Capped at 11 (15m) to prevent OOM/database limits
-    return ZOOM_TO_H3_RESOLUTION.get(zoom, 8)
+    """Get appropriate H3 resolution for a given map zoom level; these endpoints only serve stored levels"""
+    return min(resolution_for_zoom(zoom), MAX_GRID_RESOLUTION)
 
 
-def generate_cells_for_resolution(geojson: dict, resolution: int) -> set:
-    """Generate H3 cells for a given geometry at specified resolution"""
-    cells = set()
-    try:
-        if geojson["type"] == "Polygon":
-            exterior = [(c[1], c[0]) for c in geojson["coordinates"][0]]
-            holes = [[(c[1], c[0]) for c in hole] for hole in geojson["coordinates"][1:]]
-            poly = h3.LatLngPoly(exterior, *holes)
-            cells = h3.polygon_to_cells(poly, resolution)
-        elif geojson["type"] == "MultiPolygon":
-            for poly_coords in geojson["coordinates"]:
-                ext = [(c[1], c[0]) for c in poly_coords[0]]
-                hls = [[(c[1], c[0]) for c in ring] for ring in poly_coords[1:]]
-                cells.update(h3.polygon_to_cells(h3.LatLngPoly(ext, *hls), resolution))
-    except Exception as e:
-        print(f"Error generating cells for resolution {resolution}: {e}")
-    return cells
+def validate_generation_options(mode: str, inclusion: str):
+    if mode not in GENERATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Geçersiz üretim modu: {mode}")
+    if inclusion not in INCLUSION_RULES:
+        raise HTTPException(status_code=400, detail=f"Geçersiz dahil etme kuralı: {inclusion}")
 
 
 def format_area_km2(area_km2: float) -> str:
@@ -137,6 +170,163 @@ def format_area_km2(area_km2: float) -> str:
         return f"{int(area_m2):,} m²"
 
 
+# ==================== PRE-FLIGHT ESTIMATES ====================
+
+# Approximate on-disk bytes per stored cell: heap row with its 4326 and 3857 polygons (~330), primary key entry (~45),
+# (resolution, h3) entry (~30), two GiST entries (~90)
+GRID_CELL_STORAGE_BYTES = 500
+# Levels estimated below this many cells are polyfilled for an exact count
+ESTIMATE_EXACT_LIMIT = 100_000
+# Generation throughput used until finished jobs provide a measured one
+DEFAULT_CELLS_PER_SECOND = float(os.getenv("GRID_ESTIMATE_CELLS_PER_SECOND", "40000"))
+# Default cells a project may hold across its areas; project.config["grid_cell_budget"] overrides it, 0 disables the check
+GRID_PROJECT_CELL_BUDGET = int(os.getenv("GRID_PROJECT_CELL_BUDGET", "5000000"))
+
+
+class GridEstimateRequest(BaseModel):
+    boundary_geom: dict
+    project_id: Optional[UUID] = None
+    min_cell_area_km2: float = 0.0003
+    max_cell_area_km2: float = 5.0
+    num_resolutions: int = 8
+    num_virtual_resolutions: int = 0
+
+
+async def measured_cells_per_second(db: AsyncSession) -> Optional[float]:
+    """Throughput of the last finished grid jobs, or None when there is not enough history"""
+    result = await db.execute(text("""
+        SELECT sum(cells_written), sum(EXTRACT(EPOCH FROM finished_at - started_at))
+        FROM (
+            SELECT cells_written, finished_at, started_at FROM grid_jobs
+            WHERE status = 'SUCCESS' AND cells_written > 0 AND started_at IS NOT NULL
+            ORDER BY finished_at DESC LIMIT 20
+        ) recent
+    """))
+    cells, seconds = result.one()
+    if not cells or not seconds or cells < 10_000:
+        return None
+    return float(cells) / float(seconds)
+
+
+async def estimate_grid(db: AsyncSession, geojson: dict, resolutions: List[int]) -> dict:
+    """
+    Cell count, storage and generation time per resolution for a boundary, without writing anything.
+    Counts come from the geodesic area divided by the mean cell area; small levels are polyfilled exactly.
+    """
+    area_result = await db.execute(select(
+        func.ST_Area(func.Geography(func.ST_SetSRID(func.ST_GeomFromGeoJSON(json.dumps(geojson)), 4326))) / 1_000_000
+    ))
+    area_km2 = float(area_result.scalar() or 0)
+
+    approx = {res: int(round(area_km2 / H3_RESOLUTION_AREAS_KM2[res])) for res in resolutions}
+    exact_levels = [res for res in resolutions if approx[res] <= ESTIMATE_EXACT_LIMIT]
+    exact_cells = await asyncio.gather(*(run_in_pool(polyfill_resolution, geojson, res) for res in exact_levels))
+    exact = {res: len(cells) for res, cells in zip(exact_levels, exact_cells)}
+
+    measured = await measured_cells_per_second(db)
+    cells_per_second = measured or DEFAULT_CELLS_PER_SECOND
+    levels = []
+    for res in resolutions:
+        cells = exact.get(res, approx[res])
+        levels.append({
+            "resolution": res,
+            "approx_area_km2": H3_RESOLUTION_AREAS_KM2[res],
+            "cells": cells,
+            "exact": res in exact,
+            "storage_bytes": cells * GRID_CELL_STORAGE_BYTES,
+            "seconds": round(cells / cells_per_second, 1)
+        })
+    total_cells = sum(level["cells"] for level in levels)
+    return {
+        "area_km2": round(area_km2, 4),
+        "area_display": format_area_km2(area_km2),
+        "resolutions": levels,
+        "total_cells": total_cells,
+        "total_storage_bytes": total_cells * GRID_CELL_STORAGE_BYTES,
+        "total_storage_mb": round(total_cells * GRID_CELL_STORAGE_BYTES / 1024 / 1024, 1),
+        "total_seconds": round(total_cells / cells_per_second, 1),
+        "cells_per_second": round(cells_per_second),
+        "throughput_source": "measured" if measured else "default"
+    }
+
+
+async def check_cell_budget(db: AsyncSession, project_id: UUID, area_id: Optional[UUID], estimated_cells: int) -> dict:
+    """Whether a project stays within its cell budget once `area_id` holds `estimated_cells` cells"""
+    result = await db.execute(select(Project.config).where(Project.id == project_id))
+    config = result.scalar() or {}
+    budget = int(config.get("grid_cell_budget", GRID_PROJECT_CELL_BUDGET))
+
+    # The area's own cells are replaced by the new grid, so only the other areas count
+    other_cells = sum(
+        entry.cell_count for entry in await project_catalog(db, project_id) if entry.area_id != area_id
+    )
+
+    projected = other_cells + estimated_cells
+    return {
+        "budget": budget,
+        "other_area_cells": other_cells,
+        "estimated_cells": estimated_cells,
+        "projected_cells": projected,
+        "within_budget": budget <= 0 or projected <= budget
+    }
+
+
+async def enforce_cell_budget(db: AsyncSession, project_id: UUID, area_id: UUID, geojson: dict, resolutions: List[int]):
+    estimate = await estimate_grid(db, geojson, resolutions)
+    budget = await check_cell_budget(db, project_id, area_id, estimate["total_cells"])
+    if not budget["within_budget"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tahmini {budget['estimated_cells']:,} hücre ile proje {budget['projected_cells']:,} hücreye ulaşır; "
+                   f"proje hücre bütçesi {budget['budget']:,}. En küçük grid alanını büyütün veya çözünürlük sayısını azaltın."
+        )
+
+
+@router.post("/estimate")
+async def estimate_grid_for_geometry(
+    request: GridEstimateRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Dry-run estimate for a boundary and configuration before the area is created"""
+    resolutions, virtual = split_virtual_resolutions(
+        request.min_cell_area_km2, request.max_cell_area_km2, request.num_resolutions, request.num_virtual_resolutions
+    )
+    estimate = await estimate_grid(db, request.boundary_geom, resolutions)
+    estimate["virtual_resolutions"] = virtual
+    if request.project_id:
+        estimate["budget"] = await check_cell_budget(db, request.project_id, None, estimate["total_cells"])
+    return estimate
+
+
+@router.get("/area/{area_id}/estimate")
+async def estimate_grid_for_area(
+    area_id: UUID,
+    min_cell_area_km2: Optional[float] = Query(None, description="Varsayılan: alanın ayarı"),
+    max_cell_area_km2: Optional[float] = Query(None, description="Varsayılan: alanın ayarı"),
+    num_resolutions: Optional[int] = Query(None, description="Varsayılan: alanın ayarı"),
+    num_virtual_resolutions: Optional[int] = Query(None, description="Varsayılan: alanın ayarı"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Dry-run estimate of an area's grid: cells, storage and generation time per resolution, plus the budget check"""
+    result = await db.execute(select(ProjectArea).where(ProjectArea.id == area_id))
+    area = result.scalar_one_or_none()
+    if not area or not area.boundary_geom:
+        raise HTTPException(status_code=404, detail="Alan veya sınır bulunamadı")
+
+    resolutions, virtual = split_virtual_resolutions(
+        min_cell_area_km2 or area.min_cell_area_km2 or 0.0003,
+        max_cell_area_km2 or area.max_cell_area_km2 or 5.0,
+        num_resolutions or area.num_resolutions or 8,
+        num_virtual_resolutions if num_virtual_resolutions is not None else (area.num_virtual_resolutions or 0)
+    )
+    geo_result = await db.execute(func.ST_AsGeoJSON(area.boundary_geom))
+    estimate = await estimate_grid(db, json.loads(geo_result.scalar_one()), resolutions)
+    estimate["area_id"] = str(area_id)
+    estimate["virtual_resolutions"] = virtual
+    estimate["budget"] = await check_cell_budget(db, area.project_id, area_id, estimate["total_cells"])
+    return estimate
+
+
 @router.get("/resolution-info")
 async def get_resolution_info():
     """Get H3 resolution to area mapping info (in km²)"""
@@ -164,11 +354,7 @@ async def check_project_grid_data(
     response_count = result.scalar() or 0
     
     # Also count total grid cells
-    grid_count_query = select(func.count(ProjectGridCell.id)).where(
-        ProjectGridCell.project_id == project_id
-    )
-    grid_result = await db.execute(grid_count_query)
-    grid_count = grid_result.scalar() or 0
+    grid_count = sum(resolution_counts(await project_catalog(db, project_id)).values())
     
     has_data = response_count > 0
     
@@ -179,14 +365,99 @@ async def check_project_grid_data(
         "warning_message": f"⚠️ DİKKAT: Bu proje için {response_count} adet grid bazlı veri girişi bulunmaktadır. Gridleri yeniden üretirseniz bu veriler silinecektir!" if has_data else None
     }
 
+# ==================== INCREMENTAL REGENERATION ====================
+
+@router.get("/area/{area_id}/regeneration-diff")
+async def get_area_regeneration_diff(
+    area_id: UUID,
+    mode: str = Query(GRID_GENERATION_MODE, description="polyfill veya hierarchical"),
+    inclusion: str = Query(GRID_INCLUSION_RULE, description="Hiyerarşik modda üst hücre kuralı: any, majority, centroid"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Dry run of an incremental regeneration: stored and new cell counts per resolution, and exactly which
+    cells holding stakeholder responses would be dropped. Nothing is written, and only the response cells
+    are checked against the boundary, so the request stays short however large the grid is.
+    """
+    validate_generation_options(mode, inclusion)
+    result = await db.execute(select(ProjectArea).where(ProjectArea.id == area_id))
+    area = result.scalar_one_or_none()
+    if not area or not area.boundary_geom:
+        raise HTTPException(status_code=404, detail="Alan veya sınır bulunamadı")
+
+    resolutions, _ = area_resolutions(area)
+    geo_result = await db.execute(func.ST_AsGeoJSON(area.boundary_geom))
+    geojson = json.loads(geo_result.scalar_one())
+
+    # Stored cells of this area that responses point at, with their response counts
+    result = await db.execute(text(f"""
+        SELECT c.h3, c.resolution, count(*) AS response_count
+        FROM stakeholder_responses r
+        JOIN project_grid_cells c
+          ON c.area_id = :area_id
+         AND c.resolution = ({h3_index_to_bigint_sql('r.h3_index')} >> {H3_RES_OFFSET}) & 15
+         AND c.h3 = {h3_index_to_bigint_sql('r.h3_index')}
+        WHERE r.project_id = :project_id
+        GROUP BY c.h3, c.resolution
+    """), {"area_id": area_id, "project_id": area.project_id})
+    response_cells = result.all()
+    kept = set(await run_in_pool(
+        surviving_cells, geojson, [(row.h3, row.resolution) for row in response_cells], resolutions, mode, inclusion
+    ))
+    dropped_by_res = {}
+    for row in response_cells:
+        if row.h3 not in kept:
+            dropped_by_res.setdefault(row.resolution, {})[h3_to_str(row.h3)] = row.response_count
+    dropped = []
+    for res in sorted(dropped_by_res):
+        dropped.extend(dropped_cells_report(dropped_by_res[res], res))
+
+    stored = resolution_counts(await area_catalog(db, area_id))
+    estimate = {level["resolution"]: level for level in (await estimate_grid(db, geojson, resolutions))["resolutions"]}
+    summary = [
+        {
+            "resolution": res,
+            "stored": stored.get(res, 0),
+            "new": estimate[res]["cells"] if res in estimate else 0,
+            "new_exact": estimate[res]["exact"] if res in estimate else True
+        }
+        for res in sorted(set(resolutions) | set(stored))
+    ]
+    return {
+        "area_id": str(area_id),
+        "resolutions": summary,
+        "dropped_response_cells": dropped,
+        "dropped_response_count": sum(d["response_count"] for d in dropped)
+    }
+
 # ==================== AREA-BASED GRID GENERATION ====================
 
+async def queue_grid_job(db: AsyncSession, project_id: UUID, area_id: UUID, params: dict):
+    """enqueue_grid_job, with a differently configured job already running on the grid answered as 409"""
+    try:
+        return await enqueue_grid_job(db, project_id, area_id, params)
+    except ActiveJobConflict as e:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Bu alan için farklı ayarlarla çalışan bir grid işi var ({e.job.id}); bitmesini bekleyin veya iptal edin"
+        )
+
+
 @router.post("/area/{area_id}/generate")
 async def generate_grids_for_area(
     area_id: UUID,
+    mode: str = Query(GRID_GENERATION_MODE, description="polyfill veya hierarchical"),
+    inclusion: str = Query(GRID_INCLUSION_RULE, description="Hiyerarşik modda üst hücre kuralı: any, majority, centroid"),
+    incremental: bool = Query(False, description="Sadece değişen hücreleri sil/ekle"),
+    stream: bool = Query(True, description="İlerlemeyi NDJSON olarak yayınla; false ise iş bilgisini hemen döndür"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Generate grids for a specific project area using its configuration"""
+    """
+    Queue grid generation for a specific project area using its configuration.
+    The work runs as a durable job (see app.utils.grid_jobs); the NDJSON stream only follows its progress,
+    so closing it does not stop generation. With incremental=true only changed cells are written.
+    """
+    validate_generation_options(mode, inclusion)
     
     # Fetch area with configuration
     result = await db.execute(select(ProjectArea).where(ProjectArea.id == area_id))
@@ -196,123 +467,255 @@ async def generate_grids_for_area(
 
     min_area_km2 = area.min_cell_area_km2 or 0.0003
     max_area_km2 = area.max_cell_area_km2 or 5.0
-    num_resolutions = area.num_resolutions or 8
 
-    resolutions_to_generate = calculate_resolution_range_km2(
-        min_area_km2, 
-        max_area_km2, 
-        num_resolutions
-    )
+    resolutions_to_generate, virtual_resolutions = area_resolutions(area)
+    geo_result = await db.execute(func.ST_AsGeoJSON(area.boundary_geom))
+    await enforce_cell_budget(db, area.project_id, area_id, json.loads(geo_result.scalar_one()), resolutions_to_generate)
 
-    async def generation_process():
-        # Get GeoJSON
-        geo_result = await db.execute(func.ST_AsGeoJSON(area.boundary_geom))
-        geojson_str = geo_result.scalar_one()
-        geojson = json.loads(geojson_str)
-        
-        yield json.dumps({
-            "status": "processing", 
-            "message": f"Geometri işleniyor: {geojson['type']}", 
-            "progress": 5,
-            "resolutions": resolutions_to_generate,
-            "min_area_km2": min_area_km2,
-            "max_area_km2": max_area_km2
-        }) + "\n"
-        
-        # Delete existing grids for this area only
-        await db.execute(delete(ProjectGridCell).where(ProjectGridCell.area_id == area_id))
-        await db.commit()
-        
-        yield json.dumps({"status": "processing", "message": "Bu alan için mevcut gridler temizlendi", "progress": 10}) + "\n"
-        
-        total_cells_saved = 0
-        
-        # Generate for each resolution
-        for idx, res in enumerate(resolutions_to_generate):
-            cells = generate_cells_for_resolution(geojson, res)
-            
-            if not cells:
+    job = await queue_grid_job(db, area.project_id, area_id, {
+        "resolutions": resolutions_to_generate,
+        "virtual_resolutions": virtual_resolutions,
+        "min_area_km2": min_area_km2,
+        "max_area_km2": max_area_km2,
+        "mode": mode,
+        "inclusion": inclusion,
+        "incremental": incremental
+    })
+    
+    if not stream:
+        return job_to_dict(job)
+    return StreamingResponse(stream_job_ndjson(job.id), media_type="application/x-ndjson")
+
+
+# ==================== GEOJSON STREAMING ====================
+
+# Rows fetched per round trip from the server-side cursor; memory per request stays at one chunk of features
+GRID_STREAM_CHUNK_ROWS = int(os.getenv("GRID_STREAM_CHUNK_ROWS", "5000"))
+
+
+def cell_feature(row) -> str:
+    return f'{{"type":"Feature","properties":{{"h3_index":"{row[0]}","resolution":{row[1]}}},"geometry":{row[2]}}}'
+
+
+def cell_feature_with_area(row) -> str:
+    area_id_val = f'"{row[3]}"' if row[3] else 'null'
+    return f'{{"type":"Feature","properties":{{"h3_index":"{row[0]}","resolution":{row[1]},"area_id":{area_id_val}}},"geometry":{row[2]}}}'
+
+
+async def stream_features(
+    query_text, params: dict, prefix: str, suffix, feature: Callable, limit: Optional[int] = None
+) -> AsyncIterator[str]:
+    """
+    JSON text of the query's features between prefix and suffix, read from a server-side cursor chunk by chunk.
+    With a limit the query fetches one row more than it; that row is not written, and suffix is then called
+    with whether the result was cut off. The stream runs in its own session since it outlives the request handler.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query_text, params)
+        yield prefix
+        separator = ""
+        seen = 0
+        async for rows in result.partitions(GRID_STREAM_CHUNK_ROWS):
+            seen += len(rows)
+            if limit is not None and seen > limit:
+                rows = rows[:len(rows) - (seen - limit)]
+            if rows:
+                yield separator + ",".join(feature(row) for row in rows)
+                separator = ","
+        yield suffix(limit is not None and seen > limit) if callable(suffix) else suffix
+
+
+# ==================== VIEWPORT QUERIES ====================
+
+# Most cells a by-zoom request returns at once; larger results are paged with offset
+GRID_QUERY_MAX_FEATURES = int(os.getenv("GRID_QUERY_MAX_FEATURES", "20000"))
+# Most cells an unpaged compact=true request may hold in memory while compacting
+GRID_COMPACT_MAX_CELLS = int(os.getenv("GRID_COMPACT_MAX_CELLS", "1000000"))
+
+
+def viewport_bbox(bbox: Optional[str], tiles: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    """
+    (min_lng, min_lat, max_lng, max_lat) of a "min_lng,min_lat,max_lng,max_lat" bbox, or of a tile range given
+    as "z/x/y" or "z/x_min-x_max/y_min-y_max"; None when neither is given
+    """
+    if bbox:
+        try:
+            min_lng, min_lat, max_lng, max_lat = (float(value) for value in bbox.split(","))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Geçersiz bbox: {bbox}")
+        if min_lng > max_lng or min_lat > max_lat:
+            raise HTTPException(status_code=400, detail=f"Geçersiz bbox: {bbox}")
+        return min_lng, min_lat, max_lng, max_lat
+    if tiles:
+        try:
+            z, xs, ys = tiles.split("/")
+            z = int(z)
+            x_min, _, x_max = xs.partition("-")
+            y_min, _, y_max = ys.partition("-")
+            x_min, y_min = int(x_min), int(y_min)
+            x_max, y_max = int(x_max or x_min), int(y_max or y_min)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Geçersiz karo aralığı: {tiles}")
+        if not (0 <= z <= 24 and 0 <= x_min <= x_max < 2 ** z and 0 <= y_min <= y_max < 2 ** z):
+            raise HTTPException(status_code=400, detail=f"Geçersiz karo aralığı: {tiles}")
+        west, _, _, north = get_tile_bbox_4326(z, x_min, y_min)
+        _, south, east, _ = get_tile_bbox_4326(z, x_max, y_max)
+        return west, south, east, north
+    return None
+
+
+def page_suffix(limit: int, offset: int) -> Callable[[bool], str]:
+    def suffix(truncated: bool) -> str:
+        next_offset = offset + limit if truncated else None
+        return f'],"truncated":{json.dumps(truncated)},"next_offset":{json.dumps(next_offset)}}}'
+    return suffix
+
+
+# ==================== COMPACT FORMATS ====================
+# format=h3 returns cell indexes instead of polygons; a hexagon is fully determined by its index, so clients
+# rebuild it with h3-js cellToBoundary. format=binary returns the same indexes as packed little-endian uint64.
+
+GRID_FORMAT_PATTERN = "^(geojson|h3|binary)$"
+
+# Selected instead of the GeoJSON columns for the compact formats; no geometry is read or serialized
+CELL_INDEX_COLUMNS = "h3, CAST(area_id AS TEXT) AS area_id, resolution"
+
+
+def empty_cells_response(grid_format: str, meta: dict, etag: str):
+    if grid_format == "binary":
+        return Response(content=b"", media_type="application/octet-stream", headers=etag_headers(etag))
+    return {**meta, "format": grid_format, "cells": []}
+
+
+async def stream_cells(
+    query_text, params: dict, prefix: str, grid_format: str, compact: bool,
+    limit: Optional[int] = None, offset: int = 0, page: Optional[dict] = None
+) -> AsyncIterator:
+    """
+    Cell indexes of the query's (h3, area_id, resolution) rows. The h3 format writes them as hex strings followed by the
+    areas they belong to, as runs of {"area_id", "count"} in cell order. Compacting needs every cell of an
+    area and resolution at once (compact_cells rejects a set mixing a cell with its own children, and areas
+    must stay apart), so compacted responses are only written once the cursor is exhausted; callers keep
+    compacted scopes small with check_compact_scope or a limit. With a limit, `page` receives
+    "truncated" and "next_offset" once the cursor is done, for bodies without an envelope.
+    """
+    binary = grid_format == "binary"
+    area_runs = []
+    pending = {}
+    separator = ""
+    seen = 0
+
+    def encode(cells, area_id):
+        nonlocal separator
+        if binary:
+            return np.asarray(cells, dtype="<u8").tobytes()
+        if area_runs and area_runs[-1]["area_id"] == area_id:
+            area_runs[-1]["count"] += len(cells)
+        else:
+            area_runs.append({"area_id": area_id, "count": len(cells)})
+        chunk = separator + ",".join(f'"{h3_to_str(int(cell))}"' for cell in cells)
+        separator = ","
+        return chunk
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query_text, params)
+        if not binary:
+            yield prefix
+        async for rows in result.partitions(GRID_STREAM_CHUNK_ROWS):
+            seen += len(rows)
+            if limit is not None and seen > limit:
+                rows = rows[:len(rows) - (seen - limit)]
+            if compact:
+                for cell, area_id, resolution in rows:
+                    pending.setdefault((area_id, resolution), []).append(cell)
                 continue
-            
-            res_area = H3_RESOLUTION_AREAS_KM2.get(res, 0)
-            progress_base = 10 + int(((idx + 1) / len(resolutions_to_generate)) * 80)
-            yield json.dumps({
-                "status": "processing", 
-                "message": f"Çözünürlük {res} ({format_area_km2(res_area)}): {len(cells)} hücre", 
-                "progress": progress_base
-            }) + "\n"
-            
-            # Save cells in batches
-            batch_size = 2000 # Increased batch size for performance
-            cell_list = list(cells)
-            
-            # Track when to yield progress to prevent overwhelming the stream/timeout
-            last_yield_time = time.time()
-            yield_count = 0
-            
-            for i in range(0, len(cell_list), batch_size):
-                batch = cell_list[i:i+batch_size]
-                cell_objects = []
-                
-                for cell in batch:
-                    if hasattr(h3, 'cell_to_boundary'):
-                        boundary = h3.cell_to_boundary(cell)
-                    else:
-                        boundary = h3.h3_to_geo_boundary(cell)
-                    
-                    polygon_coords = [[b[1], b[0]] for b in boundary]
-                    if polygon_coords[0] != polygon_coords[-1]:
-                        polygon_coords.append(polygon_coords[0])
-                    
-                    wkt = f"POLYGON(({','.join([f'{c[0]} {c[1]}' for c in polygon_coords])}))"
-                    cell_objects.append({
-                        "project_id": area.project_id,
-                        "area_id": area_id,
-                        "h3_index": cell,
-                        "resolution": res,
-                        "geometry": WKTElement(wkt, srid=4326)
-                    })
-                
-                await db.execute(insert(ProjectGridCell), cell_objects)
-                await db.commit()
-                total_cells_saved += len(batch)
-                yield_count += len(batch)
-
-                # Yield progress every 5000 cells or every 5 seconds to keep connection alive
-                if yield_count >= 5000 or (time.time() - last_yield_time) > 5:
-                    yield json.dumps({
-                        "status": "processing", 
-                        "message": f"Çözünürlük {res}: {total_cells_saved} hücre yüklendi...", 
-                        "progress": progress_base
-                    }) + "\n"
-                    last_yield_time = time.time()
-                    yield_count = 0
-        
-        # Mark area as having grids generated
-        await db.execute(
-            update(ProjectArea).where(ProjectArea.id == area_id).values(grids_generated=True)
+            # Split the chunk at area changes so runs stay exact
+            start = 0
+            for i in range(1, len(rows) + 1):
+                if i == len(rows) or (not binary and rows[i][1] != rows[start][1]):
+                    if i > start:
+                        yield encode([row[0] for row in rows[start:i]], rows[start][1])
+                    start = i
+        compacted = {}
+        for (area_id, _), cells in pending.items():
+            compacted.setdefault(area_id, []).append(await run_in_pool(compact_cell_array, cells))
+        for area_id, parts in compacted.items():
+            # A compacted finer level can rebuild cells the area also stores at the coarser one
+            yield encode(np.unique(np.concatenate(parts)), area_id)
+
+    truncated = limit is not None and seen > limit
+    next_offset = offset + limit if truncated else None
+    if page is not None:
+        page.update(truncated=truncated, next_offset=next_offset)
+    if not binary:
+        suffix = f'],"areas":{json.dumps(area_runs)}'
+        if limit is not None:
+            suffix += f',"truncated":{json.dumps(truncated)},"next_offset":{json.dumps(next_offset)}'
+        yield suffix + "}"
+
+
+def check_compact_scope(counts: Dict[int, int], resolution: Optional[int] = None):
+    """Compacting holds the whole scope in memory, so unpaged scopes are capped at GRID_COMPACT_MAX_CELLS"""
+    total = counts.get(resolution, 0) if resolution is not None else sum(counts.values())
+    if total > GRID_COMPACT_MAX_CELLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"compact en fazla {GRID_COMPACT_MAX_CELLS:,} hücre için kullanılabilir, bu kapsamda {total:,} hücre var; "
+                   f"çözünürlük veya alan seçin ya da by-zoom sayfalarını kullanın"
         )
-        await db.commit()
-        
-        yield json.dumps({
-            "status": "success", 
-            "message": f"{len(resolutions_to_generate)} çözünürlük için toplam {total_cells_saved} hücre oluşturuldu", 
-            "count": total_cells_saved,
-            "resolutions_created": resolutions_to_generate,
-            "progress": 100
-        }) + "\n"
 
-    return StreamingResponse(generation_process(), media_type="application/x-ndjson")
+
+async def cells_response(
+    request: Request, query_text, params: dict, meta: dict, grid_format: str, compact: bool, etag: str,
+    limit: Optional[int] = None, offset: int = 0
+) -> Response:
+    """
+    Streaming response for format=h3 or binary. Binary bodies carry no envelope: the resolution travels in
+    X-Grid-Resolution, and pages in X-Grid-Truncated / X-Grid-Next-Offset. Pages are at most `limit` cells,
+    so they are read in full before answering, which lets those headers go out first.
+    """
+    if grid_format == "binary":
+        headers = {**etag_headers(etag), "X-Grid-Compacted": json.dumps(compact)}
+        if meta.get("resolution") is not None:
+            headers["X-Grid-Resolution"] = str(meta["resolution"])
+        if limit is not None:
+            page = {}
+            body = b"".join([
+                chunk async for chunk in stream_cells(query_text, params, "", grid_format, compact, limit, offset, page)
+            ])
+            headers["X-Grid-Truncated"] = json.dumps(page["truncated"])
+            if page["next_offset"] is not None:
+                headers["X-Grid-Next-Offset"] = str(page["next_offset"])
+            return Response(content=body, media_type="application/octet-stream", headers=headers)
+        return cached_stream_response(
+            request, etag, stream_cells(query_text, params, "", grid_format, compact, limit, offset),
+            "application/octet-stream", headers
+        )
+    # The envelope is the metadata object left open for the cell list
+    prefix = json.dumps({**meta, "format": grid_format, "compacted": compact})[:-1] + ',"cells":['
+    return cached_stream_response(
+        request, etag, stream_cells(query_text, params, prefix, grid_format, compact, limit, offset),
+        "application/json", etag_headers(etag)
+    )
 
 
 @router.get("/area/{area_id}")
 async def get_grids_for_area(
     area_id: UUID,
+    request: Request,
     resolution: Optional[int] = Query(None),
+    zoom: Optional[float] = Query(None, ge=0, le=24, description="Hücrelerin çizileceği zoom; hassasiyet buna göre seçilir"),
+    precision: Optional[int] = Query(None, ge=0, le=15, description="GeoJSON koordinat ondalık basamağı"),
+    grid_format: str = Query("geojson", alias="format", pattern=GRID_FORMAT_PATTERN, description="geojson, h3 veya binary"),
+    compact: bool = Query(False, description="h3/binary: tam kardeş gruplarını üst hücreyle değiştir"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get grids for a specific area, optionally filtered by resolution"""
-    # Use raw SQL to fetch rows and build JSON string manually for maximum performance/stability
+    """Get grids for a specific area, optionally filtered by resolution, as GeoJSON or bare cell indexes"""
+    etag = make_etag("grids-for-area", area_id, await area_version(db, area_id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    # Use raw SQL and build the JSON text manually, streamed from a server-side cursor
     where_clauses = ["area_id = CAST(:area_id AS UUID)"]
     params = {"area_id": str(area_id)}
     if resolution is not None:
@@ -320,86 +723,120 @@ async def get_grids_for_area(
         params["resolution"] = resolution
     
     where_stmt = " AND ".join(where_clauses)
+    if grid_format != "geojson":
+        if compact:
+            check_compact_scope(resolution_counts(await area_catalog(db, area_id)), resolution)
+        query_text = text(f"SELECT {CELL_INDEX_COLUMNS} FROM project_grid_cells WHERE {where_stmt}")
+        return await cells_response(request, query_text, params, {"area_id": str(area_id)}, grid_format, compact, etag)
+
+    params["precision"] = output_precision(zoom, precision)
     query_text = text(f"""
-        SELECT h3_index, resolution, ST_AsGeoJSON(geometry) as geojson
+        SELECT {H3_INDEX_SQL}, resolution, ST_AsGeoJSON(geometry, :precision) as geojson
         FROM project_grid_cells
         WHERE {where_stmt}
     """)
     
-    result = await db.execute(query_text, params)
-    rows = result.all()
-    
-    features_list = []
-    for row in rows:
-        f = f'{{"type":"Feature","properties":{{"h3_index":"{row[0]}","resolution":{row[1]}}},"geometry":{row[2]}}}'
-        features_list.append(f)
-    
-    response_json = f'{{"type":"FeatureCollection","area_id":"{area_id}","features":[{",".join(features_list)}]}}'
-    return Response(content=response_json, media_type="application/json")
+    prefix = f'{{"type":"FeatureCollection","area_id":"{area_id}","features":['
+    return cached_stream_response(
+        request, etag,
+        stream_features(query_text, params, prefix, "]}", cell_feature),
+        "application/json",
+        etag_headers(etag)
+    )
 
 
 @router.get("/area/{area_id}/by-zoom")
 async def get_area_grids_by_zoom(
     area_id: UUID, 
+    request: Request,
+    response: Response,
     zoom: int = Query(10),
+    bbox: Optional[str] = Query(None, description="Görünür alan: min_lng,min_lat,max_lng,max_lat"),
+    tiles: Optional[str] = Query(None, description="Görünür karolar: z/x/y veya z/x_min-x_max/y_min-y_max"),
+    limit: int = Query(GRID_QUERY_MAX_FEATURES, ge=1, le=GRID_QUERY_MAX_FEATURES),
+    offset: int = Query(0, ge=0),
+    precision: Optional[int] = Query(None, ge=0, le=15, description="GeoJSON koordinat ondalık basamağı"),
+    grid_format: str = Query("geojson", alias="format", pattern=GRID_FORMAT_PATTERN, description="geojson, h3 veya binary"),
+    compact: bool = Query(False, description="h3/binary: tam kardeş gruplarını üst hücreyle değiştir"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get grids for an area appropriate for a given map zoom level"""
+    """
+    Get grids for an area appropriate for a given map zoom level, limited to a viewport when bbox or tiles
+    is given. At most `limit` cells are returned; "truncated" and "next_offset" tell whether more follow.
+    """
+    etag = make_etag("area-grids-by-zoom", area_id, await area_version(db, area_id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+
     # Get available resolutions for this area
-    available_query = select(ProjectGridCell.resolution).where(
-        ProjectGridCell.area_id == area_id
-    ).distinct()
-    available_result = await db.execute(available_query)
-    available_resolutions = [row[0] for row in available_result.all()]
+    available_resolutions = list(resolution_counts(await area_catalog(db, area_id)))
     
     if not available_resolutions:
+        if grid_format != "geojson":
+            return empty_cells_response(grid_format, {"resolution": None, "zoom": zoom}, etag)
         return {"resolution": None, "zoom": zoom, "features": []}
     
     target_res = get_resolution_for_zoom(zoom)
     best_res = min(available_resolutions, key=lambda x: abs(x - target_res))
     
-    # Use raw SQL to fetch rows
-    query_text = text("""
-        SELECT h3_index, resolution, ST_AsGeoJSON(geometry) as geojson
+    # Use raw SQL to fetch rows; the viewport filter uses the GiST index on geometry
+    where_clauses = ["area_id = CAST(:area_id AS UUID)", "resolution = CAST(:best_res AS INT)"]
+    params = {"area_id": str(area_id), "best_res": best_res, "limit": limit + 1, "offset": offset}
+    viewport = viewport_bbox(bbox, tiles)
+    if viewport:
+        where_clauses.append("geometry && ST_MakeEnvelope(:min_lng, :min_lat, :max_lng, :max_lat, 4326)")
+        params.update(zip(("min_lng", "min_lat", "max_lng", "max_lat"), viewport))
+
+    where_stmt = " AND ".join(where_clauses)
+    if grid_format != "geojson":
+        query_text = text(f"""
+            SELECT {CELL_INDEX_COLUMNS} FROM project_grid_cells
+            WHERE {where_stmt} ORDER BY h3 LIMIT :limit OFFSET :offset
+        """)
+        meta = {"resolution": best_res, "zoom": zoom, "available_resolutions": sorted(available_resolutions)}
+        return await cells_response(request, query_text, params, meta, grid_format, compact, etag, limit, offset)
+
+    # Coordinates only as fine as the zoom resolves
+    params["precision"] = output_precision(zoom, precision)
+    query_text = text(f"""
+        SELECT {H3_INDEX_SQL}, resolution, ST_AsGeoJSON(geometry, :precision) as geojson
         FROM project_grid_cells
-        WHERE area_id = CAST(:area_id AS UUID) AND resolution = CAST(:best_res AS INT)
+        WHERE {where_stmt}
+        ORDER BY h3
+        LIMIT :limit OFFSET :offset
     """)
     
-    result = await db.execute(query_text, {"area_id": str(area_id), "best_res": best_res})
-    rows = result.all()
-    
-    features_list = []
-    for row in rows:
-        f = f'{{"type":"Feature","properties":{{"h3_index":"{row[0]}","resolution":{row[1]}}},"geometry":{row[2]}}}'
-        features_list.append(f)
-    
-    response_json = f'{{"resolution":{best_res},"zoom":{zoom},"available_resolutions":{json.dumps(sorted(available_resolutions))},"type":"FeatureCollection","features":[{",".join(features_list)}]}}'
-    return Response(content=response_json, media_type="application/json")
+    prefix = f'{{"resolution":{best_res},"zoom":{zoom},"available_resolutions":{json.dumps(sorted(available_resolutions))},"type":"FeatureCollection","features":['
+    return cached_stream_response(
+        request, etag,
+        stream_features(query_text, params, prefix, page_suffix(limit, offset), cell_feature, limit),
+        "application/json",
+        etag_headers(etag)
+    )
 
 
 @router.get("/area/{area_id}/resolutions")
 async def get_area_resolutions(
     area_id: UUID,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db)
 ):
     """Get list of available resolutions for an area"""
-    query = select(
-        ProjectGridCell.resolution,
-        func.count(ProjectGridCell.id).label("count")
-    ).where(
-        ProjectGridCell.area_id == area_id
-    ).group_by(ProjectGridCell.resolution).order_by(ProjectGridCell.resolution)
-    
-    result = await db.execute(query)
-    rows = result.all()
+    etag = make_etag("area-resolutions", area_id, await area_version(db, area_id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+    counts = resolution_counts(await area_catalog(db, area_id))
     
     return [
         {
-            "resolution": row.resolution, 
-            "count": row.count,
-            "approx_area_km2": H3_RESOLUTION_AREAS_KM2.get(row.resolution, 0)
-        } for row in rows
-    ]
+            "resolution": resolution, 
+            "count": count,
+            "approx_area_km2": H3_RESOLUTION_AREAS_KM2.get(resolution, 0)
+        } for resolution, count in counts.items()
+    ] + virtual_resolution_entries(await load_grid_areas(db, None, area_id), H3_RESOLUTION_AREAS_KM2)
 
 
 # ==================== LEGACY PROJECT-BASED ENDPOINTS (for backward compatibility) ====================
@@ -410,9 +847,14 @@ async def generate_all_grids(
     min_cell_area_km2: float = Query(0.0003, description="En küçük grid alanı (km²)"),
     max_cell_area_km2: float = Query(5.0, description="En büyük grid alanı (km²)"),
     num_resolutions: int = Query(8, description="Çözünürlük sayısı"),
+    num_virtual_resolutions: int = Query(0, description="Saklanmayıp istek anında üretilecek en ince çözünürlük sayısı"),
+    mode: str = Query(GRID_GENERATION_MODE, description="polyfill veya hierarchical"),
+    inclusion: str = Query(GRID_INCLUSION_RULE, description="Hiyerarşik modda üst hücre kuralı: any, majority, centroid"),
+    stream: bool = Query(True, description="İlerlemeyi NDJSON olarak yayınla; false ise iş bilgisini hemen döndür"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Generate grids for project's main boundary (legacy - use area-based generation for new projects)"""
+    """Queue grid generation for project's main boundary (legacy - use area-based generation for new projects)"""
+    validate_generation_options(mode, inclusion)
     
     # Fetch project with geometry
     result = await db.execute(select(Project).where(Project.id == project_id))
@@ -420,102 +862,57 @@ async def generate_all_grids(
     if not project or not project.boundary_geom:
         raise HTTPException(status_code=404, detail="Project or boundary not found")
 
-    resolutions_to_generate = calculate_resolution_range_km2(
+    resolutions_to_generate, virtual_resolutions = split_virtual_resolutions(
         min_cell_area_km2, 
         max_cell_area_km2, 
-        num_resolutions
+        num_resolutions,
+        num_virtual_resolutions
     )
 
-    async def generation_process():
-        geo_result = await db.execute(func.ST_AsGeoJSON(project.boundary_geom))
-        geojson_str = geo_result.scalar_one()
-        geojson = json.loads(geojson_str)
-        
-        yield json.dumps({
-            "status": "processing", 
-            "message": f"Geometri işleniyor: {geojson['type']}", 
-            "progress": 5,
-            "resolutions": resolutions_to_generate
-        }) + "\n"
-        
-        # Delete existing grids for this project (only those without area_id)
-        await db.execute(
-            delete(ProjectGridCell).where(
-                ProjectGridCell.project_id == project_id,
-                ProjectGridCell.area_id == None
-            )
-        )
-        await db.commit()
-        
-        yield json.dumps({"status": "processing", "message": "Mevcut gridler temizlendi", "progress": 10}) + "\n"
-        
-        total_cells_saved = 0
-        
-        for idx, res in enumerate(resolutions_to_generate):
-            cells = generate_cells_for_resolution(geojson, res)
-            
-            if not cells:
-                continue
-            
-            res_area = H3_RESOLUTION_AREAS_KM2.get(res, 0)
-            progress_base = 10 + int(((idx + 1) / len(resolutions_to_generate)) * 80)
-            yield json.dumps({
-                "status": "processing", 
-                "message": f"Çözünürlük {res} ({format_area_km2(res_area)}): {len(cells)} hücre", 
-                "progress": progress_base
-            }) + "\n"
-            
-            batch_size = 500
-            cell_list = list(cells)
-            
-            for i in range(0, len(cell_list), batch_size):
-                batch = cell_list[i:i+batch_size]
-                cell_objects = []
-                
-                for cell in batch:
-                    if hasattr(h3, 'cell_to_boundary'):
-                        boundary = h3.cell_to_boundary(cell)
-                    else:
-                        boundary = h3.h3_to_geo_boundary(cell)
-                    
-                    polygon_coords = [[b[1], b[0]] for b in boundary]
-                    if polygon_coords[0] != polygon_coords[-1]:
-                        polygon_coords.append(polygon_coords[0])
-                    
-                    wkt = f"POLYGON(({','.join([f'{c[0]} {c[1]}' for c in polygon_coords])}))"
-                    cell_objects.append({
-                        "project_id": project_id,
-                        "area_id": None,
-                        "h3_index": cell,
-                        "resolution": res,
-                        "geometry": WKTElement(wkt, srid=4326)
-                    })
-                
-                await db.execute(insert(ProjectGridCell), cell_objects)
-                await db.commit()
-                total_cells_saved += len(batch)
-        
-        yield json.dumps({
-            "status": "success", 
-            "message": f"{len(resolutions_to_generate)} çözünürlük için toplam {total_cells_saved} hücre oluşturuldu", 
-            "count": total_cells_saved,
-            "resolutions_created": resolutions_to_generate,
-            "progress": 100
-        }) + "\n"
+    # The project boundary grid lives in its own area so every cell is keyed by (area_id, resolution, h3);
+    # it is only flushed here, so a request refused by the cell budget or a running job leaves no area behind
+    area = await get_project_boundary_area(
+        db, project, min_cell_area_km2, max_cell_area_km2, num_resolutions, num_virtual_resolutions
+    )
+    geo_result = await db.execute(func.ST_AsGeoJSON(area.boundary_geom))
+    await enforce_cell_budget(db, project_id, area.id, json.loads(geo_result.scalar_one()), resolutions_to_generate)
 
-    return StreamingResponse(generation_process(), media_type="application/x-ndjson")
+    job = await queue_grid_job(db, project_id, area.id, {
+        "resolutions": resolutions_to_generate,
+        "virtual_resolutions": virtual_resolutions,
+        "min_area_km2": min_cell_area_km2,
+        "max_area_km2": max_cell_area_km2,
+        "mode": mode,
+        "inclusion": inclusion,
+        "incremental": False
+    })
+    # An identical job already queued is returned without a commit; the synced area is kept all the same
+    await db.commit()
+    
+    if not stream:
+        return job_to_dict(job)
+    return StreamingResponse(stream_job_ndjson(job.id), media_type="application/x-ndjson")
 
 
 @router.get("/{project_id}", response_model=List[dict])
 async def get_project_grids(
     project_id: UUID, 
+    request: Request,
     resolution: int = Query(None, description="Filter by resolution"),
     area_id: Optional[UUID] = Query(None, description="Filter by area"),
+    zoom: Optional[float] = Query(None, ge=0, le=24, description="Hücrelerin çizileceği zoom; hassasiyet buna göre seçilir"),
+    precision: Optional[int] = Query(None, ge=0, le=15, description="GeoJSON koordinat ondalık basamağı"),
+    grid_format: str = Query("geojson", alias="format", pattern=GRID_FORMAT_PATTERN, description="geojson, h3 veya binary"),
+    compact: bool = Query(False, description="h3/binary: tam kardeş gruplarını üst hücreyle değiştir"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get grids for a project, optionally filtered by resolution and area"""
-    # Use raw SQL to fetch rows and build JSON string manually for maximum performance/stability
-    where_clauses = ["project_id = CAST(:project_id AS UUID)"]
+    """Get grids for a project, optionally filtered by resolution and area, as GeoJSON or bare cell indexes"""
+    etag = make_etag("project-grids", project_id, await project_version(db, project_id, "grid_version"))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    # Use raw SQL and build the JSON text manually, streamed from a server-side cursor
+    where_clauses = [PROJECT_CELLS_SQL]
     params = {"project_id": str(project_id)}
     if resolution is not None:
         where_clauses.append("resolution = CAST(:resolution AS INT)")
@@ -525,108 +922,132 @@ async def get_project_grids(
         params["area_id"] = str(area_id)
         
     where_stmt = " AND ".join(where_clauses)
+    if grid_format != "geojson":
+        if compact:
+            check_compact_scope(resolution_counts(await project_catalog(db, project_id), area_id), resolution)
+        # Grouped by area so the area runs stay short
+        query_text = text(f"SELECT {CELL_INDEX_COLUMNS} FROM project_grid_cells WHERE {where_stmt} ORDER BY area_id")
+        return await cells_response(request, query_text, params, {"project_id": str(project_id)}, grid_format, compact, etag)
+
+    params["precision"] = output_precision(zoom, precision)
     query_text = text(f"""
-        SELECT h3_index, resolution, ST_AsGeoJSON(geometry) as geojson, area_id
+        SELECT {H3_INDEX_SQL}, resolution, ST_AsGeoJSON(geometry, :precision) as geojson, area_id
         FROM project_grid_cells
         WHERE {where_stmt}
     """)
     
-    result = await db.execute(query_text, params)
-    rows = result.all()
-    
-    features_list = []
-    for row in rows:
-        area_id_val = f'"{row[3]}"' if row[3] else 'null'
-        f = f'{{"type":"Feature","properties":{{"h3_index":"{row[0]}","resolution":{row[1]},"area_id":{area_id_val}}},"geometry":{row[2]}}}'
-        features_list.append(f)
-    
-    response_json = f'[{",".join(features_list)}]'
-    return Response(content=response_json, media_type="application/json")
+    return cached_stream_response(
+        request, etag,
+        stream_features(query_text, params, "[", "]", cell_feature_with_area),
+        "application/json",
+        etag_headers(etag)
+    )
 
 
 @router.get("/{project_id}/by-zoom")
 async def get_grids_by_zoom(
     project_id: UUID, 
+    request: Request,
+    response: Response,
     zoom: int = Query(10),
     area_id: Optional[UUID] = Query(None),
+    bbox: Optional[str] = Query(None, description="Görünür alan: min_lng,min_lat,max_lng,max_lat"),
+    tiles: Optional[str] = Query(None, description="Görünür karolar: z/x/y veya z/x_min-x_max/y_min-y_max"),
+    limit: int = Query(GRID_QUERY_MAX_FEATURES, ge=1, le=GRID_QUERY_MAX_FEATURES),
+    offset: int = Query(0, ge=0),
+    precision: Optional[int] = Query(None, ge=0, le=15, description="GeoJSON koordinat ondalık basamağı"),
+    grid_format: str = Query("geojson", alias="format", pattern=GRID_FORMAT_PATTERN, description="geojson, h3 veya binary"),
+    compact: bool = Query(False, description="h3/binary: tam kardeş gruplarını üst hücreyle değiştir"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get grids appropriate for a given map zoom level"""
-    # Build base filter
-    base_filter = ProjectGridCell.project_id == project_id
-    if area_id:
-        base_filter = ProjectGridCell.area_id == area_id
-    
+    """
+    Get grids appropriate for a given map zoom level, limited to a viewport when bbox or tiles is given.
+    At most `limit` cells are returned; "truncated" and "next_offset" tell whether more follow.
+    """
+    etag = make_etag("grids-by-zoom", project_id, await project_version(db, project_id, "grid_version"))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+
     # Get available resolutions
-    available_query = select(ProjectGridCell.resolution).where(base_filter).distinct()
-    available_result = await db.execute(available_query)
-    available_resolutions = [row[0] for row in available_result.all()]
+    available_resolutions = list(resolution_counts(await project_catalog(db, project_id), area_id))
     
     if not available_resolutions:
+        if grid_format != "geojson":
+            return empty_cells_response(grid_format, {"resolution": None, "zoom": zoom}, etag)
         return {"resolution": None, "zoom": zoom, "features": []}
     
     target_res = get_resolution_for_zoom(zoom)
     best_res = min(available_resolutions, key=lambda x: abs(x - target_res))
     
     # Build base filter for raw SQL
-    where_clauses = ["project_id = CAST(:project_id AS UUID)"]
+    where_clauses = [PROJECT_CELLS_SQL]
     params = {
         "project_id": str(project_id), 
         "best_res": best_res,
-        "zoom": zoom
+        "limit": limit + 1,
+        "offset": offset
     }
     if area_id:
         where_clauses.append("area_id = CAST(:area_id AS UUID)")
         params["area_id"] = str(area_id)
+    viewport = viewport_bbox(bbox, tiles)
+    if viewport:
+        # Served by the GiST index on geometry
+        where_clauses.append("geometry && ST_MakeEnvelope(:min_lng, :min_lat, :max_lng, :max_lat, 4326)")
+        params.update(zip(("min_lng", "min_lat", "max_lng", "max_lat"), viewport))
     
     where_stmt = " AND ".join(where_clauses)
+    if grid_format != "geojson":
+        query_text = text(f"""
+            SELECT {CELL_INDEX_COLUMNS} FROM project_grid_cells
+            WHERE {where_stmt} AND resolution = CAST(:best_res AS INT)
+            ORDER BY area_id, h3 LIMIT :limit OFFSET :offset
+        """)
+        meta = {"resolution": best_res, "zoom": zoom, "available_resolutions": sorted(available_resolutions)}
+        return await cells_response(request, query_text, params, meta, grid_format, compact, etag, limit, offset)
     
+    # Coordinates only as fine as the zoom resolves
+    params["precision"] = output_precision(zoom, precision)
     query_text = text(f"""
-        SELECT h3_index, resolution, ST_AsGeoJSON(geometry) as geojson, area_id
+        SELECT {H3_INDEX_SQL}, resolution, ST_AsGeoJSON(geometry, :precision) as geojson, area_id
         FROM project_grid_cells
         WHERE {where_stmt} AND resolution = CAST(:best_res AS INT)
+        ORDER BY area_id, h3
+        LIMIT :limit OFFSET :offset
     """)
     
-    result = await db.execute(query_text, params)
-    rows = result.all()
-    
-    features_list = []
-    for row in rows:
-        area_id_val = f'"{row[3]}"' if row[3] else 'null'
-        f = f'{{"type":"Feature","properties":{{"h3_index":"{row[0]}","resolution":{row[1]},"area_id":{area_id_val}}},"geometry":{row[2]}}}'
-        features_list.append(f)
-    
-    response_json = f'{{"resolution":{best_res},"zoom":{zoom},"available_resolutions":{json.dumps(sorted(available_resolutions))},"type":"FeatureCollection","features":[{",".join(features_list)}]}}'
-    return Response(content=response_json, media_type="application/json")
+    prefix = f'{{"resolution":{best_res},"zoom":{zoom},"available_resolutions":{json.dumps(sorted(available_resolutions))},"type":"FeatureCollection","features":['
+    return cached_stream_response(
+        request, etag,
+        stream_features(query_text, params, prefix, page_suffix(limit, offset), cell_feature_with_area, limit),
+        "application/json",
+        etag_headers(etag)
+    )
 
 
 @router.get("/{project_id}/resolutions")
 async def get_available_resolutions(
     project_id: UUID,
+    request: Request,
+    response: Response,
     area_id: Optional[UUID] = Query(None),
     db: AsyncSession = Depends(get_db)
 ):
     """Get list of available resolutions for a project"""
-    query = select(
-        ProjectGridCell.resolution,
-        func.count(ProjectGridCell.id).label("count")
-    ).where(ProjectGridCell.project_id == project_id)
-    
-    if area_id:
-        query = query.where(ProjectGridCell.area_id == area_id)
-    
-    query = query.group_by(ProjectGridCell.resolution).order_by(ProjectGridCell.resolution)
-    
-    result = await db.execute(query)
-    rows = result.all()
+    etag = make_etag("available-resolutions", project_id, await project_version(db, project_id, "grid_version"))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+    counts = resolution_counts(await project_catalog(db, project_id), area_id)
     
     return [
         {
-            "resolution": row.resolution, 
-            "count": row.count,
-            "approx_area_km2": H3_RESOLUTION_AREAS_KM2.get(row.resolution, 0)
-        } for row in rows
-    ]
+            "resolution": resolution, 
+            "count": count,
+            "approx_area_km2": H3_RESOLUTION_AREAS_KM2.get(resolution, 0)
+        } for resolution, count in counts.items()
+    ] + virtual_resolution_entries(await load_grid_areas(db, project_id, area_id), H3_RESOLUTION_AREAS_KM2)
 
 
 @router.post("/{project_id}/intersecting-cells")
@@ -634,28 +1055,74 @@ async def get_intersecting_high_res_cells(
     project_id: UUID,
     selected_h3_indices: List[str],
     area_id: Optional[UUID] = Query(None),
+    precision: Optional[int] = Query(None, ge=0, le=15, description="GeoJSON koordinat ondalık basamağı"),
     db: AsyncSession = Depends(get_db)
 ):
     """Find highest resolution cells that intersect with selected cells."""
+    digits = output_precision(None, precision)
     if not selected_h3_indices:
         return {"cells": [], "resolution": None}
+    try:
+        selected_cells = [h3_to_int(h3_index) for h3_index in selected_h3_indices]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Geçersiz H3 indeksi")
     
     # Build base query
-    base_query = ProjectGridCell.project_id == project_id
-    if area_id:
-        base_query = ProjectGridCell.area_id == area_id
+    base_query = grid_scope(project_id, area_id)
     
-    # Get highest resolution
-    max_res_query = select(func.max(ProjectGridCell.resolution)).where(base_query)
-    max_res_result = await db.execute(max_res_query)
-    max_resolution = max_res_result.scalar() or 8
+    # Get highest resolution, stored or virtual
+    stored_resolutions = list(resolution_counts(await project_catalog(db, project_id), area_id))
+    areas = await load_grid_areas(db, project_id, area_id)
+    virtual_resolutions = virtual_levels(areas)
+    max_resolution = max((stored_resolutions or [8]) + virtual_resolutions)
+
+    if max_resolution in virtual_resolutions:
+        # Virtual level: the selection may not be stored either, so its geometry comes from the indices
+        try:
+            selection = shapely.union_all(cells_to_polygons(selected_cells))
+        except Exception:
+            raise HTTPException(status_code=400, detail="Geçersiz H3 indeksi")
+        selection_key = tuple(sorted(set(selected_cells)))
+        features = []
+        for area in areas:
+            if max_resolution not in area["virtual_resolutions"]:
+                continue
+            h3s, wkbs = await virtual_selection_cells(db, area, max_resolution, selection, selection_key)
+            features.extend(
+                (h3_to_str(h3_value), mapping(shapely.transform(shapely.from_wkb(wkb), lambda xy: xy.round(digits))))
+                for h3_value, wkb in zip(h3s, wkbs)
+            )
+        # Areas that store this level
+        result = await db.execute(select(
+            ProjectGridCell.h3,
+            func.ST_AsGeoJSON(ProjectGridCell.geometry, digits).label("geojson")
+        ).where(
+            base_query,
+            ProjectGridCell.resolution == max_resolution,
+            func.ST_Intersects(ProjectGridCell.geometry, func.ST_GeomFromText(selection.wkt, 4326))
+        ))
+        features.extend((h3_to_str(row.h3), json.loads(row.geojson)) for row in result.all())
+        return {
+            "cells": [h3_index for h3_index, _ in features],
+            "resolution": max_resolution,
+            "count": len(features),
+            "virtual": True,
+            "geometries": [
+                {
+                    "type": "Feature",
+                    "properties": {"h3_index": h3_index},
+                    "geometry": geometry
+                } for h3_index, geometry in features
+            ]
+        }
     
     # Get union geometry of selected cells
     selected_query = select(
         func.ST_Union(ProjectGridCell.geometry).label("union_geom")
     ).where(
         base_query,
-        ProjectGridCell.h3_index.in_(selected_h3_indices)
+        ProjectGridCell.resolution.in_({cell >> H3_RES_OFFSET & 0xF for cell in selected_cells}),
+        ProjectGridCell.h3.in_(selected_cells)
     )
     
     selected_result = await db.execute(selected_query)
@@ -666,8 +1133,8 @@ async def get_intersecting_high_res_cells(
     
     # Find intersecting highest-resolution cells
     intersecting_query = select(
-        ProjectGridCell.h3_index,
-        func.ST_AsGeoJSON(ProjectGridCell.geometry).label("geojson")
+        ProjectGridCell.h3,
+        func.ST_AsGeoJSON(ProjectGridCell.geometry, digits).label("geojson")
     ).where(
         base_query,
         ProjectGridCell.resolution == max_resolution,
@@ -677,15 +1144,16 @@ async def get_intersecting_high_res_cells(
     result = await db.execute(intersecting_query)
     rows = result.all()
     
+    cells = [h3_to_str(row.h3) for row in rows]
     return {
-        "cells": [row.h3_index for row in rows],
+        "cells": cells,
         "resolution": max_resolution,
         "count": len(rows),
         "geometries": [
             {
                 "type": "Feature",
-                "properties": {"h3_index": row.h3_index},
+                "properties": {"h3_index": h3_index},
                 "geometry": json.loads(row.geojson)
-            } for row in rows
+            } for h3_index, row in zip(cells, rows)
         ]
     }
@@ -0,0 +1,97 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import update
+from app.database import get_db
+from app.models.project import GridJob
+from app.utils.grid_jobs import job_to_dict, poll_job, find_active_job, notify_workers, ACTIVE_STATUSES
+import json
+from uuid import UUID
+from typing import Optional
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+async def get_job_or_404(db: AsyncSession, job_id: UUID) -> GridJob:
+    job = await db.get(GridJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/")
+async def list_jobs(
+    project_id: Optional[UUID] = Query(None),
+    area_id: Optional[UUID] = Query(None),
+    status: Optional[str] = Query(None),
+    limit: int = Query(50, le=500),
+    db: AsyncSession = Depends(get_db)
+):
+    """List grid generation jobs, newest first"""
+    query = select(GridJob)
+    if project_id:
+        query = query.where(GridJob.project_id == project_id)
+    if area_id:
+        query = query.where(GridJob.area_id == area_id)
+    if status:
+        query = query.where(GridJob.status == status.upper())
+    result = await db.execute(query.order_by(GridJob.created_at.desc()).limit(limit))
+    return [job_to_dict(job) for job in result.scalars().all()]
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: UUID, db: AsyncSession = Depends(get_db)):
+    """Current state of a job: resolution reached, cells written, errors and timings"""
+    return job_to_dict(await get_job_or_404(db, job_id))
+
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: UUID, db: AsyncSession = Depends(get_db)):
+    """Server-Sent Events stream of job progress; ends when the job finishes"""
+    await get_job_or_404(db, job_id)
+
+    async def event_stream():
+        async for job in poll_job(job_id):
+            yield f"event: {job['status'].lower()}\ndata: {json.dumps(job)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: UUID, db: AsyncSession = Depends(get_db)):
+    """Cancel a job. A running job stops at its next committed batch."""
+    job = await get_job_or_404(db, job_id)
+    if job.status not in ACTIVE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job is already {job.status}")
+    new_status = "CANCELLED" if job.status == "PENDING" else "CANCELLING"
+    # Only from the status just read: a worker may claim a PENDING job in between, which then needs CANCELLING
+    result = await db.execute(
+        update(GridJob).where(GridJob.id == job_id, GridJob.status == job.status).values(status=new_status)
+    )
+    if result.rowcount == 0:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Job status changed meanwhile; reload and try again")
+    await db.commit()
+    return {"id": str(job_id), "status": new_status}
+
+
+@router.post("/{job_id}/retry")
+async def retry_job(job_id: UUID, db: AsyncSession = Depends(get_db)):
+    """Re-queue a failed or cancelled job with a fresh attempt budget; it resumes from its last committed batch"""
+    job = await get_job_or_404(db, job_id)
+    if job.status not in ("FAILED", "CANCELLED"):
+        raise HTTPException(status_code=409, detail=f"Only failed or cancelled jobs can be retried (job is {job.status})")
+    active = await find_active_job(db, job.project_id, job.area_id)
+    if active:
+        raise HTTPException(status_code=409, detail=f"Grid already has an active job: {active.id}")
+    await db.execute(
+        update(GridJob).where(GridJob.id == job_id).values(status="PENDING", error=None, finished_at=None, attempts=0)
+    )
+    await db.commit()
+    notify_workers()
+    return {"id": str(job_id), "status": "PENDING"}
@@ -1,30 +1,78 @@
-import math
+import os
 from typing import Optional
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
 from app.database import get_db
+from app.utils.mvt_tiles import resolution_for_zoom, render_tile, get_tile_bbox_4326, zoom_range
+from app.utils.grid_catalog import project_catalog, resolution_counts
+from app.utils.virtual_grid import load_grid_areas, virtual_levels
+from app.utils import tile_extents
+from app.utils.tile_cache import TileKey, tile_cache, get_grid_version
+from app.utils.compression import payload_cache
+from app.utils.versions import make_etag, etag_matches, etag_headers, not_modified
 
 router = APIRouter(prefix="/grids/mvt", tags=["mvt"])
 
-# Zoom to H3 Resolution mapping
-ZOOM_TO_H3_RESOLUTION = {
-    5: 3, 6: 4, 7: 5, 8: 6, 9: 7, 10: 8, 11: 9, 12: 10, 13: 11, 14: 12,
-    15: 12, 16: 13, 17: 13, 18: 14, 19: 14, 20: 15
-}
+# Tiles may be reused for MVT_MAX_AGE seconds without asking; after that the ETag makes revalidation a 304
+MVT_CACHE_CONTROL = f"public, max-age={int(os.getenv('MVT_MAX_AGE', '0'))}, must-revalidate"
+# Tile URLs published by the TileJSON carry the grid version, so their content never changes
+MVT_VERSIONED_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
-def get_tile_bbox_3857(z: int, x: int, y: int):
-    """Calculate the bounding box of a tile in EPSG:3857"""
-    world_size = 40075016.68557849
-    tile_size = world_size / math.pow(2, z)
-    
-    x_min = -20037508.342789244 + x * tile_size
-    y_max = 20037508.342789244 - y * tile_size
-    x_max = x_min + tile_size
-    y_min = y_max - tile_size
-    
-    return x_min, y_min, x_max, y_max
+TILE_LAYER_FIELDS = {"h3_index": "String", "area_id": "String"}
+
+@router.get("/cache/stats")
+async def get_tile_cache_stats():
+    """Hit/miss/eviction counters of this process' tile and compressed payload caches, and the tiles rejected by extent"""
+    stats = tile_cache.stats()
+    stats["extent_rejections"] = tile_extents.rejected_tiles
+    stats["payload_cache"] = payload_cache.stats()
+    return stats
+
+@router.get("/{project_id}/tilejson.json")
+async def get_tilejson(
+    project_id: UUID,
+    request: Request,
+    area_id: Optional[UUID] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    TileJSON of the project's (or one area's) grid: tile URL pinned to the current grid version, bounds and
+    zoom range of the stored and virtual levels, and the fields of the 'h3-layer' layer. Clients reload it
+    when it changes (ETag) and get immutable tiles in between, and never ask for tiles outside its range.
+    """
+    grid_version = await get_grid_version(db, project_id)
+    etag = make_etag("tilejson", project_id, area_id, grid_version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    entries = [entry for entry in await project_catalog(db, project_id, grid_version) if area_id is None or entry.area_id == area_id]
+    resolutions = sorted(set(resolution_counts(entries)) | set(virtual_levels(await load_grid_areas(db, project_id, area_id))))
+    boxes = [entry.bbox for entry in entries if entry.bbox is not None]
+    if resolutions and boxes:
+        minzoom, maxzoom = zoom_range(resolutions)
+        bounds = [
+            min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes)
+        ]
+    else:
+        # No grid yet: a single world tile, which the footprint check answers with a 204
+        minzoom, maxzoom, bounds = 0, 0, [-180, -85.0511, 180, 85.0511]
+
+    query = f"v={grid_version}" + (f"&area_id={area_id}" if area_id else "")
+    tilejson = {
+        "tilejson": "3.0.0",
+        "name": f"h3-grid-{project_id}",
+        "version": f"1.0.{grid_version}",
+        "scheme": "xyz",
+        "tiles": [f"{str(request.base_url).rstrip('/')}{router.prefix}/{project_id}/{{z}}/{{x}}/{{y}}.pbf?{query}"],
+        "bounds": bounds,
+        "minzoom": minzoom,
+        "maxzoom": maxzoom,
+        "vector_layers": [{"id": "h3-layer", "fields": TILE_LAYER_FIELDS, "minzoom": minzoom, "maxzoom": maxzoom}]
+    }
+    return JSONResponse(content=tilejson, headers=etag_headers(etag))
 
 @router.get("/{project_id}/{z}/{x}/{y}.pbf")
 async def get_tile(
@@ -32,87 +80,44 @@ async def get_tile(
     z: int,
     x: int,
     y: int,
+    request: Request,
     area_id: Optional[UUID] = Query(None),
+    v: Optional[int] = Query(None, description="Grid version pinned by the TileJSON tile URL"),
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Generate a Vector Tile (MVT) for the given project, zoom, and tile coordinates.
+    Serve a Vector Tile (MVT) for the given project, zoom, and tile coordinates.
+    Tiles are cached per grid version, so a regenerated grid is never served from a stale tile;
+    clients revalidate with the version ETag and get a 304 until the grid changes.
     """
     # 1. Determine target H3 resolution based on zoom
-    target_res = ZOOM_TO_H3_RESOLUTION.get(z, 8)
-    
-    # 2. Find BEST AVAILABLE resolution in the database for this project
-    try:
-        res_query = text("""
-            SELECT resolution FROM project_grid_cells 
-            WHERE project_id = :project_id 
-            GROUP BY resolution
-        """)
-        res_result = await db.execute(res_query, {"project_id": project_id})
-        available_resolutions = [row[0] for row in res_result.all()]
-        
-        if not available_resolutions:
-            return Response(status_code=204) # No data for this project
-            
-        # Pick the closest resolution to target
-        res = min(available_resolutions, key=lambda r: abs(r - target_res))
-    except Exception as e:
-        print(f"MVT Resolution fallback error: {e}")
-        res = target_res
+    target_res = resolution_for_zoom(z)
+    grid_version = await get_grid_version(db, project_id)
+    etag = make_etag("tile", project_id, area_id, z, x, y, grid_version)
+    # A URL of an older version gets the current tile, but only one pinned to this version may be kept forever
+    cache_control = MVT_VERSIONED_CACHE_CONTROL if v == grid_version else MVT_CACHE_CONTROL
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
 
-    # 3. Get tile bounding box in 3857
-    x_min, y_min, x_max, y_max = get_tile_bbox_3857(z, x, y)
-    
-    # 4. Query PostgreSQL for MVT data
-    where_clauses = [
-        "project_id = :project_id",
-        "resolution = :res",
-        "geometry && ST_Transform(ST_MakeEnvelope(:x_min, :y_min, :x_max, :y_max, 3857), 4326)"
-    ]
-    params = {
-        "project_id": project_id,
-        "res": res,
-        "x_min": x_min,
-        "y_min": y_min,
-        "x_max": x_max,
-        "y_max": y_max
-    }
-    
-    if area_id:
-        where_clauses.append("area_id = :area_id")
-        params["area_id"] = area_id
+    # Tiles outside every area footprint are empty; answer them without a cache lookup or a render
+    if not await tile_extents.tile_may_have_cells(db, project_id, grid_version, get_tile_bbox_4326(z, x, y), area_id):
+        return Response(status_code=204, headers=etag_headers(etag, cache_control))
+
+    key = TileKey(project_id, area_id, target_res, z, x, y, grid_version)
+    mvt_binary = await tile_cache.get(key)
+    if mvt_binary is None:
+        try:
+            mvt_binary = await render_tile(db, project_id, z, x, y, target_res, grid_version, area_id)
+        except Exception as e:
+            print(f"MVT Error at {z}/{x}/{y}: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        await tile_cache.put(key, mvt_binary)
+
+    if not mvt_binary:
+        return Response(status_code=204, headers=etag_headers(etag, cache_control))
 
-    where_stmt = " AND ".join(where_clauses)
-    
-    query_text = text(f"""
-        SELECT ST_AsMVT(tile, 'h3-layer') FROM (
-            SELECT 
-                h3_index,
-                CASE WHEN area_id IS NOT NULL THEN CAST(area_id AS TEXT) ELSE NULL END as area_id,
-                ST_AsMVTGeom(
-                    ST_Transform(geometry, 3857),
-                    ST_MakeEnvelope(:x_min, :y_min, :x_max, :y_max, 3857),
-                    4096, 64, true
-                ) AS geom
-            FROM project_grid_cells
-            WHERE {where_stmt}
-        ) AS tile;
-    """)
-    
-    try:
-        result = await db.execute(query_text, params)
-        mvt_binary = result.scalar()
-        
-        if not mvt_binary:
-            return Response(status_code=204) 
-            
-        return Response(
-            content=mvt_binary,
-            media_type="application/x-protobuf",
-            headers={
-                "Cache-Control": "public, max-age=3600"
-            }
-        )
-    except Exception as e:
-        print(f"MVT Error at {z}/{x}/{y}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return Response(
+        content=mvt_binary,
+        media_type="application/x-protobuf",
+        headers=etag_headers(etag, cache_control)
+    )
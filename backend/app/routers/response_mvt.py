@@ -0,0 +1,224 @@
+import os
+from typing import List, Optional
+from uuid import UUID
+import h3.api.numpy_int as h3_int
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import text
+from app.database import get_db
+from app.models.project import ProjectColumn
+from app.utils.mvt_tiles import get_tile_bbox_4326
+from app.utils.grid_store import h3_to_int
+from app.utils.grid_workers import build_cell_bounds, run_in_pool
+from app.utils.virtual_grid import LRUCache
+from app.utils.tile_cache import TileCache, TileKey
+from app.utils.versions import project_version, make_etag, etag_matches, etag_headers, not_modified
+
+router = APIRouter(prefix="/responses/mvt", tags=["mvt"])
+
+# Hand-drawn geometries are simplified to this many tile extent units (4096 per tile) before encoding
+RESPONSE_TILE_SIMPLIFY_UNITS = float(os.getenv("RESPONSE_TILE_SIMPLIFY_UNITS", "8"))
+# Selected H3 cells never change shape, so their bounds and EWKB are kept across requests
+_selection_cells = LRUCache(int(os.getenv("RESPONSE_TILE_CELL_CACHE", "100000")))
+# project_id -> (responses_version, selected cells of the whole project)
+_project_selections = LRUCache(int(os.getenv("RESPONSE_TILE_PROJECT_CACHE", "32")))
+# Memory only: tiles of an older responses_version are simply never looked up again
+response_tile_cache = TileCache(int(os.getenv("RESPONSE_TILE_CACHE_MAX_BYTES", str(16 * 1024 * 1024))))
+
+WEB_MERCATOR_SPAN = 2 * 20037508.342789244
+
+# Every h3 index a response points at: its own h3_index plus the cells of any GridSelection answer
+SELECTION_CELLS_SQL = """
+    SELECT r.id, s.h3_index
+    FROM stakeholder_responses r
+    CROSS JOIN LATERAL (
+        SELECT r.h3_index WHERE r.h3_index IS NOT NULL
+        UNION
+        SELECT jsonb_array_elements_text(v.value -> 'h3_indices')
+        FROM jsonb_each(r.response_data) v
+        WHERE jsonb_typeof(v.value) = 'object' AND v.value ->> 'type' = 'GridSelection'
+          AND jsonb_typeof(v.value -> 'h3_indices') = 'array'
+    ) AS s(h3_index)
+    WHERE r.project_id = :project_id
+"""
+
+
+async def attribute_columns(db: AsyncSession, project_id: UUID, fields: Optional[str]) -> List[str]:
+    """Form fields requested as feature properties; only the project's non-geometry columns are allowed"""
+    if not fields:
+        return []
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    result = await db.execute(
+        select(ProjectColumn.name).where(ProjectColumn.project_id == project_id, ProjectColumn.type != "geometry")
+    )
+    allowed = set(result.scalars().all())
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Bilinmeyen form alanları: {', '.join(unknown)}")
+    return list(dict.fromkeys(requested))
+
+
+def parse_selected_cell(h3_index: str) -> Optional[int]:
+    """Stored form of an answered cell; None for anything that is not a valid H3 cell"""
+    try:
+        cell = h3_to_int(h3_index)
+    except (TypeError, ValueError):
+        return None
+    if not 0 < cell < 2 ** 64 or not h3_int.is_valid_cell(cell):
+        return None
+    return cell
+
+
+async def project_selection_cells(db: AsyncSession, project_id: UUID, responses_version: int) -> tuple:
+    """
+    (response ids, h3 ints, lng/lat bounds array, EWKB polygons) of every cell the project's responses point
+    at, read and parsed once per responses_version rather than on every tile.
+    """
+    cached = _project_selections.get(project_id)
+    if cached is not None and cached[0] == responses_version:
+        return cached[1]
+
+    result = await db.execute(text(SELECTION_CELLS_SQL), {"project_id": project_id})
+    pairs = []
+    for response_id, h3_index in result.all():
+        # Answers are free-form JSON, so malformed indices are skipped instead of failing the tile
+        cell = parse_selected_cell(h3_index)
+        if cell is not None:
+            pairs.append((str(response_id), cell))
+
+    missing = sorted({cell for _, cell in pairs if _selection_cells.get(cell) is None})
+    if missing:
+        bounds, wkbs = await run_in_pool(build_cell_bounds, missing)
+        for cell, cell_bounds, wkb in zip(missing, bounds, wkbs):
+            _selection_cells.put(cell, (cell_bounds, wkb))
+
+    response_ids, cells, bounds, geoms = [], [], [], []
+    for response_id, cell in pairs:
+        cached_cell = _selection_cells.get(cell)
+        if cached_cell is None:
+            # Evicted while filling a very large selection; computed again on the next version
+            continue
+        response_ids.append(response_id)
+        cells.append(cell)
+        bounds.append(cached_cell[0])
+        geoms.append(cached_cell[1])
+    selections = (response_ids, cells, np.array(bounds, dtype=np.float64).reshape(-1, 4), geoms)
+    _project_selections.put(project_id, (responses_version, selections))
+    return selections
+
+
+def selection_cells_in_tile(selections: tuple, bbox_4326) -> tuple:
+    """(response ids, h3 ints, EWKB polygons) of the selected cells whose extent touches the tile"""
+    response_ids, cells, bounds, geoms = selections
+    x_min, y_min, x_max, y_max = bbox_4326
+    hits = np.flatnonzero(
+        (bounds[:, 0] <= x_max) & (bounds[:, 2] >= x_min) & (bounds[:, 1] <= y_max) & (bounds[:, 3] >= y_min)
+    )
+    return [response_ids[i] for i in hits], [cells[i] for i in hits], [geoms[i] for i in hits]
+
+
+async def render_response_tile(
+    db: AsyncSession, project_id: UUID, z: int, x: int, y: int, columns: List[str], selections: tuple
+) -> bytes:
+    response_ids, cells, geoms = selection_cells_in_tile(selections, get_tile_bbox_4326(z, x, y))
+
+    params = {
+        "project_id": project_id,
+        "z": z,
+        "x": x,
+        "y": y,
+        "tolerance": WEB_MERCATOR_SPAN / (2 ** z) / 4096 * RESPONSE_TILE_SIMPLIFY_UNITS,
+        "selection_ids": response_ids,
+        "selection_h3": cells,
+        "selection_geoms": geoms
+    }
+    attribute_sql = ""
+    for i, column in enumerate(columns):
+        params[f"field_{i}"] = column
+        attribute_sql += f', r.response_data ->> :field_{i} AS "{column.replace(chr(34), chr(34) * 2)}"'
+
+    query_text = text(f"""
+        SELECT
+            COALESCE((
+                SELECT ST_AsMVT(tile, 'responses') FROM (
+                    SELECT
+                        CAST(r.id AS TEXT) AS response_id,
+                        r.user_id,
+                        r.h3_index,
+                        CAST(r.created_at AS TEXT) AS created_at
+                        {attribute_sql},
+                        ST_AsMVTGeom(
+                            ST_SimplifyPreserveTopology(ST_Transform(r.geom, 3857), :tolerance),
+                            ST_TileEnvelope(:z, :x, :y),
+                            4096, 64, true
+                        ) AS geom
+                    FROM stakeholder_responses r
+                    WHERE r.project_id = :project_id
+                      AND r.geom && ST_Transform(ST_TileEnvelope(:z, :x, :y), 4326)
+                ) AS tile WHERE geom IS NOT NULL
+            ), ''::bytea)
+            ||
+            COALESCE((
+                SELECT ST_AsMVT(tile, 'selections') FROM (
+                    SELECT
+                        CAST(r.id AS TEXT) AS response_id,
+                        r.user_id,
+                        to_hex(s.h3) AS h3_index,
+                        CAST(r.created_at AS TEXT) AS created_at
+                        {attribute_sql},
+                        ST_AsMVTGeom(
+                            ST_Transform(ST_GeomFromEWKB(s.geom), 3857),
+                            ST_TileEnvelope(:z, :x, :y),
+                            4096, 64, true
+                        ) AS geom
+                    FROM unnest(
+                        CAST(:selection_ids AS UUID[]), CAST(:selection_h3 AS BIGINT[]), CAST(:selection_geoms AS BYTEA[])
+                    ) AS s(response_id, h3, geom)
+                    JOIN stakeholder_responses r ON r.id = s.response_id
+                ) AS tile WHERE geom IS NOT NULL
+            ), ''::bytea)
+    """)
+
+    try:
+        result = await db.execute(query_text, params)
+        mvt_binary = result.scalar()
+    except Exception as e:
+        print(f"Response MVT Error at {z}/{x}/{y}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return bytes(mvt_binary) if mvt_binary else b""
+
+
+@router.get("/{project_id}/{z}/{x}/{y}.pbf")
+async def get_response_tile(
+    project_id: UUID,
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description="Comma-separated form fields to carry as feature properties"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Vector tile of a project's responses with two layers: 'responses' (hand-drawn geometries, simplified
+    for the zoom) and 'selections' (the H3 cells responses point at, one feature per response and cell).
+    Tiles are versioned by the project's responses_version, like grid tiles by its grid_version.
+    """
+    columns = await attribute_columns(db, project_id, fields)
+    responses_version = await project_version(db, project_id, "responses_version") or 0
+    etag = make_etag("response-tile", project_id, z, x, y, ",".join(columns), responses_version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    key = TileKey(project_id, None, 0, z, x, y, responses_version, ",".join(columns))
+    mvt_binary = await response_tile_cache.get(key)
+    if mvt_binary is None:
+        selections = await project_selection_cells(db, project_id, responses_version)
+        mvt_binary = await render_response_tile(db, project_id, z, x, y, columns, selections)
+        await response_tile_cache.put(key, mvt_binary)
+
+    if not mvt_binary:
+        return Response(status_code=204, headers=etag_headers(etag))
+
+    return Response(content=mvt_binary, media_type="application/x-protobuf", headers=etag_headers(etag))
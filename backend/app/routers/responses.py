@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Response as FastApiResponse
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response as FastApiResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import func
 from sqlalchemy.future import select
 from typing import List, Optional
 from app.database import get_db
 from app.models.project import StakeholderResponse as ResponseModel, ProjectGridCell
+from app.utils.grid_store import grid_scope, h3_to_str
 from app.schemas.project import Response, ResponseCreate
+from app.utils.geo import cells_to_polygons
+from app.utils.versions import bump_project_version
+from app.utils.geojson_output import geometry_output
 from uuid import UUID
 
 # Geometry and Data processing libraries
@@ -14,9 +18,10 @@ import os
 import sys
 import tempfile
 import h3
+import numpy as np
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import shape, Polygon, MultiPolygon
+from shapely.geometry import shape, MultiPolygon
 from shapely.strtree import STRtree
 from shapely.errors import ShapelyError
 from geoalchemy2.shape import from_shape, to_shape
@@ -75,14 +80,40 @@ async def submit_response(
         geom=geom
     )
     db.add(new_response)
+    await bump_project_version(db, response.project_id, "responses_version")
     await db.commit()
     await db.refresh(new_response)
     return new_response
 
 @router.get("/project/{project_id}", response_model=List[Response])
-async def get_project_responses(project_id: UUID, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(ResponseModel).where(ResponseModel.project_id == project_id))
-    return result.scalars().all()
+async def get_project_responses(
+    project_id: UUID,
+    zoom: Optional[float] = Query(None, ge=0, le=24, description="Geometrilerin çizileceği zoom; hassasiyet ve sadeleştirme buna göre seçilir"),
+    precision: Optional[int] = Query(None, ge=0, le=15, description="Koordinat ondalık basamağı"),
+    simplify: Optional[float] = Query(None, ge=0, description="Sadeleştirme toleransı (derece)"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Responses of a project; drawn geometries are simplified for `zoom` when it is given, and sent in full otherwise"""
+    digits, tolerance = geometry_output(zoom, precision, simplify)
+    geometry = ResponseModel.geom
+    if tolerance is not None:
+        geometry = func.ST_SimplifyPreserveTopology(geometry, tolerance)
+    result = await db.execute(
+        select(ResponseModel, func.ST_AsGeoJSON(geometry, digits).label("geojson"))
+        .where(ResponseModel.project_id == project_id)
+    )
+    return [
+        {
+            "id": row.id,
+            "project_id": row.project_id,
+            "h3_index": row.h3_index,
+            "response_data": row.response_data,
+            "user_id": row.user_id,
+            "created_at": row.created_at,
+            "geom": json.loads(geojson) if geojson else None
+        }
+        for row, geojson in result.all()
+    ]
 
 @router.put("/{response_id}", response_model=Response)
 async def update_response(
@@ -106,6 +137,7 @@ async def update_response(
     existing_response.response_data = response.response_data
     existing_response.h3_index = response.h3_index
     existing_response.geom = geom
+    await bump_project_version(db, existing_response.project_id, "responses_version")
     
     await db.commit()
     await db.refresh(existing_response)
@@ -124,6 +156,7 @@ async def delete_response(
         raise HTTPException(status_code=404, detail="Response not found")
     
     await db.delete(response)
+    await bump_project_version(db, response.project_id, "responses_version")
     await db.commit()
     return {"message": "Response deleted successfully"}
 
@@ -198,16 +231,11 @@ async def export_responses_gpkg(
                     if not indices: continue
                     if isinstance(indices, str): indices = [indices]
                     
-                    h3_polys = []
-                    for h_idx in set(indices):
-                        try:
-                            coords = h3.cell_to_boundary(h_idx)
-                            h3_polys.append(Polygon([(lng, lat) for lat, lng in coords]))
-                        except Exception: pass
+                    valid_indices = [h_idx for h_idx in set(indices) if isinstance(h_idx, str) and h3.is_valid_cell(h_idx)]
                     
-                    if h3_polys:
+                    if valid_indices:
                         from shapely.ops import unary_union
-                        h3_union = unary_union(h3_polys)
+                        h3_union = unary_union(cells_to_polygons(valid_indices))
                         row_geoms[k] = h3_union
                         add_to_analysis(k, h3_union)
                     continue
@@ -229,8 +257,7 @@ async def export_responses_gpkg(
         # 2d. Handle primary H3 index and legacy geom
         if r.h3_index:
             try:
-                coords = h3.cell_to_boundary(r.h3_index)
-                p_geom = Polygon([(lng, lat) for lat, lng in coords])
+                p_geom = cells_to_polygons([r.h3_index])[0]
                 add_to_orig("primary_h3_selection", {**all_attrs, "geometry": p_geom})
                 add_to_analysis("primary_h3_selection", p_geom)
             except Exception: pass
@@ -251,7 +278,7 @@ async def export_responses_gpkg(
 
     # 3b. Create Intersection Analysis layers
     try:
-        res_query = select(func.max(ProjectGridCell.resolution)).where(ProjectGridCell.project_id == project_id)
+        res_query = select(func.max(ProjectGridCell.resolution)).where(grid_scope(project_id))
         res_result = await db.execute(res_query)
         max_res = res_result.scalar()
         
@@ -261,12 +288,12 @@ async def export_responses_gpkg(
                 combined_area = unary_union(geoms)
                 if combined_area.is_empty: continue
                 
+                # Cell polygons are rebuilt from the index in one batch instead of decoding each stored geometry
                 grid_query = select(
-                    ProjectGridCell.h3_index,
-                    ProjectGridCell.resolution,
-                    ProjectGridCell.geometry
+                    ProjectGridCell.h3,
+                    ProjectGridCell.resolution
                 ).where(
-                    ProjectGridCell.project_id == project_id,
+                    grid_scope(project_id),
                     ProjectGridCell.resolution == max_res,
                     func.ST_Intersects(ProjectGridCell.geometry, func.ST_GeomFromText(combined_area.wkt, 4326))
                 )
@@ -276,18 +303,18 @@ async def export_responses_gpkg(
                 if not grid_rows: continue
                 
                 tree = STRtree(geoms)
-                analysis_rows = []
-                for grow in grid_rows:
-                    try:
-                        cell_poly = to_shape(grow.geometry)
-                        intersecting_indices = tree.query(cell_poly, predicate='intersects')
-                        analysis_rows.append({
-                            "h3_index": grow.h3_index,
-                            "resolution": grow.resolution,
-                            "intersection_count": len(intersecting_indices),
-                            "geometry": cell_poly
-                        })
-                    except Exception: pass
+                cell_polys = cells_to_polygons([grow.h3 for grow in grid_rows])
+                # query() on an array returns (input index, tree index) pairs for every hit
+                hits = tree.query(cell_polys, predicate='intersects')
+                hit_counts = np.bincount(hits[0], minlength=len(cell_polys))
+                analysis_rows = [
+                    {
+                        "h3_index": h3_to_str(grow.h3),
+                        "resolution": grow.resolution,
+                        "intersection_count": int(count),
+                        "geometry": cell_poly
+                    } for grow, cell_poly, count in zip(grid_rows, cell_polys, hit_counts)
+                ]
                 
                 if analysis_rows:
                     layer_dfs[f"intersections_{cat_name}"] = gpd.GeoDataFrame(pd.DataFrame(analysis_rows), geometry="geometry", crs="EPSG:4326")
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import text
 from typing import List
 from app.database import get_db
+from app.utils.versions import project_version, bump_project_version, make_etag, etag_matches, etag_headers, not_modified
 from app.models.project import ProjectColumn as ProjectColumnModel, StakeholderForm as StakeholderFormModel, FormAssignment as FormAssignmentModel
 from app.schemas.project import ProjectColumn, ProjectColumnCreate, ProjectColumnUpdate, StakeholderForm, StakeholderFormCreate, FormAssignment, FormAssignmentCreate
 from uuid import UUID
@@ -12,7 +14,11 @@ router = APIRouter(prefix="/schema", tags=["schema"])
 # --- Project Columns ---
 
 @router.get("/columns/{project_id}", response_model=List[ProjectColumn])
-async def get_columns(project_id: UUID, db: AsyncSession = Depends(get_db)):
+async def get_columns(project_id: UUID, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    etag = make_etag("columns", project_id, await project_version(db, project_id, "schema_version"))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
     result = await db.execute(select(ProjectColumnModel).where(ProjectColumnModel.project_id == project_id))
     return result.scalars().all()
 
@@ -20,6 +26,7 @@ async def get_columns(project_id: UUID, db: AsyncSession = Depends(get_db)):
 async def create_column(column: ProjectColumnCreate, db: AsyncSession = Depends(get_db)):
     new_col = ProjectColumnModel(**column.dict())
     db.add(new_col)
+    await bump_project_version(db, column.project_id, "schema_version")
     await db.commit()
     await db.refresh(new_col)
     return new_col
@@ -35,6 +42,7 @@ async def update_column(column_id: UUID, schema: ProjectColumnUpdate, db: AsyncS
     for key, value in update_data.items():
         setattr(col, key, value)
     
+    await bump_project_version(db, col.project_id, "schema_version")
     await db.commit()
     await db.refresh(col)
     return col
@@ -46,13 +54,18 @@ async def delete_column(column_id: UUID, db: AsyncSession = Depends(get_db)):
     if not col:
         raise HTTPException(status_code=404, detail="Column not found")
     await db.delete(col)
+    await bump_project_version(db, col.project_id, "schema_version")
     await db.commit()
     return {"message": "Column deleted"}
 
 # --- Stakeholder Forms ---
 
 @router.get("/forms/{project_id}", response_model=List[StakeholderForm])
-async def get_stakeholder_forms(project_id: UUID, db: AsyncSession = Depends(get_db)):
+async def get_stakeholder_forms(project_id: UUID, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    etag = make_etag("forms", project_id, await project_version(db, project_id, "schema_version"))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
     result = await db.execute(select(StakeholderFormModel).where(StakeholderFormModel.project_id == project_id))
     return result.scalars().all()
 
@@ -63,6 +76,7 @@ async def create_stakeholder_form(form: StakeholderFormCreate, db: AsyncSession
     data['selected_columns'] = [str(c) for c in form.selected_columns]
     new_form = StakeholderFormModel(**data)
     db.add(new_form)
+    await bump_project_version(db, form.project_id, "schema_version")
     await db.commit()
     await db.refresh(new_form)
     return new_form
@@ -78,6 +92,7 @@ async def update_stakeholder_form(form_id: UUID, schema: StakeholderFormCreate,
     # Ensure they are stored as strings in JSONB
     form.selected_columns = [str(c) for c in schema.selected_columns]
     
+    await bump_project_version(db, form.project_id, "schema_version")
     await db.commit()
     await db.refresh(form)
     return form
@@ -89,11 +104,21 @@ async def delete_stakeholder_form(form_id: UUID, db: AsyncSession = Depends(get_
     if not form:
         raise HTTPException(status_code=404, detail="Form not found")
     await db.delete(form)
+    await bump_project_version(db, form.project_id, "schema_version")
     await db.commit()
     return {"message": "Form deleted"}
 
 @router.get("/form/{form_id}")
-async def get_form_details(form_id: UUID, db: AsyncSession = Depends(get_db)):
+async def get_form_details(form_id: UUID, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    version_result = await db.execute(text("""
+        SELECT COALESCE(p.schema_version, 0) FROM stakeholder_forms f JOIN projects p ON p.id = f.project_id
+        WHERE f.id = :form_id
+    """), {"form_id": form_id})
+    etag = make_etag("form", form_id, version_result.scalar())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+
     # Fetch form
     result = await db.execute(select(StakeholderFormModel).where(StakeholderFormModel.id == form_id))
     form = result.scalar_one_or_none()
@@ -115,7 +140,11 @@ async def get_form_details(form_id: UUID, db: AsyncSession = Depends(get_db)):
 # --- Form Assignments ---
 
 @router.get("/assignments/{project_id}", response_model=List[FormAssignment])
-async def get_assignments(project_id: UUID, db: AsyncSession = Depends(get_db)):
+async def get_assignments(project_id: UUID, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    etag = make_etag("assignments", project_id, await project_version(db, project_id, "schema_version"))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
     result = await db.execute(select(FormAssignmentModel).where(FormAssignmentModel.project_id == project_id))
     return result.scalars().all()
 
@@ -130,6 +159,7 @@ async def create_assignment(assignment: FormAssignmentCreate, db: AsyncSession =
     
     new_assignment = FormAssignmentModel(**assignment.dict())
     db.add(new_assignment)
+    await bump_project_version(db, assignment.project_id, "schema_version")
     await db.commit()
     await db.refresh(new_assignment)
     return new_assignment
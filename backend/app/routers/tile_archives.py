@@ -0,0 +1,35 @@
+import os
+from typing import Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
+from app.utils.tile_archive import archive_path
+from app.utils.tile_cache import get_grid_version
+from app.utils.versions import make_etag, etag_matches, etag_headers, not_modified
+
+router = APIRouter(prefix="/grids/pmtiles", tags=["mvt"])
+
+
+@router.get("/{project_id}.pmtiles")
+async def get_tile_archive(
+    project_id: UUID,
+    request: Request,
+    area_id: Optional[UUID] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    PMTiles archive of the project's current grid, served with Range support so map clients read
+    single tiles from it. 404 until the archive of the current grid version has been built;
+    clients then fall back to /grids/mvt.
+    """
+    grid_version = await get_grid_version(db, project_id)
+    path = archive_path(project_id, area_id, grid_version)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Tile archive not built for the current grid")
+
+    etag = make_etag("pmtiles", project_id, area_id, grid_version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return FileResponse(path, media_type="application/vnd.pmtiles", headers=etag_headers(etag))
@@ -0,0 +1,294 @@
+"""
+Negotiated response compression (zstd, brotli or gzip, picked from Accept-Encoding) and a cache of
+already compressed payloads.
+
+CompressionMiddleware compresses eligible responses as they stream. Only NDJSON (job progress) is flushed
+after every body message so it still arrives line by line; everything else is left to the compressor's
+own buffering, which is where most of the ratio comes from. Responses that already carry a Content-Encoding pass
+through untouched; that is how endpoints serve payloads from payload_cache, which keeps the compressed
+bytes of versioned results (keyed by URL, ETag and encoding) so they are compressed once per version
+rather than once per request.
+
+Levels follow the gzip scale (1 fastest, 9 smallest, 0 off) and are clamped to each codec's range.
+COMPRESSION_ROUTE_LEVELS overrides COMPRESSION_LEVEL per path prefix, longest prefix first,
+e.g. "/grids=4,/responses=6,/grids/mvt=0".
+"""
+import os
+import zlib
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, Tuple
+import brotli
+import zstandard
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "5"))
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+PAYLOAD_CACHE_MAX_BYTES = int(os.getenv("PAYLOAD_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Larger payloads are still compressed, just not kept
+PAYLOAD_CACHE_MAX_ENTRY_BYTES = int(os.getenv("PAYLOAD_CACHE_MAX_ENTRY_BYTES", str(8 * 1024 * 1024)))
+
+# Streams whose every message must reach the client as soon as it is written
+FLUSHED_TYPES = ("application/x-ndjson",)
+
+# Server preference when the client accepts several encodings equally
+ENCODINGS = ("zstd", "br", "gzip")
+
+COMPRESSIBLE_TYPES = (
+    "application/json", "application/geo+json", "application/x-ndjson", "application/x-protobuf",
+    "application/javascript", "text/"
+)
+
+
+def _parse_route_levels(value: str) -> Dict[str, int]:
+    levels = {}
+    for item in value.split(","):
+        prefix, _, level = item.strip().partition("=")
+        if prefix and level:
+            levels[prefix] = int(level)
+    return levels
+
+
+COMPRESSION_ROUTE_LEVELS = _parse_route_levels(os.getenv("COMPRESSION_ROUTE_LEVELS", ""))
+
+
+def route_level(path: str) -> int:
+    best = None
+    for prefix in COMPRESSION_ROUTE_LEVELS:
+        if path.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return COMPRESSION_ROUTE_LEVELS[best] if best is not None else COMPRESSION_LEVEL
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Highest-q encoding the client accepts, ties broken by ENCODINGS order; None means identity"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    wildcard = weights.get("*", 0.0)
+    ranked = [(weights.get(encoding, wildcard), -i, encoding) for i, encoding in enumerate(ENCODINGS)]
+    q, _, encoding = max(ranked)
+    return encoding if q > 0 else None
+
+
+class Compressor:
+    """Streaming compressor with the same two calls for every codec"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._gzip = zlib.compressobj(min(max(level, 1), 9), zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._brotli = brotli.Compressor(quality=min(max(level, 0), 11))
+        else:
+            self._zstd = zstandard.ZstdCompressor(level=min(max(level, 1), 22)).compressobj()
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        """Compress; with flush, everything written so far can be decoded by the client"""
+        if self.encoding == "gzip":
+            return self._gzip.compress(data) + (self._gzip.flush(zlib.Z_SYNC_FLUSH) if flush else b"")
+        if self.encoding == "br":
+            return self._brotli.process(data) + (self._brotli.flush() if flush else b"")
+        return self._zstd.compress(data) + (self._zstd.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if flush else b"")
+
+    def finish(self) -> bytes:
+        if self.encoding == "gzip":
+            return self._gzip.flush()
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zstd.flush()
+
+
+def weak_etag(etag: str) -> str:
+    """Compressed bytes differ from the identity ones, so their validator is weak (as nginx does)"""
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+
+class PayloadCache:
+    """Byte-capped LRU of compressed payloads"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._payloads = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[bytes]:
+        payload = self._payloads.get(key)
+        if payload is None:
+            self.misses += 1
+            return None
+        self._payloads.move_to_end(key)
+        self.hits += 1
+        return payload
+
+    def put(self, key: Tuple[str, str, str], payload: bytes):
+        if len(payload) > min(self.max_bytes, PAYLOAD_CACHE_MAX_ENTRY_BYTES):
+            return
+        previous = self._payloads.pop(key, None)
+        if previous is not None:
+            self.size_bytes -= len(previous)
+        self._payloads[key] = payload
+        self.size_bytes += len(payload)
+        while self.size_bytes > self.max_bytes:
+            _, evicted = self._payloads.popitem(last=False)
+            self.size_bytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._payloads),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None
+        }
+
+
+payload_cache = PayloadCache(PAYLOAD_CACHE_MAX_BYTES)
+
+
+async def _compress_and_store(
+    chunks: AsyncIterator, compressor: Compressor, key: Tuple[str, str, str], flush: bool
+) -> AsyncIterator[bytes]:
+    parts = []
+    size = 0
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk, flush)
+        if data:
+            size += len(data)
+            if size <= PAYLOAD_CACHE_MAX_ENTRY_BYTES:
+                parts.append(data)
+            yield data
+    data = compressor.finish()
+    size += len(data)
+    yield data
+    # Only a payload streamed to the end is complete
+    if size <= PAYLOAD_CACHE_MAX_ENTRY_BYTES:
+        payload_cache.put(key, b"".join(parts) + data)
+
+
+def cached_stream_response(
+    request: Request, etag: str, chunks: AsyncIterator, media_type: str, headers: dict
+) -> Response:
+    """
+    Response for a versioned streaming result: served from payload_cache when this URL was already
+    streamed for the same ETag and encoding, otherwise compressed while streaming and stored.
+    The chunks iterator is only consumed on a miss, so a hit never reaches the database.
+    """
+    level = route_level(request.url.path)
+    encoding = negotiate_encoding(request.headers.get("accept-encoding")) if level > 0 else None
+    if encoding is None:
+        return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+    headers = {**headers, "ETag": weak_etag(etag), "Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+    key = (str(request.url), etag, encoding)
+    payload = payload_cache.get(key)
+    if payload is not None:
+        return Response(content=payload, media_type=media_type, headers=headers)
+    return StreamingResponse(
+        _compress_and_store(chunks, Compressor(encoding, level), key, media_type.startswith(FLUSHED_TYPES)),
+        media_type=media_type, headers=headers
+    )
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing eligible responses with the encoding the client prefers"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict((name.decode("latin-1"), value.decode("latin-1")) for name, value in scope["headers"])
+        level = route_level(scope["path"])
+        # Range requests address bytes of the identity representation
+        encoding = None
+        if level > 0 and "range" not in headers:
+            encoding = negotiate_encoding(headers.get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        flush = False
+
+        async def compressing_send(message):
+            nonlocal start_message, compressor, flush
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                start, start_message = start_message, None
+                response_headers = dict(
+                    (name.decode("latin-1").lower(), value.decode("latin-1")) for name, value in start["headers"]
+                )
+                content_type = response_headers.get("content-type", "")
+                if start["status"] == 304 and "etag" in response_headers:
+                    # Revalidations answer with the validator of the compressed representation
+                    start = {**start, "headers": [
+                        (name, weak_etag(value.decode("latin-1")).encode("latin-1") if name.lower() == b"etag" else value)
+                        for name, value in start["headers"]
+                    ]}
+                eligible = (
+                    start["status"] not in (204, 206, 304)
+                    and "content-encoding" not in response_headers
+                    and content_type.startswith(COMPRESSIBLE_TYPES)
+                    and (more_body or len(body) >= self.minimum_size)
+                )
+                if not eligible:
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = Compressor(encoding, level)
+                flush = content_type.startswith(FLUSHED_TYPES)
+                raw_headers = [
+                    (name, value) for name, value in start["headers"]
+                    if name.lower() not in (b"content-length", b"etag")
+                ]
+                etag = response_headers.get("etag")
+                if etag:
+                    raw_headers.append((b"etag", weak_etag(etag).encode("latin-1")))
+                raw_headers.append((b"content-encoding", encoding.encode("latin-1")))
+                vary = response_headers.get("vary")
+                raw_headers = [(name, value) for name, value in raw_headers if name.lower() != b"vary"]
+                raw_headers.append((b"vary", (f"{vary}, Accept-Encoding" if vary else "Accept-Encoding").encode("latin-1")))
+                await send({**start, "headers": raw_headers})
+
+            if compressor is None:
+                await send(message)
+                return
+            data = compressor.compress(body, flush) if body else b""
+            if not more_body:
+                data += compressor.finish()
+            elif not data:
+                # Still buffered in the compressor
+                return
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
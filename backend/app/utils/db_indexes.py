@@ -0,0 +1,110 @@
+"""
+Managed indexes of the spatial and H3 tables.
+
+The index set is declared on the models (__table_args__); create_all only builds it for new tables,
+so startup creates whatever is missing on existing ones. For large tables run
+`python -m app.utils.db_indexes --create` before deploying instead: it builds the missing indexes
+CONCURRENTLY without blocking writes. Without --create it prints the report: managed indexes that are
+missing or invalid, and indexes on these tables that have never been scanned.
+"""
+import argparse
+import asyncio
+from typing import List
+from sqlalchemy import Index, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.schema import CreateIndex
+from app.models.project import Base
+
+MANAGED_TABLES = ("project_areas", "project_grid_cells", "stakeholder_responses")
+
+
+def managed_indexes() -> List[Index]:
+    return [
+        index
+        for table_name in MANAGED_TABLES
+        for index in sorted(Base.metadata.tables[table_name].indexes, key=lambda index: index.name)
+    ]
+
+
+def create_index_sql(index: Index, concurrently: bool = False) -> str:
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=postgresql.dialect()))
+    if concurrently:
+        ddl = ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+    return ddl
+
+
+async def existing_indexes(conn: AsyncConnection) -> dict:
+    """name -> (table, valid, scans, size) for every index on the managed tables"""
+    result = await conn.execute(text("""
+        SELECT c.relname AS name, t.relname AS table_name, i.indisvalid AS valid, i.indisprimary AS is_primary,
+               COALESCE(s.idx_scan, 0) AS scans, pg_relation_size(c.oid) AS size_bytes
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_class t ON t.oid = i.indrelid
+        LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = i.indexrelid
+        WHERE t.relname = ANY(:tables) AND pg_table_is_visible(t.oid)
+    """), {"tables": list(MANAGED_TABLES)})
+    return {row.name: row for row in result.all()}
+
+
+async def ensure_indexes(conn: AsyncConnection) -> List[str]:
+    """Create missing managed indexes inside the caller's transaction; returns their names"""
+    existing = await existing_indexes(conn)
+    created = []
+    for index in managed_indexes():
+        if index.name not in existing:
+            await conn.execute(text(create_index_sql(index)))
+            created.append(index.name)
+    return created
+
+
+async def index_report(conn: AsyncConnection) -> dict:
+    """
+    Managed indexes that are missing or invalid (a failed CONCURRENTLY build) and indexes on the managed
+    tables that were never scanned since statistics were last reset. Primary keys are never reported unused.
+    """
+    existing = await existing_indexes(conn)
+    managed = {index.name for index in managed_indexes()}
+    return {
+        "missing": sorted(managed - set(existing)),
+        "invalid": sorted(name for name, row in existing.items() if not row.valid),
+        "unused": [
+            {"name": name, "table": row.table_name, "size_bytes": row.size_bytes, "managed": name in managed}
+            for name, row in sorted(existing.items())
+            if row.scans == 0 and not row.is_primary
+        ]
+    }
+
+
+async def main(create: bool):
+    from app.database import engine
+    if create:
+        # CONCURRENTLY cannot run inside a transaction block
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            existing = await existing_indexes(conn)
+            for index in managed_indexes():
+                if index.name in existing and not existing[index.name].valid:
+                    print(f"Rebuilding invalid index {index.name}")
+                    await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+                elif index.name in existing:
+                    continue
+                print(f"Creating {index.name}...")
+                await conn.execute(text(create_index_sql(index, concurrently=True)))
+
+    async with engine.connect() as conn:
+        report = await index_report(conn)
+    print(f"Missing: {', '.join(report['missing']) or '-'}")
+    print(f"Invalid: {', '.join(report['invalid']) or '-'}")
+    print(f"Never scanned: {'' if report['unused'] else '-'}")
+    for entry in report["unused"]:
+        print(f"  {entry['name']} on {entry['table']} ({entry['size_bytes'] // 1024} kB)"
+              + ("" if entry["managed"] else " [not managed]"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check or create the managed database indexes")
+    parser.add_argument("--create", action="store_true", help="Create missing indexes CONCURRENTLY before reporting")
+    args = parser.parse_args()
+    asyncio.run(main(args.create))
@@ -1,8 +1,36 @@
 import h3
 from typing import List, Dict, Any
 import json
+import struct
+from itertools import chain
+import numpy as np
+import shapely
+import h3.api.numpy_int as h3_int
 from shapely.geometry import shape, mapping, Polygon
 
+# EWKB geometry type code for a Polygon carrying an SRID (wkbPolygon | SRID flag)
+EWKB_POLYGON_WITH_SRID = 0x20000003
+
+
+def generate_cells_for_resolution(geojson: dict, resolution: int) -> set:
+    """Generate H3 cells for a given geometry at specified resolution"""
+    cells = set()
+    try:
+        if geojson["type"] == "Polygon":
+            exterior = [(c[1], c[0]) for c in geojson["coordinates"][0]]
+            holes = [[(c[1], c[0]) for c in hole] for hole in geojson["coordinates"][1:]]
+            poly = h3.LatLngPoly(exterior, *holes)
+            cells = h3.polygon_to_cells(poly, resolution)
+        elif geojson["type"] == "MultiPolygon":
+            for poly_coords in geojson["coordinates"]:
+                ext = [(c[1], c[0]) for c in poly_coords[0]]
+                hls = [[(c[1], c[0]) for c in ring] for ring in poly_coords[1:]]
+                cells.update(h3.polygon_to_cells(h3.LatLngPoly(ext, *hls), resolution))
+    except Exception as e:
+        print(f"Error generating cells for resolution {resolution}: {e}")
+    return cells
+
+
 def get_h3_indices_for_polygon(geojson_polygon: Dict[str, Any], resolution: int) -> List[str]:
     """
     Returns a list of H3 indices that cover the given GeoJSON polygon.
@@ -10,20 +38,207 @@ def get_h3_indices_for_polygon(geojson_polygon: Dict[str, Any], resolution: int)
     poly = shape(geojson_polygon)
     
     # Handle both Polygon and MultiPolygon
-    if poly.geom_type == 'MultiPolygon':
-        indices = []
-        for p in poly.geoms:
-            indices.extend(h3.polyfill(mapping(p), resolution, geo_json_mode=True))
-        return list(set(indices))
-    
-    return list(h3.polyfill(geojson_polygon, resolution, geo_json_mode=True))
+    return list(generate_cells_for_resolution(mapping(poly), resolution))
 
 def h3_to_geojson(h3_index: str) -> Dict[str, Any]:
     """
     Converts an H3 index to a GeoJSON Polygon.
     """
-    coords = h3.h3_to_geo_boundary(h3_index, geo_json=True)
-    return {
-        "type": "Polygon",
-        "coordinates": [coords]
-    }
+    return mapping(cells_to_polygons([h3_index])[0])
+
+def cell_boundary_coords(cells):
+    """
+    Returns (vertex counts, flat lng/lat coordinate array) for an array of H3 cells (strings or uint64).
+    h3 has no array form of cell_to_boundary, so vertex extraction is the only per-cell step;
+    everything downstream works on the flat buffer.
+    """
+    cells = np.asarray(cells)
+    cell_to_boundary = h3_int.cell_to_boundary if cells.dtype.kind in "iu" else h3.cell_to_boundary
+    boundaries = [cell_to_boundary(cell) for cell in cells.tolist()]
+    # Pentagons and icosahedron-edge cells have 5 or more than 6 vertices, so rings are ragged
+    counts = np.fromiter((len(b) for b in boundaries), dtype=np.intp, count=len(boundaries))
+    latlng = np.fromiter(
+        chain.from_iterable(chain.from_iterable(boundaries)), dtype=np.float64, count=int(counts.sum()) * 2
+    ).reshape(-1, 2)
+    return counts, latlng[:, ::-1]
+
+def cells_to_polygons(cells) -> np.ndarray:
+    """
+    Builds lng/lat shapely Polygons for an array of H3 cells with shapely's array constructors.
+    """
+    counts, lnglat = cell_boundary_coords(cells)
+    if counts.size == 0:
+        return np.empty(0, dtype=object)
+    rings = shapely.linearrings(lnglat, indices=np.repeat(np.arange(counts.size), counts))
+    return shapely.polygons(rings)
+
+def cells_to_wkb(cells, srid: int = 4326) -> np.ndarray:
+    """
+    Converts an array of H3 cells to an array of little-endian EWKB Polygons (bytes).
+    Cells are grouped by vertex count and each group is packed as one fixed-width byte matrix,
+    which benchmarks several times faster than shapely.to_wkb on the same polygons.
+    """
+    counts, lnglat = cell_boundary_coords(cells)
+    wkbs = np.empty(counts.size, dtype=object)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.intp)
+    for n in np.unique(counts).tolist():
+        group = np.flatnonzero(counts == n)
+        ring = lnglat[offsets[group][:, None] + np.arange(n)]
+        ring = np.concatenate((ring, ring[:, :1]), axis=1)  # close the ring
+        header = np.frombuffer(struct.pack("<BIIII", 1, EWKB_POLYGON_WITH_SRID, srid, 1, n + 1), dtype=np.uint8)
+        packed = np.empty((group.size, header.size + (n + 1) * 16), dtype=np.uint8)
+        packed[:, :header.size] = header
+        packed[:, header.size:] = np.ascontiguousarray(ring, dtype="<f8").reshape(group.size, -1).view(np.uint8)
+        wkbs[group] = packed.view(f"V{packed.shape[1]}").ravel().tolist()
+    return wkbs
+
+def cells_to_bounds(cells) -> np.ndarray:
+    """
+    (n, 4) array of lng/lat bounds (min_lng, min_lat, max_lng, max_lat) for an array of H3 cells.
+    """
+    counts, lnglat = cell_boundary_coords(cells)
+    if counts.size == 0:
+        return np.empty((0, 4))
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.intp)
+    return np.hstack((np.minimum.reduceat(lnglat, offsets), np.maximum.reduceat(lnglat, offsets)))
+
+# H3 index bit layout: resolution in bits 52-55, one 3-bit digit per resolution 1..15 below it
+H3_RES_OFFSET = 52
+H3_RES_MASK = np.uint64(0xF << H3_RES_OFFSET)
+INCLUSION_RULES = ("any", "majority", "centroid")
+
+def _digit_mask(from_res: int, to_res: int) -> np.uint64:
+    """Bit mask covering the digits of resolutions from_res+1 .. to_res"""
+    return np.uint64(((1 << ((15 - from_res) * 3)) - 1) ^ ((1 << ((15 - to_res) * 3)) - 1))
+
+def parent_bitmasks(res: int) -> tuple:
+    """(and_mask, or_mask) such that (cell & and_mask) | or_mask is the parent at `res` of any finer cell"""
+    return 0x7FFFFFFFFFFFFFFF & ~(0xF << H3_RES_OFFSET), (res << H3_RES_OFFSET) | int(_digit_mask(res, 15))
+
+def cells_to_parent(cells: np.ndarray, res: int) -> np.ndarray:
+    """
+    Vectorized h3.cell_to_parent for a uint64 array of cells that are all finer than `res`.
+    """
+    cells = np.asarray(cells, dtype=np.uint64)
+    parents = (cells & ~H3_RES_MASK) | np.uint64(res << H3_RES_OFFSET)
+    return parents | _digit_mask(res, 15)
+
+def cells_to_center_child(cells: np.ndarray, parent_res: int, res: int) -> np.ndarray:
+    """
+    Vectorized h3.cell_to_center_child for a uint64 array of cells, all at `parent_res` < `res`.
+    """
+    cells = np.asarray(cells, dtype=np.uint64)
+    children = (cells & ~H3_RES_MASK) | np.uint64(res << H3_RES_OFFSET)
+    return children & ~_digit_mask(parent_res, res)
+
+def derive_coarser_levels(fine_cells: np.ndarray, fine_res: int, resolutions: List[int], rule: str = "centroid") -> Dict[int, np.ndarray]:
+    """
+    Builds every requested resolution from one polyfill at `fine_res` instead of rasterizing
+    the boundary again per level. A coarse cell is kept when:
+      any      - at least one of its fine descendants is in the set
+      majority - more than half of its fine descendants are in the set
+      centroid - the fine cell at its center is in the set (what polygon_to_cells does at that level)
+    """
+    if rule not in INCLUSION_RULES:
+        raise ValueError(f"Unknown inclusion rule: {rule}")
+    fine_cells = np.unique(np.asarray(fine_cells, dtype=np.uint64))
+    levels = {}
+    for res in sorted(resolutions, reverse=True):
+        if res >= fine_res:
+            levels[res] = fine_cells
+            continue
+        parents, child_counts = np.unique(cells_to_parent(fine_cells, res), return_counts=True)
+        if rule == "majority":
+            descendants = np.full(parents.size, 7 ** (fine_res - res), dtype=np.int64)
+            # Pentagons have one hexagon fewer per level below them
+            pentagons = np.isin(parents, h3_int.get_pentagons(res))
+            descendants[pentagons] = 1 + 5 * (7 ** (fine_res - res) - 1) // 6
+            parents = parents[child_counts * 2 > descendants]
+        elif rule == "centroid":
+            parents = parents[np.isin(cells_to_center_child(parents, res, fine_res), fine_cells)]
+        levels[res] = parents
+    return levels
+
+def cells_to_ints(cells) -> np.ndarray:
+    """H3 hex strings to a uint64 array"""
+    return np.fromiter((int(cell, 16) for cell in cells), dtype=np.uint64)
+
+def compact_cell_array(cells) -> np.ndarray:
+    """Cells deduplicated, with every complete set of siblings replaced by its parent (recursively)"""
+    return h3_int.compact_cells(np.unique(np.asarray(cells, dtype=np.uint64)))
+
+# Descendant centroids stay within ~0.15 circumradii of their ancestor hexagon at any depth;
+# tiles are buffered by more than that so clipping never loses a cell
+TILE_BUFFER_RATIO = 0.25
+
+def cell_range(tile: int, res: int) -> tuple:
+    """(lowest, highest) index of the descendants of `tile` at `res`; they form one contiguous integer range"""
+    tile_res = (tile >> H3_RES_OFFSET) & 0xF
+    digits = int(_digit_mask(tile_res, res))
+    low = (tile & ~(0xF << H3_RES_OFFSET) | (res << H3_RES_OFFSET)) & ~digits
+    return low, low | (digits & 0o666666666666666)  # every digit 6, the highest valid one
+
+def _polygon_parts(geom) -> List[Polygon]:
+    return [part for part in getattr(geom, "geoms", [geom]) if isinstance(part, Polygon) and not part.is_empty]
+
+def buffered_tile(tile: int):
+    """The tile's hexagon grown enough to contain the centroid of every descendant"""
+    hexagon = cells_to_polygons([tile])[0]
+    centroid = hexagon.centroid
+    radius = max(centroid.distance(shapely.Point(xy)) for xy in hexagon.exterior.coords)
+    return hexagon.buffer(radius * TILE_BUFFER_RATIO)
+
+def prepared_boundary(geojson: dict):
+    boundary = shape(geojson)
+    if not boundary.is_valid:
+        boundary = shapely.make_valid(boundary)
+    shapely.prepare(boundary)
+    return boundary
+
+def tile_clip(boundary, tile: int) -> tuple:
+    """
+    (touches, clip) of a tile against a prepared boundary: clip is the EWKB of the boundary inside the
+    buffered tile, or None when the buffered tile lies entirely inside it (or misses it, touches False)
+    """
+    area = buffered_tile(tile)
+    if boundary.contains(area):
+        return True, None
+    if boundary.intersects(area):
+        clip = boundary.intersection(area)
+        if _polygon_parts(clip):
+            return True, shapely.to_wkb(clip)
+    return False, None
+
+def plan_polyfill_tiles(geojson: dict, tile_res: int) -> List[tuple]:
+    """
+    Splits a boundary into H3 cells at `tile_res` for a streaming polyfill.
+    Returns (tile, clip) pairs in index order, where clip is the EWKB of the boundary inside
+    the buffered tile, or None when the buffered tile lies entirely inside the boundary.
+    """
+    boundary = prepared_boundary(geojson)
+    candidates = set()
+    for part in _polygon_parts(boundary):
+        exterior = [(c[1], c[0]) for c in part.exterior.coords]
+        holes = [[(c[1], c[0]) for c in ring.coords] for ring in part.interiors]
+        overlap = h3.polygon_to_cells_experimental(h3.LatLngPoly(exterior, *holes), tile_res, contain="overlap")
+        # Neighbours too: descendants reach slightly beyond their ancestor's hexagon
+        for cell in overlap:
+            candidates.update(h3.grid_disk(cell, 1))
+    plan = []
+    for tile in sorted(int(cell, 16) for cell in candidates):
+        touches, clip = tile_clip(boundary, tile)
+        if touches:
+            plan.append((tile, clip))
+    return plan
+
+def tile_cells(tile: int, clip, res: int) -> np.ndarray:
+    """
+    The cells at `res` whose parent is `tile` and whose centroid lies in the boundary -
+    exactly this tile's share of polygon_to_cells on the whole boundary.
+    """
+    if clip is None:
+        return h3_int.cell_to_children(tile, res)
+    clip = shapely.from_wkb(clip)
+    cells = cells_to_ints(generate_cells_for_resolution(mapping(shapely.MultiPolygon(_polygon_parts(clip))), res))
+    tile_res = (tile >> H3_RES_OFFSET) & 0xF
+    return np.sort(cells[cells_to_parent(cells, tile_res) == np.uint64(tile)]) if cells.size else cells
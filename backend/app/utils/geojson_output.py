@@ -0,0 +1,72 @@
+"""
+Coordinate precision and simplification of GeoJSON output, derived from the zoom it is drawn at.
+
+A 256 px tile at zoom z spans 360 / 2^z degrees, so a pixel is 360 / (256 * 2^z) degrees wide: coordinates
+need about one decimal more than resolves a pixel, and outlines no vertices closer than half a pixel.
+Area boundaries are also stored simplified for a few zooms (project_areas.boundary_z{zoom}), which
+Postgres recomputes whenever a boundary is written, so outline requests skip simplifying at read time.
+"""
+import math
+from typing import Optional, Tuple
+
+# ST_AsGeoJSON's own default, kept when no zoom or precision is asked for
+GEOJSON_DEFAULT_PRECISION = 9
+
+# Zooms with a stored simplified boundary; deeper zooms get the full boundary
+BOUNDARY_SIMPLIFIED_ZOOMS = (6, 10, 14)
+
+
+def pixel_degrees(zoom: float) -> float:
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def precision_for_zoom(zoom: float) -> int:
+    """Decimals that keep rounding under a tenth of a pixel"""
+    return min(GEOJSON_DEFAULT_PRECISION, max(0, math.ceil(math.log10(1 / pixel_degrees(zoom))) + 1))
+
+
+def simplify_tolerance(zoom: float) -> float:
+    return pixel_degrees(zoom) / 2
+
+
+def simplified_boundary_sql(zoom: int) -> str:
+    """Expression of the generated boundary_z{zoom} column"""
+    return f"ST_SimplifyPreserveTopology(boundary_geom, {simplify_tolerance(zoom)!r})"
+
+
+def stored_boundary_zoom(zoom: float) -> Optional[int]:
+    """Coarsest stored simplification still detailed enough for `zoom`; None means the full boundary"""
+    return next((stored for stored in BOUNDARY_SIMPLIFIED_ZOOMS if stored >= zoom), None)
+
+
+def output_precision(zoom: Optional[float], precision: Optional[int]) -> int:
+    if precision is not None:
+        return precision
+    if zoom is not None:
+        return precision_for_zoom(zoom)
+    return GEOJSON_DEFAULT_PRECISION
+
+
+def geometry_output(
+    zoom: Optional[float], precision: Optional[int], simplify: Optional[float]
+) -> Tuple[int, Optional[float]]:
+    """(precision, tolerance to simplify with) of a geometry without stored simplifications, e.g. a response"""
+    if simplify is not None:
+        return output_precision(zoom, precision), (simplify or None)
+    if zoom is not None:
+        return output_precision(zoom, precision), simplify_tolerance(zoom)
+    return output_precision(zoom, precision), None
+
+
+def boundary_output(
+    zoom: Optional[float], precision: Optional[int], simplify: Optional[float]
+) -> Tuple[int, Optional[float], Optional[int]]:
+    """
+    (precision, tolerance to simplify with at read time, stored simplification to read) of a boundary.
+    An explicit simplify tolerance wins over the stored ones; without zoom or simplify the full boundary is sent.
+    """
+    if simplify is not None:
+        return output_precision(zoom, precision), (simplify or None), None
+    if zoom is not None:
+        return output_precision(zoom, precision), None, stored_boundary_zoom(zoom)
+    return output_precision(zoom, precision), None, None
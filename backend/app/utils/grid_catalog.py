@@ -0,0 +1,100 @@
+"""
+Grid catalog: one grid_catalog row per area and stored resolution (cell count, extent, version).
+Grid jobs rewrite an area's rows once per run; request handlers read a per-process copy that is
+reloaded whenever the project's grid_version moves, so they never aggregate project_grid_cells.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    area_id: UUID
+    resolution: int
+    cell_count: int
+    bbox: Optional[Tuple[float, float, float, float]]  # (min_lng, min_lat, max_lng, max_lat)
+    grid_version: Optional[int]
+    generated_at: Optional[datetime]
+
+
+# project_id -> (grid_version, entries)
+_catalogs: Dict[UUID, Tuple[int, List[CatalogEntry]]] = {}
+
+CATALOG_AGGREGATE_SQL = """
+    INSERT INTO grid_catalog (area_id, resolution, project_id, cell_count,
+                              min_lng, min_lat, max_lng, max_lat, grid_version, generated_at)
+    SELECT c.area_id, c.resolution, a.project_id, count(*),
+           ST_XMin(ST_Extent(c.geometry)), ST_YMin(ST_Extent(c.geometry)),
+           ST_XMax(ST_Extent(c.geometry)), ST_YMax(ST_Extent(c.geometry)),
+           COALESCE(p.grid_version, 0), now()
+    FROM project_grid_cells c
+    JOIN project_areas a ON a.id = c.area_id
+    JOIN projects p ON p.id = a.project_id
+"""
+
+
+async def refresh_area_catalog(db: AsyncSession, area_id: UUID):
+    """Rewrite an area's catalog rows from its stored cells; committed by the caller after the version bump"""
+    await db.execute(text("DELETE FROM grid_catalog WHERE area_id = :area_id"), {"area_id": area_id})
+    await db.execute(text(f"""
+        {CATALOG_AGGREGATE_SQL}
+        WHERE c.area_id = :area_id
+        GROUP BY c.area_id, c.resolution, a.project_id, p.grid_version
+    """), {"area_id": area_id})
+
+
+async def project_catalog(db: AsyncSession, project_id: UUID, grid_version: Optional[int] = None) -> List[CatalogEntry]:
+    """All catalog entries of a project; pass grid_version when the caller already looked it up"""
+    if grid_version is None:
+        result = await db.execute(
+            text("SELECT COALESCE(grid_version, 0) FROM projects WHERE id = :project_id"),
+            {"project_id": project_id}
+        )
+        grid_version = result.scalar() or 0
+    cached = _catalogs.get(project_id)
+    if cached is not None and cached[0] == grid_version:
+        return cached[1]
+
+    result = await db.execute(text("""
+        SELECT area_id, resolution, cell_count, min_lng, min_lat, max_lng, max_lat, grid_version, generated_at
+        FROM grid_catalog WHERE project_id = :project_id
+        ORDER BY resolution, area_id
+    """), {"project_id": project_id})
+    entries = [
+        CatalogEntry(
+            area_id=row.area_id,
+            resolution=row.resolution,
+            cell_count=row.cell_count,
+            bbox=(row.min_lng, row.min_lat, row.max_lng, row.max_lat) if row.min_lng is not None else None,
+            grid_version=row.grid_version,
+            generated_at=row.generated_at
+        ) for row in result.all()
+    ]
+    _catalogs[project_id] = (grid_version, entries)
+    return entries
+
+
+async def area_catalog(db: AsyncSession, area_id: UUID) -> List[CatalogEntry]:
+    result = await db.execute(text("""
+        SELECT a.project_id, COALESCE(p.grid_version, 0) AS grid_version
+        FROM project_areas a JOIN projects p ON p.id = a.project_id
+        WHERE a.id = :area_id
+    """), {"area_id": area_id})
+    row = result.first()
+    if row is None:
+        return []
+    entries = await project_catalog(db, row.project_id, row.grid_version)
+    return [entry for entry in entries if entry.area_id == area_id]
+
+
+def resolution_counts(entries: List[CatalogEntry], area_id: Optional[UUID] = None) -> Dict[int, int]:
+    """Stored cells per resolution, summed over areas (or for one area)"""
+    counts = {}
+    for entry in entries:
+        if area_id is None or entry.area_id == area_id:
+            counts[entry.resolution] = counts.get(entry.resolution, 0) + entry.cell_count
+    return dict(sorted(counts.items()))
@@ -0,0 +1,527 @@
+"""
+Durable grid generation jobs.
+
+Jobs live in the grid_jobs table. Any process running a worker loop (the in-process worker started
+by main.py, or `python -m app.utils.grid_jobs`) claims PENDING jobs - and RUNNING jobs whose heartbeat
+went stale - with FOR UPDATE SKIP LOCKED, so a job is never tied to the HTTP request that created it
+or to a single uvicorn worker.
+
+Fine resolutions are generated tile by tile (an H3 cell GRID_TILE_DEPTH levels above the finest
+resolution), so peak memory stays the same however large the area is. Every level is written as a diff
+against the stored cells and every COPY chunk commits on its own, so an interrupted job resumes from its
+last committed batch: finished resolutions and tiles are skipped and the current tile only receives the
+cells that are still missing.
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import traceback
+from typing import AsyncIterator, Dict, List, Optional
+from uuid import UUID
+from sqlalchemy import func, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.database import AsyncSessionLocal
+from app.models.project import GridJob, ProjectArea
+from app.utils.grid_loader import load_grid_cells
+from app.utils.geo import cell_range, plan_polyfill_tiles
+from app.utils.grid_store import (
+    fetch_stored_cells, fetch_stored_range, fetch_stored_resolutions, find_response_cells, dropped_cells_report,
+    delete_cells, delete_cells_outside_tiles, delete_resolution, clear_cells
+)
+from app.utils.tile_cache import bump_grid_version
+from app.utils.versions import bump_area_version
+from app.utils.grid_catalog import refresh_area_catalog
+from app.utils.tile_archive import build_tile_archive, TILE_ARCHIVE_DIR
+from app.utils.grid_workers import (
+    start_polyfills, iter_cell_row_chunks, iter_tile_levels, cancel_pending, run_in_pool, tile_resolution,
+    GRID_GENERATION_MODE, GRID_INCLUSION_RULE
+)
+
+# "inprocess" runs worker loops inside the API process, "off" leaves jobs to `python -m app.utils.grid_jobs`
+GRID_JOB_WORKER = os.getenv("GRID_JOB_WORKER", "inprocess")
+GRID_JOB_CONCURRENCY = int(os.getenv("GRID_JOB_CONCURRENCY", "1"))
+GRID_JOB_POLL_SECONDS = float(os.getenv("GRID_JOB_POLL_SECONDS", "5"))
+GRID_JOB_HEARTBEAT_SECONDS = float(os.getenv("GRID_JOB_HEARTBEAT_SECONDS", "10"))
+# A RUNNING job without a heartbeat for this long is considered interrupted and gets resumed
+GRID_JOB_STALE_SECONDS = float(os.getenv("GRID_JOB_STALE_SECONDS", "60"))
+# An interrupted job is resumed at most this many times; one that keeps killing its worker is failed instead
+GRID_JOB_MAX_ATTEMPTS = int(os.getenv("GRID_JOB_MAX_ATTEMPTS", "3"))
+
+ACTIVE_STATUSES = ("PENDING", "RUNNING", "CANCELLING")
+FINAL_STATUSES = ("SUCCESS", "FAILED", "CANCELLED")
+CANCEL_STATUSES = ("CANCELLING", "CANCELLED")
+
+_wakeup = asyncio.Event()
+_worker_tasks = []
+# project_id -> archive build running in the background, and projects whose grid changed again meanwhile
+_archive_tasks: Dict[UUID, asyncio.Task] = {}
+_archive_rebuilds = set()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class ActiveJobConflict(Exception):
+    """The grid already has an active job with different parameters"""
+
+    def __init__(self, job: GridJob):
+        super().__init__(f"Grid already has an active job: {job.id}")
+        self.job = job
+
+
+def job_to_dict(job: GridJob) -> dict:
+    return {
+        "id": str(job.id),
+        "project_id": str(job.project_id),
+        "area_id": str(job.area_id) if job.area_id else None,
+        "status": job.status,
+        "params": job.params,
+        "current_resolution": job.current_resolution,
+        "completed_resolutions": (job.state or {}).get("completed_resolutions", []),
+        "tiles_completed": (job.state or {}).get("tiles_completed", 0),
+        "tiles_total": (job.state or {}).get("tiles_total"),
+        "timings": (job.state or {}).get("timings", {}),
+        "cells_written": job.cells_written,
+        "cells_removed": job.cells_removed,
+        "progress": job.progress,
+        "message": job.message,
+        "error": job.error,
+        "result": job.result,
+        "attempts": job.attempts,
+        "worker_id": job.worker_id,
+        "heartbeat_at": job.heartbeat_at.isoformat() if job.heartbeat_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None
+    }
+
+
+# ==================== ENQUEUE ====================
+
+async def find_active_job(db: AsyncSession, project_id: UUID, area_id: UUID) -> Optional[GridJob]:
+    query = select(GridJob).where(
+        GridJob.project_id == project_id, GridJob.area_id == area_id, GridJob.status.in_(ACTIVE_STATUSES)
+    )
+    result = await db.execute(query.order_by(GridJob.created_at).limit(1))
+    return result.scalar_one_or_none()
+
+
+async def enqueue_grid_job(db: AsyncSession, project_id: UUID, area_id: UUID, params: dict) -> GridJob:
+    """
+    Create a PENDING job for one grid. Two jobs writing the same cells would race each other, so if the
+    grid already has an active job it is returned when it was queued with the same params, and
+    ActiveJobConflict is raised otherwise.
+    """
+    existing = await find_active_job(db, project_id, area_id)
+    if existing:
+        if existing.params != params:
+            raise ActiveJobConflict(existing)
+        return existing
+
+    job = GridJob(
+        project_id=project_id,
+        area_id=area_id,
+        status="PENDING",
+        params=params,
+        state={},
+        message="Grid üretimi sırada bekliyor",
+        progress=0
+    )
+    db.add(job)
+    # Cells start changing once the job runs; cached tiles of the old grid must not outlive it
+    await bump_grid_version(db, project_id)
+    await bump_area_version(db, project_id, area_id)
+    await db.commit()
+    await db.refresh(job)
+    notify_workers()
+    return job
+
+
+def notify_workers():
+    """Wake this process' idle worker loops; other processes pick the job up on their next poll"""
+    _wakeup.set()
+
+
+# ==================== EXECUTION ====================
+
+async def fail_exhausted_jobs(db: AsyncSession):
+    """
+    Stale jobs that already used up GRID_JOB_MAX_ATTEMPTS are not resumed again: they end FAILED, or
+    CANCELLED when a cancel was pending. Their partial cells are published like any other ended run.
+    """
+    result = await db.execute(text("""
+        UPDATE grid_jobs
+        SET status = CASE WHEN status = 'CANCELLING' THEN 'CANCELLED' ELSE 'FAILED' END,
+            finished_at = now(),
+            error = CASE WHEN status = 'CANCELLING' THEN error ELSE :error END,
+            message = CASE WHEN status = 'CANCELLING' THEN 'İş iptal edildi' ELSE :error END
+        WHERE id IN (
+            SELECT id FROM grid_jobs
+            WHERE status IN ('RUNNING', 'CANCELLING') AND heartbeat_at < now() - make_interval(secs => :stale)
+              AND attempts >= :max_attempts
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING project_id, area_id
+    """), {
+        "stale": GRID_JOB_STALE_SECONDS,
+        "max_attempts": GRID_JOB_MAX_ATTEMPTS,
+        "error": f"İş {GRID_JOB_MAX_ATTEMPTS} denemede tamamlanamadı"
+    })
+    for project_id, area_id in result.all():
+        await publish_grid(db, project_id, area_id)
+    await db.commit()
+
+
+async def claim_job(worker_id: str) -> Optional[UUID]:
+    """
+    Atomically take the oldest runnable job; SKIP LOCKED keeps concurrent workers apart.
+    A stale CANCELLING job stays CANCELLING, so its run stops at the first progress save.
+    """
+    async with AsyncSessionLocal() as db:
+        await fail_exhausted_jobs(db)
+        result = await db.execute(text("""
+            UPDATE grid_jobs
+            SET status = CASE WHEN status = 'CANCELLING' THEN 'CANCELLING' ELSE 'RUNNING' END,
+                worker_id = :worker_id, heartbeat_at = now(),
+                started_at = COALESCE(started_at, now()), attempts = attempts + 1
+            WHERE id = (
+                SELECT id FROM grid_jobs
+                WHERE status = 'PENDING'
+                   OR (status IN ('RUNNING', 'CANCELLING') AND heartbeat_at < now() - make_interval(secs => :stale))
+                ORDER BY created_at
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id
+        """), {"worker_id": worker_id, "stale": GRID_JOB_STALE_SECONDS})
+        job_id = result.scalar()
+        await db.commit()
+        return job_id
+
+
+async def _heartbeat(job_id: UUID):
+    while True:
+        await asyncio.sleep(GRID_JOB_HEARTBEAT_SECONDS)
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(GridJob).where(GridJob.id == job_id).values(heartbeat_at=func.now()))
+            await db.commit()
+
+
+async def _save(db: AsyncSession, job_id: UUID, **values):
+    """
+    Persist job progress; raises JobCancelled when a cancel was requested meanwhile. A cancelled row is
+    never written, so a final SUCCESS cannot overwrite a cancel that landed while the job was claimed.
+    """
+    result = await db.execute(
+        update(GridJob).where(GridJob.id == job_id, GridJob.status.notin_(CANCEL_STATUSES))
+        .values(heartbeat_at=func.now(), **values)
+        .returning(GridJob.status)
+    )
+    status = result.scalar()
+    await db.commit()
+    if status is None:
+        raise JobCancelled()
+
+
+async def _load_boundary_geojson(db: AsyncSession, area_id: UUID) -> Optional[dict]:
+    result = await db.execute(select(func.ST_AsGeoJSON(ProjectArea.boundary_geom)).where(ProjectArea.id == area_id))
+    geojson_str = result.scalar()
+    return json.loads(geojson_str) if geojson_str else None
+
+
+async def publish_grid(db: AsyncSession, project_id: UUID, area_id: UUID):
+    """A run touched the area's cells (even a failed one): new grid version and a fresh catalog, committed by the caller"""
+    await bump_grid_version(db, project_id)
+    await bump_area_version(db, project_id, area_id)
+    await refresh_area_catalog(db, area_id)
+
+
+async def build_project_archive(db: AsyncSession, project_id: UUID):
+    """Render the project's PMTiles archive once no other job of the project is still changing cells"""
+    result = await db.execute(select(func.count()).select_from(GridJob).where(
+        GridJob.project_id == project_id, GridJob.status.in_(ACTIVE_STATUSES)
+    ))
+    if result.scalar():
+        return
+    try:
+        await build_tile_archive(db, project_id)
+    except Exception as e:
+        # The grid itself is done; without an archive clients keep using the live tile endpoint
+        print(f"Tile archive build failed for project {project_id}: {e}")
+
+
+async def _archive_loop(project_id: UUID):
+    try:
+        while True:
+            _archive_rebuilds.discard(project_id)
+            async with AsyncSessionLocal() as db:
+                await build_project_archive(db, project_id)
+            if project_id not in _archive_rebuilds:
+                return
+    finally:
+        _archive_tasks.pop(project_id, None)
+
+
+def schedule_project_archive(project_id: UUID):
+    """
+    Build the project's archive in the background, so the worker moves on to the next job right away.
+    A build requested while one is running for the project runs once more after it.
+    """
+    if not TILE_ARCHIVE_DIR:
+        return
+    task = _archive_tasks.get(project_id)
+    if task is not None and not task.done():
+        _archive_rebuilds.add(project_id)
+        return
+    _archive_tasks[project_id] = asyncio.ensure_future(_archive_loop(project_id))
+
+
+async def run_job(job_id: UUID):
+    async with AsyncSessionLocal() as db:
+        job = await db.get(GridJob, job_id)
+        project_id, area_id = job.project_id, job.area_id
+        params = dict(job.params or {})
+        state = dict(job.state or {})
+        resolutions = sorted(params.get("resolutions", []))
+        completed = list(state.get("completed_resolutions", []))
+        timings = dict(state.get("timings", {}))
+        dropped = list(state.get("dropped_response_cells", []))
+        cells_written = job.cells_written or 0
+        cells_removed = job.cells_removed or 0
+        resumed = bool(completed) or state.get("cleared", False)
+
+        async def apply_diff(res: int, cells: List[int], stored: set):
+            """Delete stored cells that are gone and load the missing ones"""
+            nonlocal cells_written, cells_removed
+            removed = sorted(stored - set(cells))
+            added = [cell for cell in cells if cell not in stored]
+            if removed:
+                dropped.extend(dropped_cells_report(await find_response_cells(db, project_id, removed), res))
+                await delete_cells(db, area_id, res, removed)
+                cells_removed += len(removed)
+            written_before = cells_written
+            async for loaded in load_grid_cells(db, area_id, res, iter_cell_row_chunks(added)):
+                cells_written = written_before + loaded
+
+        heartbeat = asyncio.ensure_future(_heartbeat(job_id))
+        polyfills = {}
+        try:
+            geojson = await _load_boundary_geojson(db, area_id)
+            if not geojson:
+                raise ValueError("Alan veya sınır bulunamadı")
+
+            await _save(db, job_id, message=(
+                f"İş kaldığı yerden devam ediyor ({len(completed)}/{len(resolutions)} çözünürlük tamam)"
+                if resumed else f"Geometri işleniyor: {geojson['type']}"
+            ), progress=max(job.progress or 0, 5))
+
+            mode = params.get("mode", GRID_GENERATION_MODE)
+            rule = params.get("inclusion", GRID_INCLUSION_RULE)
+            # Levels at or above the tile resolution stream tile by tile; coarser ones are small enough to fill whole
+            tile_res = tile_resolution(resolutions)
+            coarse_levels = [res for res in resolutions if res < tile_res]
+            tiled_levels = [res for res in resolutions if res >= tile_res]
+            plan = await run_in_pool(plan_polyfill_tiles, geojson, tile_res)
+            state["tiles_total"] = len(plan)
+
+            if not state.get("cleared"):
+                if params.get("incremental"):
+                    # Only drop resolutions that are no longer part of the configuration
+                    for res in await fetch_stored_resolutions(db, area_id):
+                        if res not in resolutions:
+                            stale_cells = sorted(await fetch_stored_cells(db, area_id, res))
+                            dropped.extend(dropped_cells_report(await find_response_cells(db, project_id, stale_cells), res))
+                            cells_removed += len(stale_cells)
+                            await delete_resolution(db, area_id, res)
+                    # Tiles the new boundary no longer touches are never visited below
+                    tiles = [tile for tile, _ in plan]
+                    for res in tiled_levels:
+                        outside = await delete_cells_outside_tiles(db, area_id, res, tile_res, tiles)
+                        dropped.extend(dropped_cells_report(await find_response_cells(db, project_id, outside), res))
+                        cells_removed += len(outside)
+                    message = "Mevcut gridler yeni sınırla karşılaştırılıyor"
+                else:
+                    await clear_cells(db, area_id)
+                    message = "Bu alan için mevcut gridler temizlendi"
+                state["cleared"] = True
+                state["dropped_response_cells"] = dropped
+                await _save(db, job_id, state=state, cells_removed=cells_removed, message=message, progress=10)
+
+            # Hierarchical levels are always derived from the full list so a resumed job gets exactly the same cells
+            targets = coarse_levels if mode == "hierarchical" else [r for r in coarse_levels if r not in completed]
+            polyfills = start_polyfills(geojson, targets, mode, rule)
+            for res in coarse_levels:
+                if res in completed:
+                    continue
+                started = time.monotonic()
+                cells = await polyfills[res]
+                await apply_diff(res, cells, await fetch_stored_cells(db, area_id, res))
+                completed.append(res)
+                timings[str(res)] = round(time.monotonic() - started, 3)
+                state.update(completed_resolutions=completed, timings=timings, dropped_response_cells=dropped)
+                await _save(
+                    db, job_id,
+                    state=state,
+                    current_resolution=res,
+                    cells_written=cells_written,
+                    cells_removed=cells_removed,
+                    message=f"Çözünürlük {res}: {len(cells)} hücre",
+                    progress=15
+                )
+
+            tiles_completed = state.get("tiles_completed", 0)
+            last_saved = time.monotonic()
+            async for index, levels in iter_tile_levels(plan, tiled_levels, mode, rule, start=tiles_completed):
+                tile = plan[index][0]
+                for res in tiled_levels:
+                    started = time.monotonic()
+                    low, high = cell_range(tile, res)
+                    await apply_diff(res, levels[res], await fetch_stored_range(db, area_id, res, low, high))
+                    timings[str(res)] = round(timings.get(str(res), 0) + time.monotonic() - started, 3)
+                tiles_completed = index + 1
+                state.update(tiles_completed=tiles_completed, timings=timings, dropped_response_cells=dropped)
+                if time.monotonic() - last_saved > 2 or tiles_completed == len(plan):
+                    await _save(
+                        db, job_id,
+                        state=state,
+                        current_resolution=max(tiled_levels),
+                        cells_written=cells_written,
+                        cells_removed=cells_removed,
+                        message=f"Karo {tiles_completed}/{len(plan)}: {cells_written} hücre yüklendi...",
+                        progress=15 + int(tiles_completed / len(plan) * 80)
+                    )
+                    last_saved = time.monotonic()
+
+            completed = sorted(set(completed) | set(tiled_levels))
+            state.update(completed_resolutions=completed, timings=timings, dropped_response_cells=dropped)
+            await _save(db, job_id, state=state, cells_written=cells_written, cells_removed=cells_removed)
+
+            await db.execute(update(ProjectArea).where(ProjectArea.id == area_id).values(
+                grids_generated=True, virtual_resolutions=params.get("virtual_resolutions", [])
+            ))
+            await publish_grid(db, project_id, area_id)
+            await db.commit()
+
+            result = {
+                "count": cells_written,
+                "removed_count": cells_removed,
+                "resolutions_created": resolutions,
+                "dropped_response_cells": dropped,
+                "timings": timings
+            }
+            await _save(
+                db, job_id,
+                status="SUCCESS",
+                progress=100,
+                result=result,
+                finished_at=func.now(),
+                message=f"{len(resolutions)} çözünürlük için toplam {cells_written} hücre oluşturuldu"
+                + (f", {cells_removed} hücre silindi" if cells_removed else "")
+            )
+            schedule_project_archive(project_id)
+        except JobCancelled:
+            await db.rollback()
+            await db.execute(update(GridJob).where(GridJob.id == job_id).values(
+                status="CANCELLED", finished_at=func.now(), message="İş iptal edildi"
+            ))
+            await publish_grid(db, project_id, area_id)
+            await db.commit()
+        except asyncio.CancelledError:
+            # Worker shutdown: leave the job RUNNING; once its heartbeat is stale another worker resumes it
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            await db.rollback()
+            await db.execute(update(GridJob).where(GridJob.id == job_id).values(
+                status="FAILED", error=str(e), finished_at=func.now(), message=f"Grid üretimi başarısız: {e}"
+            ))
+            await publish_grid(db, project_id, area_id)
+            await db.commit()
+        finally:
+            heartbeat.cancel()
+            cancel_pending(polyfills.values())
+
+
+async def worker_loop(worker_id: str):
+    print(f"Grid job worker {worker_id} started")
+    while True:
+        try:
+            job_id = await claim_job(worker_id)
+        except Exception as e:
+            print(f"Grid job claim failed: {e}")
+            job_id = None
+        if job_id:
+            await run_job(job_id)
+            continue
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=GRID_JOB_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_job_workers():
+    if GRID_JOB_WORKER != "inprocess" or AsyncSessionLocal is None or _worker_tasks:
+        return
+    base_id = f"{socket.gethostname()}:{os.getpid()}"
+    for n in range(GRID_JOB_CONCURRENCY):
+        _worker_tasks.append(asyncio.ensure_future(worker_loop(f"{base_id}:{n}")))
+
+
+async def stop_job_workers():
+    # An unfinished archive build is dropped; the project's next successful job builds it again
+    tasks = _worker_tasks + list(_archive_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _worker_tasks.clear()
+
+
+# ==================== PROGRESS STREAMING ====================
+
+async def poll_job(job_id: UUID, interval: float = 1.0) -> AsyncIterator[dict]:
+    """Yield the job as a dict whenever its progress changes, until it reaches a final status"""
+    last_seen = None
+    while True:
+        async with AsyncSessionLocal() as db:
+            job = await db.get(GridJob, job_id)
+            if not job:
+                return
+            snapshot = job_to_dict(job)
+        fingerprint = (snapshot["status"], snapshot["progress"], snapshot["message"], snapshot["cells_written"])
+        if fingerprint != last_seen:
+            last_seen = fingerprint
+            yield snapshot
+        if snapshot["status"] in FINAL_STATUSES:
+            return
+        await asyncio.sleep(interval)
+
+
+async def stream_job_ndjson(job_id: UUID) -> AsyncIterator[str]:
+    """
+    The NDJSON progress protocol of the old inline generators, fed from the job row.
+    Closing this stream does not affect the job.
+    """
+    async for job in poll_job(job_id):
+        if job["status"] == "SUCCESS":
+            yield json.dumps({"status": "success", "message": job["message"], "progress": 100, "job_id": job["id"], **(job["result"] or {})}) + "\n"
+        elif job["status"] in ("FAILED", "CANCELLED"):
+            yield json.dumps({"status": "error", "message": job["error"] or job["message"], "job_id": job["id"]}) + "\n"
+        else:
+            yield json.dumps({
+                "status": "processing",
+                "message": job["message"],
+                "progress": job["progress"],
+                "job_id": job["id"],
+                "resolutions": job["params"].get("resolutions"),
+                "cells_written": job["cells_written"]
+            }) + "\n"
+
+
+if __name__ == "__main__":
+    # Standalone worker process: python -m app.utils.grid_jobs
+    asyncio.run(worker_loop(f"{socket.gethostname()}:{os.getpid()}:standalone"))
@@ -0,0 +1,109 @@
+import os
+from itertools import islice
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Tuple
+from uuid import UUID
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from geoalchemy2.elements import WKBElement
+from app.database import engine
+from app.models.project import ProjectGridCell
+
+# "copy" streams cells with the asyncpg binary COPY protocol, "insert" uses the batched INSERT fallback
+GRID_LOADER = os.getenv("GRID_LOADER", "copy")
+INSERT_BATCH_SIZE = 2000
+
+GRID_CELL_COLUMNS = ["area_id", "resolution", "h3", "geometry"]
+
+# (h3 as int, EWKB polygon) pairs as produced by app.utils.geo.cells_to_wkb;
+# loaders consume them as an async stream of chunks (see app.utils.grid_workers)
+CellRow = Tuple[int, bytes]
+
+
+def chunked(iterable: Iterable, size: int) -> Iterable[List]:
+    """Split an iterable into lists of at most `size` items without materializing it"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def use_copy_loader() -> bool:
+    """COPY needs a raw asyncpg connection; anything else goes through the INSERT path"""
+    return GRID_LOADER == "copy" and engine is not None and engine.dialect.driver == "asyncpg"
+
+
+async def _copy_chunk(pg_conn, area_id, resolution: int, chunk: List[CellRow]):
+    await pg_conn.copy_records_to_table(
+        "project_grid_cells",
+        records=[(area_id, resolution, h3, wkb) for h3, wkb in chunk],
+        columns=GRID_CELL_COLUMNS
+    )
+
+
+async def copy_grid_cells(
+    area_id: UUID,
+    resolution: int,
+    chunks: AsyncIterable[List[CellRow]]
+) -> AsyncIterator[int]:
+    """
+    Stream one resolution into project_grid_cells with binary COPY, one COPY and transaction per chunk,
+    so every chunk is durable once yielded and a resumed job only redoes the chunk it was on.
+    Yields the running number of cells written after every chunk.
+    """
+    async with engine.connect() as conn:
+        raw_conn = await conn.get_raw_connection()
+        pg_conn = raw_conn.driver_connection
+
+        # Send geometry as raw EWKB; PostGIS' binary receive function accepts it as-is
+        await pg_conn.set_type_codec(
+            "geometry", schema="public", encoder=bytes, decoder=bytes, format="binary"
+        )
+        try:
+            loaded = 0
+            async for chunk in chunks:
+                async with pg_conn.transaction():
+                    await _copy_chunk(pg_conn, area_id, resolution, chunk)
+                loaded += len(chunk)
+                yield loaded
+        finally:
+            await pg_conn.reset_type_codec("geometry", schema="public")
+
+
+async def insert_grid_cells(
+    db: AsyncSession,
+    area_id: UUID,
+    resolution: int,
+    chunks: AsyncIterable[List[CellRow]]
+) -> AsyncIterator[int]:
+    """Fallback loader: batched INSERTs committed per batch. Yields the running count."""
+    loaded = 0
+    async for chunk in chunks:
+        for batch in chunked(chunk, INSERT_BATCH_SIZE):
+            await db.execute(insert(ProjectGridCell), [
+                {
+                    "area_id": area_id,
+                    "resolution": resolution,
+                    "h3": h3,
+                    "geometry": WKBElement(wkb, srid=4326, extended=True)
+                } for h3, wkb in batch
+            ])
+            await db.commit()
+            loaded += len(batch)
+            yield loaded
+
+
+async def load_grid_cells(
+    db: AsyncSession,
+    area_id: UUID,
+    resolution: int,
+    chunks: AsyncIterable[List[CellRow]]
+) -> AsyncIterator[int]:
+    """Write one resolution's cells with the configured loader, committing per chunk and yielding the running count"""
+    if use_copy_loader():
+        source = copy_grid_cells(area_id, resolution, chunks)
+    else:
+        source = insert_grid_cells(db, area_id, resolution, chunks)
+    async for loaded in source:
+        yield loaded
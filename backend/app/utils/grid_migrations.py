@@ -0,0 +1,101 @@
+"""
+One-off schema migrations for grid storage, run from main.py's startup inside its DDL transaction.
+"""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.models.project import ProjectGridCell
+from app.utils.grid_store import h3_index_to_bigint_sql, PROJECT_BOUNDARY_AREA_NAME
+from app.utils.grid_catalog import CATALOG_AGGREGATE_SQL
+from app.utils.geojson_output import BOUNDARY_SIMPLIFIED_ZOOMS, simplified_boundary_sql
+
+
+async def migrate_grid_cells_to_bigint(conn: AsyncConnection):
+    """
+    Rewrite a project_grid_cells table from the old layout (UUID id, project_id, h3_index VARCHAR,
+    created_at) into the (area_id, resolution, h3 BIGINT) layout. Legacy project-level cells
+    (area_id NULL) move into the project's boundary area, which is created for them.
+    Does nothing once the table has been migrated.
+    """
+    legacy = await conn.execute(text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'project_grid_cells' AND column_name = 'h3_index'
+    """))
+    if not legacy.scalar():
+        return
+
+    print("Migrating project_grid_cells to BIGINT H3 storage...")
+    await conn.execute(text("""
+        INSERT INTO project_areas (project_id, name, boundary_geom, min_cell_area_km2, max_cell_area_km2,
+                                   num_resolutions, grids_generated, is_project_boundary)
+        SELECT p.id, :name, p.boundary_geom, 0.0003, 5.0, 8, true, true
+        FROM projects p
+        WHERE EXISTS (SELECT 1 FROM project_grid_cells c WHERE c.project_id = p.id AND c.area_id IS NULL)
+          AND NOT EXISTS (SELECT 1 FROM project_areas a WHERE a.project_id = p.id AND a.is_project_boundary)
+    """), {"name": PROJECT_BOUNDARY_AREA_NAME})
+
+    # Free the old table's index names before the new table claims them
+    await conn.execute(text("ALTER TABLE project_grid_cells RENAME TO project_grid_cells_legacy"))
+    await conn.execute(text("ALTER TABLE project_grid_cells_legacy RENAME CONSTRAINT project_grid_cells_pkey TO project_grid_cells_legacy_pkey"))
+    await conn.execute(text("DROP INDEX IF EXISTS idx_project_grid_cells_geometry"))
+    await conn.run_sync(ProjectGridCell.__table__.create)
+
+    result = await conn.execute(text(f"""
+        INSERT INTO project_grid_cells (area_id, resolution, h3, geometry)
+        SELECT COALESCE(c.area_id, a.id), c.resolution, {h3_index_to_bigint_sql("c.h3_index")}, c.geometry
+        FROM project_grid_cells_legacy c
+        LEFT JOIN project_areas a
+          ON c.area_id IS NULL AND a.project_id = c.project_id AND a.is_project_boundary
+        WHERE COALESCE(c.area_id, a.id) IS NOT NULL AND {h3_index_to_bigint_sql("c.h3_index")} IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """))
+    await conn.execute(text("DROP TABLE project_grid_cells_legacy"))
+
+    # Queued project-level jobs have no area to write to anymore
+    await conn.execute(text("""
+        UPDATE grid_jobs
+        SET status = 'FAILED', finished_at = now(), error = 'Grid depolama şeması değişti; işi yeniden başlatın'
+        WHERE area_id IS NULL AND status IN ('PENDING', 'RUNNING', 'CANCELLING')
+    """))
+    print(f"Migrated {result.rowcount} grid cells")
+
+
+async def backfill_grid_catalog(conn: AsyncConnection):
+    """Build grid_catalog rows for grids generated before the catalog existed; a no-op afterwards"""
+    result = await conn.execute(text("""
+        SELECT a.id FROM project_areas a
+        WHERE NOT EXISTS (SELECT 1 FROM grid_catalog g WHERE g.area_id = a.id)
+          AND EXISTS (SELECT 1 FROM project_grid_cells c WHERE c.area_id = a.id)
+    """))
+    missing = [row[0] for row in result.all()]
+    if not missing:
+        return
+    print(f"Building grid catalog for {len(missing)} areas...")
+    await conn.execute(text(f"""
+        {CATALOG_AGGREGATE_SQL}
+        WHERE c.area_id = ANY(:area_ids)
+        GROUP BY c.area_id, c.resolution, a.project_id, p.grid_version
+    """), {"area_ids": missing})
+
+
+async def add_mercator_geometry(conn: AsyncConnection):
+    """Add the generated geom_3857 column to a project_grid_cells table created before it existed"""
+    exists = await conn.execute(text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'project_grid_cells' AND column_name = 'geom_3857'
+    """))
+    if exists.scalar():
+        return
+    print("Adding Web Mercator geometry to project_grid_cells (rewrites the table)...")
+    await conn.execute(text("""
+        ALTER TABLE project_grid_cells ADD COLUMN geom_3857 geometry(POLYGON, 3857)
+        GENERATED ALWAYS AS (ST_Transform(geometry, 3857)) STORED
+    """))
+
+
+async def add_simplified_boundaries(conn: AsyncConnection):
+    """Add the generated boundary_z{zoom} outline columns to a project_areas table created before them"""
+    for zoom in BOUNDARY_SIMPLIFIED_ZOOMS:
+        await conn.execute(text(f"""
+            ALTER TABLE project_areas ADD COLUMN IF NOT EXISTS boundary_z{zoom} geometry(GEOMETRY, 4326)
+            GENERATED ALWAYS AS ({simplified_boundary_sql(zoom)}) STORED
+        """))
@@ -0,0 +1,175 @@
+from typing import List, Optional
+from uuid import UUID
+from sqlalchemy import func, delete, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.utils.geo import parent_bitmasks
+from app.utils.versions import bump_area_version
+from app.models.project import Project, ProjectArea, ProjectGridCell, StakeholderResponse
+
+DELETE_BATCH_SIZE = 5000
+
+
+def h3_to_int(h3_index: str) -> int:
+    """API string form -> stored BIGINT form"""
+    return int(h3_index, 16)
+
+
+def h3_to_str(h3: int) -> str:
+    """Stored BIGINT form -> API string form"""
+    return format(h3, "x")
+
+
+# SQL expression returning a cell's API string form; to_hex drops leading zeros exactly like h3's own strings
+H3_INDEX_SQL = "to_hex(h3) AS h3_index"
+
+
+def h3_index_to_bigint_sql(column: str) -> str:
+    """SQL expression parsing an H3 string column into the stored BIGINT form (NULL if it is not a hex index)"""
+    return f"CASE WHEN {column} ~ '^[0-9a-fA-F]{{1,16}}$' THEN ('x' || lpad({column}, 16, '0'))::bit(64)::bigint END"
+
+
+# Raw SQL counterpart of grid_scope(project_id) for text() queries
+PROJECT_CELLS_SQL = "area_id IN (SELECT id FROM project_areas WHERE project_id = CAST(:project_id AS UUID))"
+
+PROJECT_BOUNDARY_AREA_NAME = "Proje Sınırı"
+
+
+def grid_scope(project_id: UUID, area_id: Optional[UUID] = None):
+    """WHERE clause for one area's cells, or all of a project's cells through its areas"""
+    if area_id is not None:
+        return ProjectGridCell.area_id == area_id
+    return ProjectGridCell.area_id.in_(select(ProjectArea.id).where(ProjectArea.project_id == project_id))
+
+
+async def get_project_boundary_area(
+    db: AsyncSession,
+    project: Project,
+    min_cell_area_km2: float,
+    max_cell_area_km2: float,
+    num_resolutions: int,
+    num_virtual_resolutions: int = 0
+) -> ProjectArea:
+    """
+    The area that holds the grid of the project's own boundary (the legacy project-level grid).
+    Created on first use and kept in sync with Project.boundary_geom and the requested configuration.
+    Changes are only flushed; the caller commits them once the generation is accepted.
+    """
+    result = await db.execute(
+        select(ProjectArea).where(ProjectArea.project_id == project.id, ProjectArea.is_project_boundary == True)
+    )
+    area = result.scalars().first()
+    if not area:
+        area = ProjectArea(project_id=project.id, name=PROJECT_BOUNDARY_AREA_NAME, is_project_boundary=True)
+        db.add(area)
+    area.boundary_geom = project.boundary_geom
+    area.min_cell_area_km2 = min_cell_area_km2
+    area.max_cell_area_km2 = max_cell_area_km2
+    area.num_resolutions = num_resolutions
+    area.num_virtual_resolutions = num_virtual_resolutions
+    await db.flush()
+    await bump_area_version(db, project.id, area.id)
+    return area
+
+
+async def fetch_stored_cells(db: AsyncSession, area_id: UUID, resolution: int) -> set:
+    """H3 cells (ints) currently stored for one area/resolution"""
+    result = await db.execute(
+        select(ProjectGridCell.h3).where(
+            ProjectGridCell.area_id == area_id,
+            ProjectGridCell.resolution == resolution
+        )
+    )
+    return {row[0] for row in result.all()}
+
+
+async def fetch_stored_range(db: AsyncSession, area_id: UUID, resolution: int, low: int, high: int) -> set:
+    """Stored cells of one area/resolution inside an index range (one tile, see app.utils.geo.cell_range)"""
+    result = await db.execute(
+        select(ProjectGridCell.h3).where(
+            ProjectGridCell.area_id == area_id,
+            ProjectGridCell.resolution == resolution,
+            ProjectGridCell.h3.between(low, high)
+        )
+    )
+    return {row[0] for row in result.all()}
+
+
+OUTSIDE_TILES_SQL = """
+    area_id = :area_id AND resolution = :resolution
+    AND ((h3 & :keep) | :parent_bits) NOT IN (SELECT unnest(CAST(:tiles AS BIGINT[])))
+"""
+
+
+def _outside_tiles_params(area_id: UUID, resolution: int, tile_res: int, tiles: List[int]) -> dict:
+    keep, parent_bits = parent_bitmasks(tile_res)
+    return {"area_id": area_id, "resolution": resolution, "keep": keep, "parent_bits": parent_bits, "tiles": tiles}
+
+
+async def delete_cells_outside_tiles(db: AsyncSession, area_id: UUID, resolution: int, tile_res: int, tiles: List[int]) -> List[int]:
+    """Delete the stored cells of one area/resolution whose parent at tile_res is not one of `tiles`, returning them"""
+    result = await db.execute(
+        text(f"DELETE FROM project_grid_cells WHERE {OUTSIDE_TILES_SQL} RETURNING h3"),
+        _outside_tiles_params(area_id, resolution, tile_res, tiles)
+    )
+    removed = [row[0] for row in result.all()]
+    await db.commit()
+    return removed
+
+
+async def fetch_stored_resolutions(db: AsyncSession, area_id: UUID) -> List[int]:
+    result = await db.execute(
+        select(ProjectGridCell.resolution).where(ProjectGridCell.area_id == area_id).distinct()
+    )
+    return sorted(row[0] for row in result.all())
+
+
+async def find_response_cells(db: AsyncSession, project_id: UUID, cells: List[int]) -> dict:
+    """Map of h3_index -> response count for the given cells that hold stakeholder responses"""
+    h3_indices = [h3_to_str(cell) for cell in cells]
+    counts = {}
+    for i in range(0, len(h3_indices), DELETE_BATCH_SIZE):
+        result = await db.execute(
+            select(StakeholderResponse.h3_index, func.count(StakeholderResponse.id)).where(
+                StakeholderResponse.project_id == project_id,
+                StakeholderResponse.h3_index.in_(h3_indices[i:i + DELETE_BATCH_SIZE])
+            ).group_by(StakeholderResponse.h3_index)
+        )
+        counts.update({row[0]: row[1] for row in result.all()})
+    return counts
+
+
+def dropped_cells_report(response_cells: dict, resolution: int) -> List[dict]:
+    return [
+        {"h3_index": h3_index, "resolution": resolution, "response_count": count}
+        for h3_index, count in sorted(response_cells.items())
+    ]
+
+
+async def delete_cells(db: AsyncSession, area_id: UUID, resolution: int, cells: List[int]):
+    """Delete only the given cells of one area/resolution in a single transaction"""
+    for i in range(0, len(cells), DELETE_BATCH_SIZE):
+        await db.execute(
+            delete(ProjectGridCell).where(
+                ProjectGridCell.area_id == area_id,
+                ProjectGridCell.resolution == resolution,
+                ProjectGridCell.h3.in_(cells[i:i + DELETE_BATCH_SIZE])
+            )
+        )
+    await db.commit()
+
+
+async def delete_resolution(db: AsyncSession, area_id: UUID, resolution: int):
+    await db.execute(
+        delete(ProjectGridCell).where(
+            ProjectGridCell.area_id == area_id,
+            ProjectGridCell.resolution == resolution
+        )
+    )
+    await db.commit()
+
+
+async def clear_cells(db: AsyncSession, area_id: UUID):
+    """Delete every cell of one area"""
+    await db.execute(delete(ProjectGridCell).where(ProjectGridCell.area_id == area_id))
+    await db.commit()
@@ -0,0 +1,186 @@
+import asyncio
+from collections import deque
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from app.utils.geo import (
+    cells_to_bounds, cells_to_wkb, generate_cells_for_resolution, derive_coarser_levels, cells_to_ints, tile_cells,
+    prepared_boundary, tile_clip
+)
+
+# Number of worker processes for polyfill/boundary work (0 = run in the default thread pool)
+GRID_WORKERS = int(os.getenv("GRID_WORKERS", str(os.cpu_count() or 2)))
+# Cells per boundary-building task; each finished task becomes one COPY chunk
+GRID_TASK_CHUNK_SIZE = int(os.getenv("GRID_TASK_CHUNK_SIZE", "50000"))
+# "polyfill" rasterizes the boundary once per resolution, "hierarchical" once at the finest level
+GRID_GENERATION_MODE = os.getenv("GRID_GENERATION_MODE", "hierarchical")
+# Coarse-cell inclusion rule for hierarchical mode: any, majority or centroid
+GRID_INCLUSION_RULE = os.getenv("GRID_INCLUSION_RULE", "centroid")
+GENERATION_MODES = ("polyfill", "hierarchical")
+# Streaming polyfill: levels are generated per tile, an H3 cell this many levels above the finest resolution,
+# so at most 7**GRID_TILE_DEPTH fine cells per tile are in memory however large the area is
+GRID_TILE_DEPTH = int(os.getenv("GRID_TILE_DEPTH", "6"))
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_executor() -> Optional[ProcessPoolExecutor]:
+    """Lazily create the shared process pool"""
+    global _executor
+    if _executor is None and GRID_WORKERS > 0:
+        # spawn: never fork a process holding an event loop and open DB sockets
+        _executor = ProcessPoolExecutor(
+            max_workers=GRID_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+# --- Worker-side functions (must stay top-level so they can be pickled) ---
+# Cells cross the process boundary as Python ints, the form they are stored in (BIGINT)
+
+def polyfill_resolution(geojson: dict, resolution: int) -> List[int]:
+    return cells_to_ints(generate_cells_for_resolution(geojson, resolution)).tolist()
+
+
+def hierarchical_cells(geojson: dict, resolutions: List[int], rule: str) -> Dict[int, List[int]]:
+    fine_res = max(resolutions)
+    fine_cells = cells_to_ints(generate_cells_for_resolution(geojson, fine_res))
+    levels = derive_coarser_levels(fine_cells, fine_res, resolutions, rule)
+    return {res: cells.tolist() for res, cells in levels.items()}
+
+
+def tile_levels(tile: int, clip: Optional[bytes], resolutions: List[int], mode: str, rule: str) -> Dict[int, List[int]]:
+    """One tile's share of every level; all levels are at or below the tile so nothing crosses tiles"""
+    if mode == "hierarchical":
+        fine_res = max(resolutions)
+        levels = derive_coarser_levels(tile_cells(tile, clip, fine_res), fine_res, resolutions, rule)
+        return {res: cells.tolist() for res, cells in levels.items()}
+    return {res: tile_cells(tile, clip, res).tolist() for res in resolutions}
+
+
+def surviving_cells(
+    geojson: dict, cells: List[Tuple[int, int]], resolutions: List[int], mode: str, rule: str
+) -> List[int]:
+    """
+    Which of the given (cell, resolution) pairs a regeneration with this boundary keeps. Each cell is treated as
+    its own tile, so only its share of the boundary is polyfilled and the result matches the tiled job exactly.
+    """
+    boundary = prepared_boundary(geojson)
+    kept = []
+    for cell, res in cells:
+        if res not in resolutions:
+            continue
+        touches, clip = tile_clip(boundary, cell)
+        if not touches:
+            continue
+        # Every descendant lies inside the boundary, which keeps the cell under any mode and rule
+        if clip is None:
+            kept.append(cell)
+            continue
+        levels = tile_levels(cell, clip, [res] if mode == "polyfill" else sorted({res, max(resolutions)}), mode, rule)
+        if cell in levels[res]:
+            kept.append(cell)
+    return kept
+
+
+def build_cell_rows(cells: List[int]) -> List[Tuple[int, bytes]]:
+    return list(zip(cells, cells_to_wkb(np.asarray(cells, dtype=np.uint64)).tolist()))
+
+
+def build_cell_bounds(cells: List[int]) -> Tuple[List[Tuple[float, float, float, float]], List[bytes]]:
+    """Lng/lat bounds and EWKB of cells, for callers that filter cells by extent before using them"""
+    array = np.asarray(cells, dtype=np.uint64)
+    return [tuple(bounds) for bounds in cells_to_bounds(array).tolist()], cells_to_wkb(array).tolist()
+
+
+# --- Event-loop side ---
+
+async def run_in_pool(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), fn, *args)
+
+
+async def _pick_level(levels: asyncio.Future, res: int) -> List[int]:
+    return (await levels)[res]
+
+
+def start_polyfills(
+    geojson: dict,
+    resolutions: List[int],
+    mode: str = GRID_GENERATION_MODE,
+    rule: str = GRID_INCLUSION_RULE
+) -> Dict[int, asyncio.Future]:
+    """
+    Start cell generation and return one future per resolution.
+    polyfill: one task per resolution so all levels run on separate cores at once.
+    hierarchical: a single task polyfills the finest level and derives the coarser ones from it.
+    """
+    if mode == "hierarchical" and resolutions:
+        levels = asyncio.ensure_future(run_in_pool(hierarchical_cells, geojson, list(resolutions), rule))
+        return {res: asyncio.ensure_future(_pick_level(levels, res)) for res in resolutions}
+    return {
+        res: asyncio.ensure_future(run_in_pool(polyfill_resolution, geojson, res))
+        for res in resolutions
+    }
+
+
+def tile_resolution(resolutions: List[int]) -> int:
+    return max(0, max(resolutions) - GRID_TILE_DEPTH)
+
+
+async def iter_tile_levels(
+    plan: List[Tuple[int, Optional[bytes]]],
+    resolutions: List[int],
+    mode: str,
+    rule: str,
+    start: int = 0
+) -> AsyncIterator[Tuple[int, Dict[int, List[int]]]]:
+    """
+    Yield (tile position, {resolution: cells}) for the tiles of a plan (see app.utils.geo.plan_polyfill_tiles)
+    in plan order, starting at `start`. Only a few tiles per worker are computed ahead, which bounds memory.
+    """
+    window = max(GRID_WORKERS, 1) * 2
+    pending = deque()
+    position = start
+    try:
+        while position < len(plan) or pending:
+            while position < len(plan) and len(pending) < window:
+                tile, clip = plan[position]
+                pending.append((position, asyncio.ensure_future(run_in_pool(tile_levels, tile, clip, resolutions, mode, rule))))
+                position += 1
+            index, future = pending.popleft()
+            yield index, await future
+    finally:
+        cancel_pending(future for _, future in pending)
+
+
+def cancel_pending(futures: Iterable[asyncio.Future]):
+    for future in futures:
+        if not future.done():
+            future.cancel()
+
+
+async def iter_cell_row_chunks(cells: List[int]) -> AsyncIterator[List[Tuple[int, bytes]]]:
+    """
+    Build (h3, EWKB) rows in the pool, one task per chunk of cells,
+    yielding each chunk as soon as its task finishes.
+    """
+    tasks = [
+        asyncio.ensure_future(run_in_pool(build_cell_rows, cells[i:i + GRID_TASK_CHUNK_SIZE]))
+        for i in range(0, len(cells), GRID_TASK_CHUNK_SIZE)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        cancel_pending(tasks)
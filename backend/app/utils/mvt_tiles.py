@@ -0,0 +1,240 @@
+"""
+MVT rendering of a project's grid, shared by the live tile endpoint and the PMTiles archive builder.
+
+A tile starts from the resolution mapped to its zoom and steps to coarser levels until the grid catalog
+predicts at most MVT_MAX_FEATURES_PER_TILE cells in it. When even the coarsest stored level is too dense,
+its cells are drawn as their H3 parents instead, so tile size and render time stay bounded at every zoom.
+"""
+import math
+import os
+from typing import List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text
+from app.utils.grid_store import H3_INDEX_SQL
+from app.utils.grid_catalog import CatalogEntry, project_catalog, resolution_counts
+from app.utils.geo import parent_bitmasks
+from app.utils.grid_workers import build_cell_rows, run_in_pool
+from app.utils.virtual_grid import load_grid_areas, virtual_levels, tile_cells as virtual_tile_cells
+
+MVT_MAX_FEATURES_PER_TILE = int(os.getenv("MVT_MAX_FEATURES_PER_TILE", "20000"))
+
+# Zoom to H3 resolution mapping, the single source for tiles and the GeoJSON by-zoom endpoints
+ZOOM_TO_H3_RESOLUTION = {
+    5: 3, 6: 4, 7: 5, 8: 6, 9: 7, 10: 8, 11: 9, 12: 10, 13: 11, 14: 12,
+    15: 12, 16: 13, 17: 13, 18: 14, 19: 14, 20: 15
+}
+
+
+def resolution_for_zoom(zoom: int) -> int:
+    """Zooms outside the table use its first or last level"""
+    zoom = min(max(zoom, min(ZOOM_TO_H3_RESOLUTION)), max(ZOOM_TO_H3_RESOLUTION))
+    return ZOOM_TO_H3_RESOLUTION[zoom]
+
+
+def zoom_range(resolutions: List[int]) -> Tuple[int, int]:
+    """
+    (minzoom, maxzoom) of a grid. Its coarsest level still draws a zoom before the first zoom that maps to it
+    (hexagons a few pixels wide), and from the first zoom that maps to its finest level on, deeper zooms
+    draw that same level.
+    """
+    zooms = sorted(ZOOM_TO_H3_RESOLUTION)
+    minzoom = next((z for z in zooms if ZOOM_TO_H3_RESOLUTION[z] >= min(resolutions)), zooms[-1])
+    maxzoom = next((z for z in zooms if ZOOM_TO_H3_RESOLUTION[z] >= max(resolutions)), zooms[-1])
+    return (0 if minzoom == zooms[0] else minzoom - 1), maxzoom
+
+
+def get_tile_bbox_4326(z: int, x: int, y: int):
+    """Calculate the bounding box of a tile in lng/lat"""
+    n = math.pow(2, z)
+    lng_min = x / n * 360.0 - 180.0
+    lng_max = (x + 1) / n * 360.0 - 180.0
+    lat_max = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    lat_min = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return lng_min, lat_min, lng_max, lat_max
+
+
+def _overlap_fraction(extent: Tuple[float, float, float, float], bbox: Tuple[float, float, float, float]) -> float:
+    """Share of an extent covered by a bbox, both in lng/lat"""
+    width = min(extent[2], bbox[2]) - max(extent[0], bbox[0])
+    height = min(extent[3], bbox[3]) - max(extent[1], bbox[1])
+    if width < 0 or height < 0:
+        return 0.0
+    extent_area = (extent[2] - extent[0]) * (extent[3] - extent[1])
+    return 1.0 if extent_area <= 0 else min(1.0, width * height / extent_area)
+
+
+def estimate_tile_cells(entries: List[CatalogEntry], res: int, bbox_4326, area_id: Optional[UUID] = None) -> float:
+    """
+    Expected cells of one resolution inside a tile, assuming each area's cells spread evenly over its extent.
+    Levels an area does not store (virtual or coarser ones) are scaled from its nearest stored level by 7 per step.
+    """
+    by_area = {}
+    for entry in entries:
+        if entry.bbox is not None and (area_id is None or entry.area_id == area_id):
+            by_area.setdefault(entry.area_id, []).append(entry)
+    total = 0.0
+    for area_entries in by_area.values():
+        base = min(area_entries, key=lambda entry: (abs(entry.resolution - res), entry.resolution))
+        total += base.cell_count * 7.0 ** (res - base.resolution) * _overlap_fraction(base.bbox, bbox_4326)
+    return total
+
+
+def choose_tile_resolution(
+    entries: List[CatalogEntry],
+    available_resolutions: List[int],
+    target_res: int,
+    bbox_4326,
+    area_id: Optional[UUID] = None
+) -> Tuple[Optional[int], Optional[int]]:
+    """
+    (resolution to draw, stored level to aggregate from or None). Starts at the level closest to the zoom's
+    target and only ever moves coarser, so a tile never gets more detail than its zoom asks for.
+    """
+    if not available_resolutions:
+        return None, None
+    closest = min(available_resolutions, key=lambda r: abs(r - target_res))
+    for res in sorted((r for r in available_resolutions if r <= closest), reverse=True):
+        if estimate_tile_cells(entries, res, bbox_4326, area_id) <= MVT_MAX_FEATURES_PER_TILE:
+            return res, None
+
+    # Even the coarsest level is too dense: draw the parents of its cells
+    coarsest = min(available_resolutions)
+    if coarsest == 0 or coarsest not in resolution_counts(entries, area_id):
+        return coarsest, None
+    for parent in range(coarsest - 1, 0, -1):
+        if estimate_tile_cells(entries, parent, bbox_4326, area_id) <= MVT_MAX_FEATURES_PER_TILE:
+            return parent, coarsest
+    return 0, coarsest
+
+
+async def parent_tile_cells(
+    db: AsyncSession, project_id: UUID, z: int, x: int, y: int, from_res: int, parent_res: int,
+    area_id: Optional[UUID] = None
+) -> Tuple[List[int], List[str], List[bytes]]:
+    """
+    (h3, area ids, EWKB) of the parents of a stored level's cells inside a tile, one set per area.
+    Parents are derived and deduplicated in SQL, so only the few drawn cells leave the database.
+    """
+    keep, parent_bits = parent_bitmasks(parent_res)
+    params = {"project_id": project_id, "res": from_res, "z": z, "x": x, "y": y, "keep": keep, "parent_bits": parent_bits}
+    area_filter = ""
+    if area_id:
+        area_filter = "AND area_id = :area_id"
+        params["area_id"] = area_id
+    result = await db.execute(text(f"""
+        SELECT DISTINCT CAST(area_id AS TEXT), (h3 & :keep) | :parent_bits
+        FROM project_grid_cells
+        WHERE area_id IN (SELECT id FROM project_areas WHERE project_id = :project_id) {area_filter}
+          AND resolution = :res AND geom_3857 && ST_TileEnvelope(:z, :x, :y)
+    """), params)
+    rows = result.all()
+    if not rows:
+        return [], [], []
+    cell_rows = await run_in_pool(build_cell_rows, [row[1] for row in rows])
+    return [cell for cell, _ in cell_rows], [row[0] for row in rows], [wkb for _, wkb in cell_rows]
+
+
+async def render_tile(
+    db: AsyncSession,
+    project_id: UUID,
+    z: int,
+    x: int,
+    y: int,
+    target_res: int,
+    grid_version: int,
+    area_id: Optional[UUID] = None
+) -> bytes:
+    """Encode one tile with ST_AsMVT; an empty tile is b"""""
+    areas = await load_grid_areas(db, project_id, area_id)
+    virtual_resolutions = virtual_levels(areas)
+    
+    # 2. Find the BEST AVAILABLE resolution (stored or virtual) that keeps the tile within its feature budget
+    entries = await project_catalog(db, project_id, grid_version)
+    stored_resolutions = list(resolution_counts(entries, area_id))
+    available_resolutions = sorted(set(stored_resolutions) | set(virtual_resolutions))
+    bbox_4326 = get_tile_bbox_4326(z, x, y)
+    res, aggregate_from = choose_tile_resolution(entries, available_resolutions, target_res, bbox_4326, area_id)
+
+    if res is None:
+        return b"" # No data for this project
+
+    # Virtual levels are polyfilled for this tile only
+    virtual_h3, virtual_area, virtual_geom = [], [], []
+    if res in virtual_resolutions:
+        for area in areas:
+            if res not in area["virtual_resolutions"]:
+                continue
+            cells = await virtual_tile_cells(db, area, res, (z, x, y), bbox_4326)
+            if cells is None:
+                # Too many cells for one tile: serve the best stored level instead
+                res, aggregate_from = choose_tile_resolution(entries, stored_resolutions, target_res, bbox_4326, area_id)
+                if res is None:
+                    return b""
+                virtual_h3, virtual_area, virtual_geom = [], [], []
+                break
+            virtual_h3.extend(cells[0])
+            virtual_area.extend([str(area["id"])] * len(cells[0]))
+            virtual_geom.extend(cells[1])
+
+    # Aggregated tiles draw parents through the same path as virtual cells; no stored cells exist at their level
+    if aggregate_from is not None:
+        virtual_h3, virtual_area, virtual_geom = await parent_tile_cells(
+            db, project_id, z, x, y, aggregate_from, res, area_id
+        )
+    
+    # 3. Query PostgreSQL for MVT data; stored cells carry their 3857 geometry, so the tile envelope filters directly
+    where_clauses = [
+        "area_id IN (SELECT id FROM project_areas WHERE project_id = :project_id)",
+        "resolution = :res",
+        "geom_3857 && ST_TileEnvelope(:z, :x, :y)"
+    ]
+    params = {
+        "project_id": project_id,
+        "res": res,
+        "z": z,
+        "x": x,
+        "y": y
+    }
+    
+    if area_id:
+        where_clauses.append("area_id = :area_id")
+        params["area_id"] = area_id
+
+    where_stmt = " AND ".join(where_clauses)
+
+    virtual_stmt = ""
+    if virtual_h3:
+        virtual_stmt = """
+            UNION ALL
+            SELECT
+                to_hex(v.h3) AS h3_index,
+                v.area_id,
+                ST_AsMVTGeom(
+                    ST_Transform(ST_GeomFromEWKB(v.geom), 3857),
+                    ST_TileEnvelope(:z, :x, :y),
+                    4096, 64, true
+                ) AS geom
+            FROM unnest(CAST(:virtual_h3 AS BIGINT[]), CAST(:virtual_area AS TEXT[]), CAST(:virtual_geom AS BYTEA[]))
+                AS v(h3, area_id, geom)
+        """
+        params.update(virtual_h3=virtual_h3, virtual_area=virtual_area, virtual_geom=virtual_geom)
+    
+    query_text = text(f"""
+        SELECT ST_AsMVT(tile, 'h3-layer') FROM (
+            SELECT 
+                {H3_INDEX_SQL},
+                CAST(area_id AS TEXT) as area_id,
+                ST_AsMVTGeom(
+                    geom_3857,
+                    ST_TileEnvelope(:z, :x, :y),
+                    4096, 64, true
+                ) AS geom
+            FROM project_grid_cells
+            WHERE {where_stmt}
+            {virtual_stmt}
+        ) AS tile;
+    """)
+    
+    result = await db.execute(query_text, params)
+    return bytes(result.scalar() or b"")
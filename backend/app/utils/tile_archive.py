@@ -0,0 +1,187 @@
+"""
+PMTiles archives of finished grids.
+
+Once a grid job succeeds the whole tile pyramid of the project is rendered once into a single PMTiles
+file, so map traffic for a finished grid is served by byte ranges of a static file instead of PostGIS.
+Archives are named after the grid version they were rendered from ({area_id|all}.v{grid_version}.pmtiles
+under TILE_ARCHIVE_DIR/{project_id}); an archive of an older version is never served and is removed by
+the next build. Leaving TILE_ARCHIVE_DIR unset disables archives.
+
+Build one by hand with `python -m app.utils.tile_archive <project_id> [--area-id <area_id>]`.
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import math
+import os
+import time
+from typing import List, Optional, Tuple
+from uuid import UUID
+import numpy as np
+import shapely
+from pmtiles.tile import Compression, TileType, zxy_to_tileid
+from pmtiles.writer import Writer
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.utils.mvt_tiles import resolution_for_zoom, render_tile, get_tile_bbox_4326, zoom_range
+from app.utils.grid_catalog import project_catalog, resolution_counts
+from app.utils.tile_cache import get_grid_version
+from app.utils.tile_extents import project_footprints
+from app.utils.virtual_grid import load_grid_areas, virtual_levels
+
+TILE_ARCHIVE_DIR = os.getenv("TILE_ARCHIVE_DIR") or None
+# Deeper zooms are left to the live tile endpoint; MapLibre overzooms the archive's last level
+TILE_ARCHIVE_MAX_ZOOM = int(os.getenv("TILE_ARCHIVE_MAX_ZOOM", "14"))
+# The deepest zooms are dropped until the pyramid fits in this many tiles
+TILE_ARCHIVE_MAX_TILES = int(os.getenv("TILE_ARCHIVE_MAX_TILES", "200000"))
+# How often (in tiles) a build checks that the grid it renders is still current
+TILE_ARCHIVE_VERSION_CHECK_TILES = int(os.getenv("TILE_ARCHIVE_VERSION_CHECK_TILES", "1000"))
+
+MAX_MERCATOR_LAT = 85.0511287798
+
+
+def archive_path(project_id: UUID, area_id: Optional[UUID], grid_version: int) -> Optional[str]:
+    if not TILE_ARCHIVE_DIR:
+        return None
+    return os.path.join(TILE_ARCHIVE_DIR, str(project_id), f"{area_id or 'all'}.v{grid_version}.pmtiles")
+
+
+def tile_range(bbox: Tuple[float, float, float, float], z: int) -> Tuple[int, int, int, int]:
+    """(x_min, y_min, x_max, y_max) of the tiles covering a lng/lat bbox at zoom z"""
+    n = 2 ** z
+
+    def tile_x(lng: float) -> int:
+        return min(n - 1, max(0, int((lng + 180.0) / 360.0 * n)))
+
+    def tile_y(lat: float) -> int:
+        lat = math.radians(max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat)))
+        return min(n - 1, max(0, int((1.0 - math.asinh(math.tan(lat)) / math.pi) / 2.0 * n)))
+
+    min_lng, min_lat, max_lng, max_lat = bbox
+    return tile_x(min_lng), tile_y(max_lat), tile_x(max_lng), tile_y(min_lat)
+
+
+def footprint_tiles(shapes: List[shapely.Geometry], zooms: List[int]) -> List[Tuple[int, int, int]]:
+    """
+    (z, x, y) of every tile of `zooms` touching a footprint, deepest zooms dropped past TILE_ARCHIVE_MAX_TILES.
+    Each zoom only tests the children of the previous zoom's hits, so the work follows the footprints
+    rather than their bbox, which stays cheap for far-apart areas.
+    """
+    if not shapes or not zooms:
+        return []
+    footprint = shapely.union_all(shapes)
+    shapely.prepare(footprint)
+    x_min, y_min, x_max, y_max = tile_range(footprint.bounds, zooms[0])
+    level = [(x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)]
+    tiles = []
+    for z in zooms:
+        if z != zooms[0]:
+            level = [(2 * x + dx, 2 * y + dy) for x, y in level for dx in (0, 1) for dy in (0, 1)]
+        boxes = shapely.box(*np.array([get_tile_bbox_4326(z, x, y) for x, y in level]).T)
+        level = [tile for tile, hit in zip(level, shapely.intersects(footprint, boxes)) if hit]
+        if not level or len(tiles) + len(level) > TILE_ARCHIVE_MAX_TILES:
+            break
+        tiles.extend((z, x, y) for x, y in level)
+    return tiles
+
+
+async def build_tile_archive(db: AsyncSession, project_id: UUID, area_id: Optional[UUID] = None) -> Optional[str]:
+    """
+    Render every non-empty tile of the grid into a PMTiles archive; returns its path, or None when archives
+    are disabled, there is nothing to render or the grid changed mid-build. Only tiles touching the area
+    footprints are rendered, and they come from render_tile, so they match the live endpoint.
+    """
+    grid_version = await get_grid_version(db, project_id)
+    path = archive_path(project_id, area_id, grid_version)
+    if path is None:
+        return None
+
+    areas = await load_grid_areas(db, project_id, area_id)
+    stored_resolutions = list(resolution_counts(await project_catalog(db, project_id, grid_version), area_id))
+    resolutions = sorted(set(stored_resolutions) | set(virtual_levels(areas)))
+    if not resolutions:
+        return None
+    minzoom, maxzoom = zoom_range(resolutions)
+    footprints = await project_footprints(db, project_id, grid_version)
+    shapes = [footprint.shape for footprint_area_id, footprint in footprints.items()
+              if area_id is None or footprint_area_id == area_id]
+    tiles = footprint_tiles(shapes, list(range(minzoom, min(maxzoom, TILE_ARCHIVE_MAX_ZOOM) + 1)))
+    if not tiles:
+        return None
+    zooms = sorted(set(z for z, _, _ in tiles))
+    min_lng, min_lat, max_lng, max_lat = shapely.union_all(shapes).bounds
+    # Writing in tile id order keeps the archive clustered, which lets readers fetch neighbouring tiles together
+    tiles.sort(key=lambda tile: zxy_to_tileid(*tile))
+
+    started = time.monotonic()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    written = 0
+    superseded = False
+    try:
+        with open(tmp_path, "wb") as f:
+            writer = Writer(f)
+            for i, (z, x, y) in enumerate(tiles):
+                if i and i % TILE_ARCHIVE_VERSION_CHECK_TILES == 0 and await get_grid_version(db, project_id) != grid_version:
+                    # The grid changed under the build, so this archive could never be served
+                    superseded = True
+                    break
+                tile = await render_tile(db, project_id, z, x, y, resolution_for_zoom(z), grid_version, area_id)
+                if tile:
+                    writer.write_tile(zxy_to_tileid(z, x, y), gzip.compress(tile, mtime=0))
+                    written += 1
+            if written and not superseded:
+                writer.finalize(
+                    {
+                        "tile_type": TileType.MVT,
+                        "tile_compression": Compression.GZIP,
+                        "min_lon_e7": int(min_lng * 10000000),
+                        "min_lat_e7": int(min_lat * 10000000),
+                        "max_lon_e7": int(max_lng * 10000000),
+                        "max_lat_e7": int(max_lat * 10000000),
+                        "center_zoom": zooms[0]
+                    },
+                    {
+                        "name": f"h3-grid-{project_id}",
+                        "vector_layers": [{
+                            "id": "h3-layer",
+                            "fields": {"h3_index": "String", "area_id": "String"},
+                            "minzoom": zooms[0],
+                            "maxzoom": zooms[-1]
+                        }],
+                        "project_id": str(project_id),
+                        "area_id": str(area_id) if area_id else None,
+                        "grid_version": grid_version
+                    }
+                )
+    except BaseException:
+        # Cancelled or failed mid-build: no partial archive is left behind
+        os.remove(tmp_path)
+        raise
+    if not written or superseded:
+        os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, path)
+
+    # Archives of older versions can no longer be served
+    for stale in glob.glob(os.path.join(os.path.dirname(path), f"{area_id or 'all'}.v*.pmtiles")):
+        if stale != path:
+            os.remove(stale)
+    print(f"Tile archive {path}: {written}/{len(tiles)} tiles, zoom {zooms[0]}-{zooms[-1]}, "
+          f"{time.monotonic() - started:.1f}s")
+    return path
+
+
+async def main(project_id: UUID, area_id: Optional[UUID]):
+    from app.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        path = await build_tile_archive(db, project_id, area_id)
+    print(path or "No archive written (TILE_ARCHIVE_DIR unset or no tiles)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a project's grid tiles into a PMTiles archive")
+    parser.add_argument("project_id", type=UUID)
+    parser.add_argument("--area-id", type=UUID, default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.project_id, args.area_id))
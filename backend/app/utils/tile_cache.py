@@ -0,0 +1,158 @@
+"""
+MVT tile cache: an in-process LRU capped by bytes in front of an optional on-disk directory.
+Keys carry the project's grid version (Project.grid_version), which bump_grid_version increments
+whenever a project's cells can change, so tiles of an older grid are never served again. Nothing is
+invalidated when the version is bumped: the first tile stored for a newer version frees the older ones,
+and since that tile is rendered from the committed version, a reader still on the old one cannot refill them.
+"""
+import asyncio
+import os
+import shutil
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+from uuid import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.utils.versions import project_version, bump_project_version
+
+MVT_CACHE_MAX_BYTES = int(os.getenv("MVT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Unset disables the disk tier
+MVT_CACHE_DIR = os.getenv("MVT_CACHE_DIR") or None
+
+
+@dataclass(frozen=True)
+class TileKey:
+    project_id: UUID
+    area_id: Optional[UUID]
+    resolution: int
+    z: int
+    x: int
+    y: int
+    version: int
+    # Tiles of the same scope drawn differently, e.g. response tiles with other attribute fields
+    variant: str = ""
+
+    def path(self, root: str) -> str:
+        return os.path.join(
+            root, str(self.project_id), str(self.version), str(self.area_id or "all"),
+            str(self.resolution), str(self.z), str(self.x), f"{self.y}{self.variant and '.' + self.variant}.pbf"
+        )
+
+
+class TileCache:
+    """
+    Byte-capped LRU of encoded tiles. Empty tiles are cached as b"" so repeated 204s stay cheap.
+    The disk tier, when configured, survives restarts and is shared by every worker process.
+    """
+
+    def __init__(self, max_bytes: int, directory: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._tiles = OrderedDict()
+        # project_id -> newest version stored so far
+        self._versions: Dict[UUID, int] = {}
+        self.size_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, key: TileKey, tile: bytes):
+        if len(tile) > self.max_bytes:
+            return
+        previous = self._tiles.pop(key, None)
+        if previous is not None:
+            self.size_bytes -= len(previous)
+        self._tiles[key] = tile
+        self.size_bytes += len(tile)
+        while self.size_bytes > self.max_bytes:
+            _, evicted = self._tiles.popitem(last=False)
+            self.size_bytes -= len(evicted)
+            self.evictions += 1
+
+    async def get(self, key: TileKey) -> Optional[bytes]:
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return tile
+        if self.directory:
+            tile = await asyncio.to_thread(_read_file, key.path(self.directory))
+            if tile is not None:
+                self._remember(key, tile)
+                self.disk_hits += 1
+                return tile
+        self.misses += 1
+        return None
+
+    async def put(self, key: TileKey, tile: bytes):
+        newest = self._versions.get(key.project_id)
+        if newest is not None and key.version < newest:
+            # Rendered by a request that read the version before a bump; nobody will ask for it again
+            return
+        if newest is None or key.version > newest:
+            self._versions[key.project_id] = key.version
+            await self.drop_older_versions(key.project_id, key.version)
+        self._remember(key, tile)
+        if self.directory:
+            await asyncio.to_thread(_write_file, key.path(self.directory), tile)
+
+    async def drop_older_versions(self, project_id: UUID, version: int):
+        """Free a project's tiles of versions before `version`; version keys already make them unreachable"""
+        for key in [key for key in self._tiles if key.project_id == project_id and key.version < version]:
+            self.size_bytes -= len(self._tiles.pop(key))
+        if self.directory:
+            await asyncio.to_thread(_remove_older_dirs, os.path.join(self.directory, str(project_id)), version)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._tiles),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "disk_dir": self.directory,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None
+        }
+
+
+def _read_file(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _remove_older_dirs(project_dir: str, version: int):
+    try:
+        names = os.listdir(project_dir)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.isdigit() and int(name) < version:
+            shutil.rmtree(os.path.join(project_dir, name), True)
+
+
+def _write_file(path: str, tile: bytes):
+    # Write then rename so concurrent readers never see a partial tile
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(tile)
+    os.replace(tmp_path, path)
+
+
+tile_cache = TileCache(MVT_CACHE_MAX_BYTES, MVT_CACHE_DIR)
+
+
+async def get_grid_version(db: AsyncSession, project_id: UUID) -> int:
+    return await project_version(db, project_id, "grid_version") or 0
+
+
+async def bump_grid_version(db: AsyncSession, project_id: UUID):
+    """Mark a project's grid as changed; committed by the caller. Cached tiles of older versions are freed lazily"""
+    await bump_project_version(db, project_id, "grid_version")
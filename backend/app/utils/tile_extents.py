@@ -0,0 +1,81 @@
+"""
+In-memory footprints of each project's grid, used to answer tiles that cannot hold a cell without
+rendering them. An area's footprint is its boundary grown by two edges of a cell two levels above its
+coarsest stored one: stored and virtual cells never reach that far past the boundary, and neither do the
+parents aggregated tiles usually draw. Footprints are rebuilt whenever the project's grid_version moves,
+like the grid catalog they are derived from.
+"""
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from uuid import UUID
+import h3
+import numpy as np
+import shapely
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.utils.grid_catalog import project_catalog
+
+
+@dataclass(frozen=True)
+class AreaFootprint:
+    bbox: Tuple[float, float, float, float]
+    shape: shapely.Geometry  # prepared
+
+
+# project_id -> (grid_version, area_id -> footprint)
+_footprints: Dict[UUID, Tuple[int, Dict[UUID, AreaFootprint]]] = {}
+rejected_tiles = 0
+
+
+def _margin_degrees(resolution: int, lat: float) -> float:
+    """Two average cell edges in degrees of longitude at `lat`, the wider of the two degree units"""
+    return 2 * h3.average_hexagon_edge_length(resolution, "km") / (111.32 * max(np.cos(np.radians(lat)), 0.01))
+
+
+async def project_footprints(db: AsyncSession, project_id: UUID, grid_version: int) -> Dict[UUID, AreaFootprint]:
+    cached = _footprints.get(project_id)
+    if cached is not None and cached[0] == grid_version:
+        return cached[1]
+
+    coarsest = {}
+    for entry in await project_catalog(db, project_id, grid_version):
+        coarsest[entry.area_id] = min(coarsest.get(entry.area_id, entry.resolution), entry.resolution)
+    result = await db.execute(text("""
+        SELECT id, ST_AsBinary(boundary_geom) AS boundary
+        FROM project_areas WHERE project_id = :project_id AND boundary_geom IS NOT NULL
+    """), {"project_id": project_id})
+
+    footprints = {}
+    for area_id, boundary_wkb in result.all():
+        # An area without stored cells has nothing to draw, virtual levels included
+        if area_id not in coarsest:
+            continue
+        boundary = shapely.from_wkb(bytes(boundary_wkb))
+        margin = _margin_degrees(max(coarsest[area_id] - 2, 0), boundary.centroid.y)
+        # Simplifying moves the outline by at most the tolerance, which the buffer adds back
+        shape = shapely.buffer(shapely.simplify(boundary, margin / 4), margin * 1.25)
+        shapely.prepare(shape)
+        footprints[area_id] = AreaFootprint(bbox=tuple(shape.bounds), shape=shape)
+    _footprints[project_id] = (grid_version, footprints)
+    return footprints
+
+
+async def tile_may_have_cells(
+    db: AsyncSession, project_id: UUID, grid_version: int, bbox_4326, area_id: Optional[UUID] = None
+) -> bool:
+    """False when the tile (bbox in lng/lat) misses every area footprint, so rendering it would give an empty tile"""
+    global rejected_tiles
+    x_min, y_min, x_max, y_max = bbox_4326
+    tile = None
+    for footprint_area_id, footprint in (await project_footprints(db, project_id, grid_version)).items():
+        if area_id is not None and footprint_area_id != area_id:
+            continue
+        fx_min, fy_min, fx_max, fy_max = footprint.bbox
+        if fx_min > x_max or fx_max < x_min or fy_min > y_max or fy_max < y_min:
+            continue
+        if tile is None:
+            tile = shapely.box(x_min, y_min, x_max, y_max)
+        if footprint.shape.intersects(tile):
+            return True
+    rejected_tiles += 1
+    return False
@@ -0,0 +1,75 @@
+"""
+Version counters behind the ETags of read endpoints.
+
+Projects carry one counter per kind of data (grid_version for cells and tiles, areas_version for the
+area list, schema_version for columns, forms and assignments, responses_version for submitted responses)
+and every area carries its own version.
+Writers bump the counter in the same transaction as the change; readers turn the counter into a
+strong ETag and answer If-None-Match with 304 before running their real query.
+"""
+import hashlib
+from typing import Optional
+from uuid import UUID
+from fastapi import Request, Response
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+PROJECT_VERSION_COLUMNS = ("grid_version", "areas_version", "schema_version", "responses_version")
+
+
+async def project_version(db: AsyncSession, project_id: UUID, column: str) -> Optional[int]:
+    if column not in PROJECT_VERSION_COLUMNS:
+        raise ValueError(f"Unknown project version column: {column}")
+    result = await db.execute(
+        text(f"SELECT COALESCE({column}, 0) FROM projects WHERE id = :project_id"), {"project_id": project_id}
+    )
+    return result.scalar()
+
+
+async def area_version(db: AsyncSession, area_id: UUID) -> Optional[int]:
+    result = await db.execute(
+        text("SELECT COALESCE(version, 0) FROM project_areas WHERE id = :area_id"), {"area_id": area_id}
+    )
+    return result.scalar()
+
+
+async def bump_project_version(db: AsyncSession, project_id: UUID, column: str):
+    """Committed by the caller together with the change it versions"""
+    if column not in PROJECT_VERSION_COLUMNS:
+        raise ValueError(f"Unknown project version column: {column}")
+    await db.execute(
+        text(f"UPDATE projects SET {column} = COALESCE({column}, 0) + 1 WHERE id = :project_id"),
+        {"project_id": project_id}
+    )
+
+
+async def bump_area_version(db: AsyncSession, project_id: UUID, area_id: UUID):
+    """An area changed: its own version and the project's area list version"""
+    await db.execute(
+        text("UPDATE project_areas SET version = COALESCE(version, 0) + 1 WHERE id = :area_id"),
+        {"area_id": area_id}
+    )
+    await bump_project_version(db, project_id, "areas_version")
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag from the endpoint name, its scope and the version it serves"""
+    return '"' + hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()[:20] + '"'
+
+
+def etag_headers(etag: str, cache_control: str = "no-cache") -> dict:
+    # no-cache lets clients keep the payload but makes them revalidate it on every use
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # If-None-Match uses weak comparison, so a W/ prefix added by a proxy still matches
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+def not_modified(etag: str, cache_control: str = "no-cache") -> Response:
+    return Response(status_code=304, headers=etag_headers(etag, cache_control))
@@ -0,0 +1,165 @@
+"""
+Virtual grid levels: an area's finest resolutions can be left out of project_grid_cells
+(ProjectArea.virtual_resolutions) and are polyfilled on demand for the map tile or selection
+being looked at. Results are cached per area boundary fingerprint, so editing a boundary
+never serves cells of the old one.
+"""
+import json
+import os
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Tuple
+from uuid import UUID
+import h3
+import numpy as np
+import shapely
+from shapely.geometry import shape, mapping
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.utils.geo import cells_to_ints, cells_to_polygons, cells_to_wkb, generate_cells_for_resolution
+from app.utils.grid_workers import run_in_pool
+
+VIRTUAL_CACHE_ENTRIES = int(os.getenv("VIRTUAL_GRID_CACHE_ENTRIES", "2048"))
+# A virtual level is only served for a tile when it holds at most this many cells
+VIRTUAL_TILE_MAX_CELLS = int(os.getenv("VIRTUAL_TILE_MAX_CELLS", "50000"))
+
+# (h3 ints, EWKB polygons) of one area's cells for one tile or selection
+VirtualCells = Tuple[List[int], List[bytes]]
+
+
+class LRUCache:
+    """Small in-process LRU keyed by any hashable"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+
+    def get(self, key: Hashable):
+        if key not in self._items:
+            return None
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key: Hashable, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+
+_cells_cache = LRUCache(VIRTUAL_CACHE_ENTRIES)
+_boundary_cache = LRUCache(64)
+
+
+async def load_grid_areas(db: AsyncSession, project_id: Optional[UUID], area_id: Optional[UUID] = None) -> List[dict]:
+    """The areas of a grid scope (one area, or all of a project's) with their virtual levels and boundary fingerprint"""
+    where_clauses = ["boundary_geom IS NOT NULL"]
+    params = {}
+    if project_id is not None:
+        where_clauses.append("project_id = :project_id")
+        params["project_id"] = project_id
+    if area_id is not None:
+        where_clauses.append("id = :area_id")
+        params["area_id"] = area_id
+    result = await db.execute(text(f"""
+        SELECT id, COALESCE(virtual_resolutions, '[]'::jsonb) AS virtual_resolutions,
+               md5(ST_AsEWKB(boundary_geom)) AS fingerprint
+        FROM project_areas
+        WHERE {" AND ".join(where_clauses)}
+    """), params)
+    return [
+        {"id": row.id, "virtual_resolutions": list(row.virtual_resolutions), "fingerprint": row.fingerprint}
+        for row in result.all()
+    ]
+
+
+def virtual_levels(areas: List[dict]) -> List[int]:
+    return sorted({res for area in areas for res in area["virtual_resolutions"]})
+
+
+def virtual_resolution_entries(areas: List[dict], approx_area_km2: dict) -> List[dict]:
+    """Resolution list entries for virtual levels; they have no stored cells to count"""
+    return [
+        {"resolution": res, "count": None, "virtual": True, "approx_area_km2": approx_area_km2.get(res, 0)}
+        for res in virtual_levels(areas)
+    ]
+
+
+async def _boundary(db: AsyncSession, area: dict):
+    key = (area["id"], area["fingerprint"])
+    boundary = _boundary_cache.get(key)
+    if boundary is None:
+        result = await db.execute(
+            text("SELECT ST_AsGeoJSON(boundary_geom) FROM project_areas WHERE id = :area_id"),
+            {"area_id": area["id"]}
+        )
+        boundary = shape(json.loads(result.scalar_one()))
+        if not boundary.is_valid:
+            boundary = shapely.make_valid(boundary)
+        _boundary_cache.put(key, boundary)
+    return boundary
+
+
+def _cell_margin_degrees(resolution: int, lat: float) -> float:
+    """Two average cell edges in degrees of longitude at `lat`: wide enough to catch every cell touching a window"""
+    return 2 * h3.average_hexagon_edge_length(resolution, "km") / (111.32 * max(np.cos(np.radians(lat)), 0.01))
+
+
+def _clip_wkb(boundary, window) -> Optional[bytes]:
+    clip = shapely.intersection(boundary, window)
+    parts = [part for part in getattr(clip, "geoms", [clip]) if part.geom_type == "Polygon" and not part.is_empty]
+    return shapely.to_wkb(shapely.MultiPolygon(parts)) if parts else None
+
+
+# --- Worker-side functions (run in the grid process pool) ---
+
+def polyfill_virtual(clip_wkb: bytes, resolution: int, selection_wkb: Optional[bytes] = None) -> VirtualCells:
+    """Cells of a clipped boundary, optionally only those intersecting a selection, with their EWKB"""
+    cells = cells_to_ints(generate_cells_for_resolution(mapping(shapely.from_wkb(clip_wkb)), resolution))
+    if selection_wkb is not None and cells.size:
+        cells = cells[shapely.intersects(cells_to_polygons(cells), shapely.from_wkb(selection_wkb))]
+    cells = np.sort(cells)
+    return cells.tolist(), cells_to_wkb(cells).tolist()
+
+
+# --- Event-loop side ---
+
+async def tile_cells(db: AsyncSession, area: dict, resolution: int, tile: Tuple[int, int, int], bbox_4326) -> Optional[VirtualCells]:
+    """
+    Virtual cells of one area inside a map tile (bbox in lng/lat), or None when the tile would hold
+    more than VIRTUAL_TILE_MAX_CELLS cells and the caller should fall back to a stored level.
+    """
+    key = (area["id"], area["fingerprint"], resolution) + tuple(tile)
+    cached = _cells_cache.get(key)
+    if cached is not None:
+        return cached
+    boundary = await _boundary(db, area)
+    x_min, y_min, x_max, y_max = bbox_4326
+    margin = _cell_margin_degrees(resolution, (y_min + y_max) / 2)
+    window = shapely.box(x_min - margin, y_min - margin, x_max + margin, y_max + margin)
+    clip_wkb = _clip_wkb(boundary, window)
+    if clip_wkb is None:
+        cells = ([], [])
+    else:
+        # Planar degree area is good enough to refuse tiles that would explode
+        lat = (y_min + y_max) / 2
+        clip_km2 = shapely.from_wkb(clip_wkb).area * 111.32 * 111.32 * max(np.cos(np.radians(lat)), 0.01)
+        if clip_km2 / h3.average_hexagon_area(resolution, "km^2") > VIRTUAL_TILE_MAX_CELLS:
+            return None
+        cells = await run_in_pool(polyfill_virtual, clip_wkb, resolution)
+    _cells_cache.put(key, cells)
+    return cells
+
+
+async def selection_cells(db: AsyncSession, area: dict, resolution: int, selection, selection_key: Hashable) -> VirtualCells:
+    """Virtual cells of one area that intersect a selection polygon"""
+    key = (area["id"], area["fingerprint"], resolution, selection_key)
+    cached = _cells_cache.get(key)
+    if cached is not None:
+        return cached
+    boundary = await _boundary(db, area)
+    clip_wkb = _clip_wkb(boundary, selection.buffer(_cell_margin_degrees(resolution, selection.centroid.y)))
+    cells = ([], []) if clip_wkb is None else await run_in_pool(
+        polyfill_virtual, clip_wkb, resolution, shapely.to_wkb(selection)
+    )
+    _cells_cache.put(key, cells)
+    return cells
@@ -0,0 +1,59 @@
+"""
+Benchmark: per-cell WKT loop (previous grid generator code) vs. the batch WKB builder.
+
+Run from the backend directory:
+    python -m benchmarks.bench_cell_geometry [resolution]
+"""
+import sys
+import time
+import h3
+import shapely
+from app.utils.geo import cells_to_wkb, generate_cells_for_resolution
+
+# ~30 x 30 km box around Istanbul
+SAMPLE_AREA = {
+    "type": "Polygon",
+    "coordinates": [[[28.8, 40.9], [29.15, 40.9], [29.15, 41.17], [28.8, 41.17], [28.8, 40.9]]]
+}
+
+
+def legacy_wkt_loop(cells):
+    """The inner loop grids.py used before the batch builder"""
+    wkts = []
+    for cell in cells:
+        boundary = h3.cell_to_boundary(cell)
+        polygon_coords = [[b[1], b[0]] for b in boundary]
+        if polygon_coords[0] != polygon_coords[-1]:
+            polygon_coords.append(polygon_coords[0])
+        wkts.append(f"POLYGON(({','.join([f'{c[0]} {c[1]}' for c in polygon_coords])}))")
+    return wkts
+
+
+def timed(fn, cells, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(cells)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    resolution = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    cells = list(generate_cells_for_resolution(SAMPLE_AREA, resolution))
+
+    # Both paths must describe the same polygons
+    legacy = shapely.from_wkt(legacy_wkt_loop(cells[:1000]))
+    batch = shapely.from_wkb(cells_to_wkb(cells[:1000]))
+    assert shapely.equals_exact(legacy, batch, tolerance=1e-12).all()
+
+    legacy_s = timed(legacy_wkt_loop, cells)
+    batch_s = timed(cells_to_wkb, cells)
+    print(f"resolution {resolution}: {len(cells):,} cells")
+    print(f"  legacy WKT loop : {legacy_s:8.3f} s  ({len(cells) / legacy_s:,.0f} cells/s)")
+    print(f"  cells_to_wkb    : {batch_s:8.3f} s  ({len(cells) / batch_s:,.0f} cells/s)")
+    print(f"  speedup         : {legacy_s / batch_s:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import projects, grids, responses, schema, auth, users, areas, mvt
+from app.routers import projects, grids, responses, schema, auth, users, areas, mvt, response_mvt, tile_archives, jobs
 from app.database import engine
+from app.utils.compression import CompressionMiddleware
 from app.models.project import Base
 import app.models.user  # Ensure User model is loaded
 from sqlalchemy import text
@@ -20,7 +21,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Metadata of format=binary grid responses, which have no JSON envelope
+    expose_headers=["X-Grid-Resolution", "X-Grid-Compacted", "X-Grid-Truncated", "X-Grid-Next-Offset"],
 )
+# Negotiated zstd/brotli/gzip; levels per route prefix come from COMPRESSION_ROUTE_LEVELS
+app.add_middleware(CompressionMiddleware)
 
 @app.on_event("startup")
 async def startup_event():
@@ -51,12 +56,34 @@ async def startup_event():
             # Re-check columns for tables that already existed
             await conn.execute(text("ALTER TABLE project_columns ADD COLUMN IF NOT EXISTS options JSONB DEFAULT '[]';"))
             await conn.execute(text("ALTER TABLE project_columns ADD COLUMN IF NOT EXISTS config JSONB DEFAULT '{}';"))
-            await conn.execute(text("ALTER TABLE project_grid_cells ADD COLUMN IF NOT EXISTS area_id UUID;"))
             await conn.execute(text("ALTER TABLE stakeholder_responses ADD COLUMN IF NOT EXISTS area_id UUID;"))
             await conn.execute(text("ALTER TABLE projects ADD COLUMN IF NOT EXISTS status VARCHAR DEFAULT 'IN_PROGRESS';"))
+            await conn.execute(text("ALTER TABLE projects ADD COLUMN IF NOT EXISTS grid_version INTEGER DEFAULT 0;"))
+            await conn.execute(text("ALTER TABLE projects ADD COLUMN IF NOT EXISTS areas_version INTEGER DEFAULT 0;"))
+            await conn.execute(text("ALTER TABLE projects ADD COLUMN IF NOT EXISTS schema_version INTEGER DEFAULT 0;"))
+            await conn.execute(text("ALTER TABLE projects ADD COLUMN IF NOT EXISTS responses_version INTEGER DEFAULT 0;"))
+            await conn.execute(text("ALTER TABLE project_areas ADD COLUMN IF NOT EXISTS is_project_boundary BOOLEAN DEFAULT FALSE;"))
+            await conn.execute(text("ALTER TABLE project_areas ADD COLUMN IF NOT EXISTS num_virtual_resolutions INTEGER DEFAULT 0;"))
+            await conn.execute(text("ALTER TABLE project_areas ADD COLUMN IF NOT EXISTS virtual_resolutions JSONB DEFAULT '[]';"))
+            await conn.execute(text("ALTER TABLE project_areas ADD COLUMN IF NOT EXISTS version INTEGER DEFAULT 0;"))
         except Exception as e:
             print(f"Migration check skip/failure: {e}")
 
+        # Grid cells moved to BIGINT H3 keys; a failure here rolls back and stops startup
+        from app.utils.grid_migrations import (
+            migrate_grid_cells_to_bigint, backfill_grid_catalog, add_mercator_geometry, add_simplified_boundaries
+        )
+        await migrate_grid_cells_to_bigint(conn)
+        await add_mercator_geometry(conn)
+        await add_simplified_boundaries(conn)
+        await backfill_grid_catalog(conn)
+
+        # Managed indexes (see app.utils.db_indexes); create_all skips them on tables that already existed
+        from app.utils.db_indexes import ensure_indexes
+        created_indexes = await ensure_indexes(conn)
+        if created_indexes:
+            print(f"Created indexes: {', '.join(created_indexes)}")
+
     # Create default admin if not exists
     from app.routers.auth import pwd_context
     from app.models.user import User as UserModel
@@ -79,6 +106,18 @@ async def startup_event():
             db.add(admin_user)
             await db.commit()
 
+    # Start grid job workers; interrupted jobs from a previous run are resumed once their heartbeat is stale
+    from app.utils.grid_jobs import start_job_workers
+    start_job_workers()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Stop job workers first so running jobs are left resumable, then the generation worker processes
+    from app.utils.grid_jobs import stop_job_workers
+    from app.utils.grid_workers import shutdown_executor
+    await stop_job_workers()
+    shutdown_executor()
+
 # Include Routers
 app.include_router(auth.router)
 app.include_router(projects.router)
@@ -88,6 +127,9 @@ app.include_router(schema.router)
 app.include_router(users.router)
 app.include_router(areas.router)
 app.include_router(mvt.router)
+app.include_router(response_mvt.router)
+app.include_router(tile_archives.router)
+app.include_router(jobs.router)
 
 @app.get("/")
 async def root():
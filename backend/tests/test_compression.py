@@ -0,0 +1,83 @@
+"""Encoding negotiation and CompressionMiddleware's handling of streams, revalidations and ranges."""
+import asyncio
+import json
+import zlib
+import pytest
+from app.utils.compression import CompressionMiddleware, negotiate_encoding
+
+LINES = [json.dumps({"progress": i, "message": "x" * 40}) + "\n" for i in range(5)]
+
+
+def streaming_app(content_type: str, status: int = 200, chunks=LINES):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", content_type.encode()), (b"etag", b'"v1"')
+        ]})
+        for chunk in chunks:
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+    return app
+
+
+def request(app, headers: dict):
+    """Messages sent by the middleware for a GET with the given headers"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "method": "GET", "path": "/jobs/1/stream",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    }
+    asyncio.run(CompressionMiddleware(app, minimum_size=0)(scope, receive, send))
+    start = messages[0]
+    return start, {name.decode(): value.decode() for name, value in start["headers"]}, messages[1:]
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("gzip, br, zstd", "zstd"),
+    ("br;q=1.0, zstd;q=0.5", "br"),
+    ("*", "zstd"),
+    ("*;q=0.5, gzip;q=0.8", "gzip"),
+    ("gzip;q=0, identity", None),
+    ("zstd;q=bogus, br", "br")
+])
+def test_negotiate_encoding(accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+def test_ndjson_is_flushed_line_by_line():
+    _, headers, bodies = request(streaming_app("application/x-ndjson"), {"Accept-Encoding": "gzip"})
+    assert headers["content-encoding"] == "gzip" and headers["etag"] == 'W/"v1"'
+    decoder = zlib.decompressobj(31)
+    # Every message decodes to exactly the line written, without waiting for the next one
+    decoded = [decoder.decompress(message["body"]) for message in bodies]
+    assert decoded[:len(LINES)] == [line.encode() for line in LINES]
+    assert not bodies[-1]["more_body"]
+
+
+def test_json_streams_are_left_to_the_compressor_buffer():
+    _, headers, bodies = request(streaming_app("application/json"), {"Accept-Encoding": "gzip"})
+    assert headers["content-encoding"] == "gzip"
+    assert len(bodies) < len(LINES)
+    assert zlib.decompress(b"".join(message["body"] for message in bodies), 31) == "".join(LINES).encode()
+
+
+def test_not_modified_carries_the_compressed_validator():
+    start, headers, bodies = request(streaming_app("application/json", 304, []), {"Accept-Encoding": "br"})
+    assert start["status"] == 304
+    assert headers["etag"] == 'W/"v1"' and "content-encoding" not in headers
+    assert [message["body"] for message in bodies] == [b""]
+
+
+def test_range_requests_pass_through_uncompressed():
+    _, headers, bodies = request(streaming_app("application/json"), {"Accept-Encoding": "gzip", "Range": "bytes=0-10"})
+    assert "content-encoding" not in headers and headers["etag"] == '"v1"'
+    assert b"".join(message["body"] for message in bodies) == "".join(LINES).encode()
@@ -0,0 +1,46 @@
+"""Vectorised H3 helpers in app.utils.geo checked against h3 itself."""
+import h3
+import h3.api.numpy_int as h3_int
+import numpy as np
+import shapely
+from app.utils.geo import (
+    cell_range, cells_to_parent, cells_to_wkb, generate_cells_for_resolution, plan_polyfill_tiles, tile_cells
+)
+
+CELL = h3.latlng_to_cell(41.01, 28.97, 8)
+BOUNDARY = {
+    "type": "Polygon",
+    "coordinates": [[[28.90, 40.98], [29.05, 40.97], [29.08, 41.06], [28.95, 41.08], [28.90, 40.98]]]
+}
+
+
+def test_cells_to_wkb_matches_h3_boundaries():
+    cells = np.array([h3.str_to_int(CELL), h3.str_to_int(h3.cell_to_parent(CELL, 0))], dtype=np.uint64)
+    for cell, wkb in zip(cells.tolist(), cells_to_wkb(cells)):
+        polygon = shapely.from_wkb(wkb)
+        assert shapely.get_srid(polygon) == 4326
+        expected = [(lng, lat) for lat, lng in h3_int.cell_to_boundary(cell)]
+        assert np.allclose(polygon.exterior.coords[:-1], expected)
+        assert polygon.exterior.coords[0] == polygon.exterior.coords[-1]
+
+
+def test_cells_to_parent_matches_h3():
+    cells = h3_int.cell_to_children(h3.str_to_int(CELL), 11)
+    for res in (0, 5, 8, 10):
+        assert (cells_to_parent(cells, res) == [h3_int.cell_to_parent(cell, res) for cell in cells]).all()
+
+
+def test_cell_range_bounds_every_descendant():
+    tile = h3.str_to_int(h3.cell_to_parent(CELL, 6))
+    children = h3_int.cell_to_children(tile, 9)
+    low, high = cell_range(tile, 9)
+    assert low == int(children.min()) and high == int(children.max())
+    assert h3_int.is_valid_cell(low) and h3_int.is_valid_cell(high)
+
+
+def test_tiled_polyfill_matches_whole_boundary():
+    expected = {h3.str_to_int(cell) for cell in generate_cells_for_resolution(BOUNDARY, 9)}
+    tiled = set()
+    for tile, clip in plan_polyfill_tiles(BOUNDARY, 6):
+        tiled.update(tile_cells(tile, clip, 9).tolist())
+    assert expected and tiled == expected
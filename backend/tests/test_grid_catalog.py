@@ -0,0 +1,91 @@
+"""Grid catalog: per-process copies reloaded when the grid version moves."""
+import asyncio
+from types import SimpleNamespace
+from uuid import uuid4
+import pytest
+from app.utils import grid_catalog
+from app.utils.grid_catalog import CatalogEntry, area_catalog, project_catalog, refresh_area_catalog, resolution_counts
+
+PROJECT = uuid4()
+AREA = uuid4()
+OTHER_AREA = uuid4()
+
+
+def catalog_row(area_id, resolution, cell_count, bbox=(28.9, 40.9, 29.1, 41.1)):
+    min_lng, min_lat, max_lng, max_lat = bbox or (None,) * 4
+    return SimpleNamespace(
+        area_id=area_id, resolution=resolution, cell_count=cell_count, min_lng=min_lng, min_lat=min_lat,
+        max_lng=max_lng, max_lat=max_lat, grid_version=1, generated_at=None
+    )
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def scalar(self):
+        return self.rows[0]
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    """Answers catalog reads from `rows`, version reads from `grid_version` and records every statement"""
+
+    def __init__(self, rows, grid_version=1):
+        self.rows = rows
+        self.grid_version = grid_version
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        sql = " ".join(str(statement).split())
+        self.statements.append((sql, params))
+        if sql.startswith("SELECT COALESCE(grid_version"):
+            return FakeResult([self.grid_version])
+        if sql.startswith("SELECT a.project_id"):
+            return FakeResult([SimpleNamespace(project_id=PROJECT, grid_version=self.grid_version)])
+        return FakeResult(self.rows)
+
+    def catalog_reads(self):
+        return sum(1 for sql, _ in self.statements if "FROM grid_catalog" in sql)
+
+
+@pytest.fixture(autouse=True)
+def empty_catalogs(monkeypatch):
+    monkeypatch.setattr(grid_catalog, "_catalogs", {})
+
+
+def test_catalog_is_reloaded_only_when_the_grid_version_moves():
+    db = FakeSession([catalog_row(AREA, 7, 10), catalog_row(OTHER_AREA, 7, 5, None)])
+    entries = asyncio.run(project_catalog(db, PROJECT))
+    assert entries[0] == CatalogEntry(AREA, 7, 10, (28.9, 40.9, 29.1, 41.1), 1, None)
+    assert entries[1].bbox is None
+
+    db.rows = [catalog_row(AREA, 7, 12)]
+    assert asyncio.run(project_catalog(db, PROJECT)) is entries
+    assert db.catalog_reads() == 1
+
+    db.grid_version = 2
+    assert [entry.cell_count for entry in asyncio.run(project_catalog(db, PROJECT))] == [12]
+    assert db.catalog_reads() == 2
+
+
+def test_area_catalog_filters_the_project_copy():
+    db = FakeSession([catalog_row(AREA, 7, 10), catalog_row(OTHER_AREA, 7, 5), catalog_row(AREA, 8, 70)])
+    entries = asyncio.run(area_catalog(db, AREA))
+    assert [(entry.resolution, entry.cell_count) for entry in entries] == [(7, 10), (8, 70)]
+    assert resolution_counts(asyncio.run(project_catalog(db, PROJECT))) == {7: 15, 8: 70}
+    assert resolution_counts(entries, AREA) == {7: 10, 8: 70}
+
+
+def test_refresh_rewrites_only_the_area_rows():
+    db = FakeSession([])
+    asyncio.run(refresh_area_catalog(db, AREA))
+    (delete_sql, delete_params), (insert_sql, insert_params) = db.statements
+    assert delete_sql == "DELETE FROM grid_catalog WHERE area_id = :area_id" and delete_params == {"area_id": AREA}
+    assert insert_sql.startswith("INSERT INTO grid_catalog") and "WHERE c.area_id = :area_id" in insert_sql
+    assert insert_params == {"area_id": AREA}
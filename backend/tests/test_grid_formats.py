@@ -0,0 +1,133 @@
+"""format=h3 and format=binary cell streams, compacted or not."""
+import asyncio
+import json
+import h3
+import h3.api.numpy_int as h3_int
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from app.routers import grids
+from app.utils.geo import compact_cell_array
+
+CELL = h3.latlng_to_cell(41.01, 28.97, 8)
+STRAY = h3.str_to_int(h3.latlng_to_cell(39.9, 32.8, 9))
+
+
+class FakeStream:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def partitions(self, size):
+        for start in range(0, len(self.rows), size):
+            yield self.rows[start:start + size]
+
+
+class FakeSession:
+    """Answers every streamed query with the given (h3, area_id, resolution) rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def stream(self, query_text, params):
+        # Endpoints ask for one row past the page to detect truncation
+        if "limit" in params:
+            return FakeStream(self.rows[params["offset"]:params["offset"] + params["limit"]])
+        return FakeStream(self.rows)
+
+
+async def call_directly(fn, *args):
+    return fn(*args)
+
+
+@pytest.fixture
+def rows(monkeypatch):
+    """Rows served to stream_cells; set the list's contents in the test"""
+    served = []
+    monkeypatch.setattr(grids, "AsyncSessionLocal", lambda: FakeSession(served))
+    monkeypatch.setattr(grids, "run_in_pool", call_directly)
+    return served
+
+
+def collect(grid_format, compact, limit=None, offset=0, page=None) -> bytes:
+    params = {} if limit is None else {"limit": limit + 1, "offset": offset}
+
+    async def run():
+        parts = []
+        async for chunk in grids.stream_cells(None, params, '{"cells":[', grid_format, compact, limit, offset, page):
+            parts.append(chunk.encode() if isinstance(chunk, str) else chunk)
+        return b"".join(parts)
+    return asyncio.run(run())
+
+
+def test_compact_cell_array_replaces_complete_siblings():
+    parent = h3.str_to_int(CELL)
+    children = h3_int.cell_to_children(parent, 9)
+    compacted = compact_cell_array(np.concatenate((children, children[:2], np.array([STRAY], dtype=np.uint64))))
+    assert sorted(compacted.tolist()) == sorted([parent, STRAY])
+
+
+def test_compact_stream_handles_mixed_resolutions(rows):
+    parent = h3.str_to_int(CELL)
+    children = h3_int.cell_to_children(parent, 9).tolist()
+    rows.extend([(parent, "a", 8)] + [(child, "a", 9) for child in children] + [(STRAY, "a", 9), (STRAY, "b", 9)])
+
+    payload = json.loads(collect("h3", True))
+    assert payload["cells"] == [h3.int_to_str(parent), h3.int_to_str(STRAY), h3.int_to_str(STRAY)]
+    assert payload["areas"] == [{"area_id": "a", "count": 2}, {"area_id": "b", "count": 1}]
+
+    binary = np.frombuffer(collect("binary", True), dtype="<u8")
+    assert sorted(binary.tolist()) == sorted([parent, STRAY, STRAY])
+
+
+def test_uncompacted_stream_keeps_area_runs(rows):
+    rows.extend([(1, "a", 9), (2, "a", 9), (3, "b", 9), (4, "a", 9)])
+    payload = json.loads(collect("h3", False))
+    assert payload["cells"] == ["1", "2", "3", "4"]
+    assert payload["areas"] == [{"area_id": "a", "count": 2}, {"area_id": "b", "count": 1}, {"area_id": "a", "count": 1}]
+
+
+def test_pages_report_truncation(rows):
+    rows.extend((cell, "a", 9) for cell in range(1, 6))
+    page = {}
+    payload = json.loads(collect("h3", False, limit=2, offset=2, page=page))
+    assert payload["cells"] == ["3", "4"]
+    assert (payload["truncated"], payload["next_offset"]) == (True, 4)
+    assert page == {"truncated": True, "next_offset": 4}
+
+    page = {}
+    assert np.frombuffer(collect("binary", False, limit=2, offset=4, page=page), dtype="<u8").tolist() == [5]
+    assert page == {"truncated": False, "next_offset": None}
+
+
+def test_binary_pages_carry_truncation_headers(rows):
+    rows.extend((cell, "a", 9) for cell in range(1, 6))
+
+    def page(offset):
+        params = {"limit": 3, "offset": offset}
+        return asyncio.run(grids.cells_response(None, None, params, {"resolution": 9}, "binary", False, '"e"', 2, offset))
+
+    first = page(0)
+    assert np.frombuffer(first.body, dtype="<u8").tolist() == [1, 2]
+    assert first.headers["X-Grid-Truncated"] == "true"
+    assert first.headers["X-Grid-Next-Offset"] == "2"
+    assert first.headers["X-Grid-Resolution"] == "9"
+
+    last = page(4)
+    assert np.frombuffer(last.body, dtype="<u8").tolist() == [5]
+    assert last.headers["X-Grid-Truncated"] == "false"
+    assert "X-Grid-Next-Offset" not in last.headers
+
+
+def test_compact_scope_is_capped(monkeypatch):
+    monkeypatch.setattr(grids, "GRID_COMPACT_MAX_CELLS", 100)
+    grids.check_compact_scope({7: 60, 8: 40})
+    grids.check_compact_scope({7: 60, 8: 400}, resolution=7)
+    with pytest.raises(HTTPException) as error:
+        grids.check_compact_scope({7: 60, 8: 41})
+    assert error.value.status_code == 400
@@ -0,0 +1,253 @@
+"""run_job against an in-memory grid: fresh runs, resumes from saved state, incremental diffs and cancels."""
+import asyncio
+from uuid import uuid4
+import h3.api.numpy_int as h3_int
+import pytest
+from app.models.project import GridJob
+from app.utils import grid_jobs, grid_workers
+from app.utils.geo import plan_polyfill_tiles
+from app.utils.grid_store import h3_to_str
+from app.utils.grid_workers import polyfill_resolution
+
+OLD_BOUNDARY = {
+    "type": "Polygon",
+    "coordinates": [[[28.80, 40.90], [29.20, 40.90], [29.20, 41.20], [28.80, 41.20], [28.80, 40.90]]]
+}
+NEW_BOUNDARY = {
+    "type": "Polygon",
+    "coordinates": [[[28.90, 40.98], [29.05, 40.97], [29.08, 41.06], [28.95, 41.08], [28.90, 40.98]]]
+}
+RESOLUTIONS = [6, 7, 8]
+TILE_RES = 7
+
+
+class FakeResult:
+    def scalar(self):
+        return None
+
+
+class FakeSession:
+    def __init__(self, job):
+        self.job = job
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def get(self, model, job_id):
+        return self.job
+
+    async def execute(self, statement, params=None):
+        self.statements.append(statement)
+        return FakeResult()
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeGrid:
+    """project_grid_cells of one area as {resolution: set of cells}, plus what run_job did to it"""
+
+    def __init__(self, stored=None, response_cells=()):
+        self.stored = {res: set(cells) for res, cells in (stored or {}).items()}
+        self.response_cells = set(response_cells)
+        self.saves = []
+        self.cancel_after = None
+        self.cleared = False
+        self.polyfilled = []
+        self.tiles_computed = []
+        self.published = 0
+
+    def cells(self, res):
+        return self.stored.setdefault(res, set())
+
+    async def fetch_stored_cells(self, db, area_id, res):
+        return set(self.cells(res))
+
+    async def fetch_stored_range(self, db, area_id, res, low, high):
+        return {cell for cell in self.cells(res) if low <= cell <= high}
+
+    async def fetch_stored_resolutions(self, db, area_id):
+        return sorted(res for res, cells in self.stored.items() if cells)
+
+    async def find_response_cells(self, db, project_id, cells):
+        return {h3_to_str(cell): 1 for cell in cells if cell in self.response_cells}
+
+    async def delete_cells(self, db, area_id, res, cells):
+        self.cells(res).difference_update(cells)
+
+    async def delete_resolution(self, db, area_id, res):
+        self.stored.pop(res, None)
+
+    async def delete_cells_outside_tiles(self, db, area_id, res, tile_res, tiles):
+        outside = sorted(cell for cell in self.cells(res) if h3_int.cell_to_parent(cell, tile_res) not in set(tiles))
+        self.cells(res).difference_update(outside)
+        return outside
+
+    async def clear_cells(self, db, area_id):
+        self.cleared = True
+        self.stored.clear()
+
+    async def load_grid_cells(self, db, area_id, res, chunks):
+        loaded = 0
+        async for chunk in chunks:
+            self.cells(res).update(cell for cell, _ in chunk)
+            loaded += len(chunk)
+            yield loaded
+
+    async def save(self, db, job_id, **values):
+        self.saves.append(values)
+        if self.cancel_after is not None and len(self.saves) >= self.cancel_after:
+            raise grid_jobs.JobCancelled()
+
+    async def publish_grid(self, db, project_id, area_id):
+        self.published += 1
+
+    def start_polyfills(self, geojson, resolutions, mode, rule):
+        self.polyfilled.extend(resolutions)
+        return grid_workers.start_polyfills(geojson, resolutions, mode, rule)
+
+    async def call_directly(self, fn, *args):
+        if fn is grid_workers.tile_levels:
+            self.tiles_computed.append(args[0])
+        return fn(*args)
+
+
+def full_grid(boundary):
+    return {res: set(polyfill_resolution(boundary, res)) for res in RESOLUTIONS}
+
+
+def run(monkeypatch, grid: FakeGrid, boundary: dict, params: dict, state: dict = None) -> FakeSession:
+    job = GridJob(
+        id=uuid4(), project_id=uuid4(), area_id=uuid4(), status="RUNNING", params=params,
+        state=state or {}, cells_written=0, cells_removed=0, progress=0
+    )
+    db = FakeSession(job)
+
+    async def idle(job_id):
+        await asyncio.Event().wait()
+
+    async def load_boundary(db, area_id):
+        return boundary
+
+    for name in (
+        "fetch_stored_cells", "fetch_stored_range", "fetch_stored_resolutions", "find_response_cells", "delete_cells",
+        "delete_resolution", "delete_cells_outside_tiles", "clear_cells", "load_grid_cells", "publish_grid",
+        "start_polyfills"
+    ):
+        monkeypatch.setattr(grid_jobs, name, getattr(grid, name))
+    monkeypatch.setattr(grid_jobs, "_save", grid.save)
+    monkeypatch.setattr(grid_jobs, "_heartbeat", idle)
+    monkeypatch.setattr(grid_jobs, "_load_boundary_geojson", load_boundary)
+    monkeypatch.setattr(grid_jobs, "AsyncSessionLocal", lambda: db)
+    monkeypatch.setattr(grid_jobs, "tile_resolution", lambda resolutions: TILE_RES)
+    monkeypatch.setattr(grid_jobs, "schedule_project_archive", lambda project_id: None)
+    monkeypatch.setattr(grid_jobs, "run_in_pool", grid.call_directly)
+    monkeypatch.setattr(grid_workers, "run_in_pool", grid.call_directly)
+    asyncio.run(grid_jobs.run_job(job.id))
+    return db
+
+
+def params(incremental=False):
+    return {"resolutions": RESOLUTIONS, "mode": "polyfill", "inclusion": "centroid", "incremental": incremental}
+
+
+def test_fresh_run_writes_every_level(monkeypatch):
+    grid = FakeGrid()
+    run(monkeypatch, grid, NEW_BOUNDARY, params())
+    expected = full_grid(NEW_BOUNDARY)
+    assert all(expected.values())
+    assert grid.stored == expected and grid.cleared
+    final = grid.saves[-1]
+    assert final["status"] == "SUCCESS"
+    assert final["result"]["count"] == sum(len(cells) for cells in expected.values())
+    assert grid.published == 1
+
+
+def test_resume_skips_completed_levels_and_tiles(monkeypatch):
+    expected = full_grid(NEW_BOUNDARY)
+    tiles = [tile for tile, _ in plan_polyfill_tiles(NEW_BOUNDARY, TILE_RES)]
+    assert len(tiles) > 2
+    done = set(tiles[:2])
+
+    def in_done_tiles(cell):
+        return h3_int.cell_to_parent(cell, TILE_RES) in done
+
+    # Resolution 6 and the first two tiles were committed, the third tile only half
+    partial = sorted(cell for cell in expected[8] if h3_int.cell_to_parent(cell, TILE_RES) == tiles[2])
+    stored = {
+        6: expected[6],
+        7: {cell for cell in expected[7] if in_done_tiles(cell)},
+        8: {cell for cell in expected[8] if in_done_tiles(cell)} | set(partial[:len(partial) // 2])
+    }
+    missing = sum(len(expected[res] - stored[res]) for res in RESOLUTIONS)
+    grid = FakeGrid(stored)
+    run(monkeypatch, grid, NEW_BOUNDARY, params(), {"cleared": True, "completed_resolutions": [6], "tiles_completed": 2})
+
+    assert grid.stored == expected
+    assert not grid.cleared and grid.polyfilled == []
+    assert grid.tiles_computed == tiles[2:]
+    assert grid.saves[-1]["result"]["count"] == missing
+    assert grid.saves[-1]["result"]["removed_count"] == 0
+
+
+def test_incremental_run_diffs_against_the_stored_grid(monkeypatch):
+    old = full_grid(OLD_BOUNDARY)
+    stale_resolution = {h3_int.cell_to_children(cell, 9)[0] for cell in list(old[8])[:3]}
+    outside = next(cell for cell in old[8] if cell not in full_grid(NEW_BOUNDARY)[8])
+    grid = FakeGrid({**old, 9: stale_resolution}, response_cells=[outside])
+    run(monkeypatch, grid, NEW_BOUNDARY, params(incremental=True))
+
+    expected = full_grid(NEW_BOUNDARY)
+    assert {res: cells for res, cells in grid.stored.items() if cells} == expected
+    assert not grid.cleared
+    result = grid.saves[-1]["result"]
+    assert result["count"] == sum(len(expected[res] - old[res]) for res in RESOLUTIONS)
+    assert result["removed_count"] == sum(len(old[res] - expected[res]) for res in RESOLUTIONS) + len(stale_resolution)
+    assert {"h3_index": h3_to_str(outside), "resolution": 8, "response_count": 1} in result["dropped_response_cells"]
+
+
+def test_cancel_marks_the_job_and_publishes_what_was_written(monkeypatch):
+    grid = FakeGrid()
+    grid.cancel_after = 3
+    db = run(monkeypatch, grid, NEW_BOUNDARY, params())
+    assert all(save.get("status") != "SUCCESS" for save in grid.saves)
+    assert db.rollbacks == 1 and grid.published == 1
+    assert db.statements[-1].compile().params["status"] == "CANCELLED"
+
+
+class SaveSession:
+    """Session for the real _save: the conditional UPDATE returns `status`, or nothing for a cancelled row"""
+
+    def __init__(self, status):
+        self.status = status
+        self.commits = 0
+
+    async def execute(self, statement):
+        self.statement = statement
+        result = FakeResult()
+        result.scalar = lambda: self.status
+        return result
+
+    async def commit(self):
+        self.commits += 1
+
+
+def test_save_never_overwrites_a_cancel():
+    running = SaveSession("RUNNING")
+    asyncio.run(grid_jobs._save(running, uuid4(), progress=50))
+    assert running.commits == 1
+    assert "status NOT IN" in str(running.statement.compile(compile_kwargs={"render_postcompile": True}))
+
+    cancelled = SaveSession(None)
+    with pytest.raises(grid_jobs.JobCancelled):
+        asyncio.run(grid_jobs._save(cancelled, uuid4(), status="SUCCESS"))
+    assert cancelled.commits == 1
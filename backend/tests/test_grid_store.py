@@ -0,0 +1,63 @@
+"""Grid storage helpers that only touch the session they are given."""
+import asyncio
+from uuid import uuid4
+from app.models.project import Project, ProjectArea
+from app.utils.grid_store import get_project_boundary_area, h3_to_int, h3_to_str, PROJECT_BOUNDARY_AREA_NAME
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def scalars(self):
+        return self
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+
+class FakeSession:
+    """Serves `areas` to the first select and records everything else"""
+
+    def __init__(self, areas):
+        self.areas = areas
+        self.added = []
+        self.statements = []
+        self.commits = 0
+
+    async def execute(self, statement, params=None):
+        self.statements.append(str(statement))
+        return FakeResult(self.areas)
+
+    def add(self, instance):
+        self.added.append(instance)
+
+    async def flush(self):
+        for instance in self.added:
+            instance.id = instance.id or uuid4()
+
+    async def commit(self):
+        self.commits += 1
+
+
+def test_boundary_area_is_left_for_the_caller_to_commit():
+    project = Project(id=uuid4(), boundary_geom="POLYGON")
+    db = FakeSession([])
+    area = asyncio.run(get_project_boundary_area(db, project, 0.001, 5.0, 6))
+    assert db.added == [area] and db.commits == 0
+    assert (area.name, area.is_project_boundary, area.boundary_geom) == (PROJECT_BOUNDARY_AREA_NAME, True, "POLYGON")
+    assert any("areas_version" in statement for statement in db.statements)
+
+
+def test_boundary_area_is_reused_and_resynced():
+    project = Project(id=uuid4(), boundary_geom="NEW")
+    existing = ProjectArea(id=uuid4(), project_id=project.id, boundary_geom="OLD", num_resolutions=8)
+    db = FakeSession([existing])
+    area = asyncio.run(get_project_boundary_area(db, project, 0.001, 5.0, 4, 1))
+    assert area is existing and db.added == [] and db.commits == 0
+    assert (area.boundary_geom, area.num_resolutions, area.num_virtual_resolutions) == ("NEW", 4, 1)
+
+
+def test_h3_string_round_trip():
+    cell = "881ec92a9bfffff"
+    assert h3_to_str(h3_to_int(cell)) == cell
@@ -0,0 +1,44 @@
+"""The regeneration dry run decides per response cell what the tiled job decides for the whole grid."""
+import h3
+import h3.api.numpy_int as h3_int
+import pytest
+from app.utils.geo import INCLUSION_RULES
+from app.utils.grid_workers import hierarchical_cells, polyfill_resolution, surviving_cells
+
+OLD_BOUNDARY = {
+    "type": "Polygon",
+    "coordinates": [[[28.80, 40.90], [29.20, 40.90], [29.20, 41.20], [28.80, 41.20], [28.80, 40.90]]]
+}
+NEW_BOUNDARY = {
+    "type": "Polygon",
+    "coordinates": [[[28.90, 40.98], [29.05, 40.97], [29.08, 41.06], [28.95, 41.08], [28.90, 40.98]]]
+}
+RESOLUTIONS = [6, 7, 8]
+
+
+def old_cells():
+    """Cells of the old, larger grid at every resolution, as (cell, resolution) pairs"""
+    return [(cell, res) for res in RESOLUTIONS for cell in polyfill_resolution(OLD_BOUNDARY, res)]
+
+
+@pytest.mark.parametrize("rule", INCLUSION_RULES)
+def test_hierarchical_survivors_match_a_full_generation(rule):
+    levels = hierarchical_cells(NEW_BOUNDARY, RESOLUTIONS, rule)
+    expected = {cell for res in RESOLUTIONS for cell in levels[res]}
+    cells = old_cells()
+    kept = set(surviving_cells(NEW_BOUNDARY, cells, RESOLUTIONS, "hierarchical", rule))
+    assert kept == expected & {cell for cell, _ in cells}
+
+
+def test_polyfill_survivors_match_a_full_generation():
+    expected = {cell for res in RESOLUTIONS for cell in polyfill_resolution(NEW_BOUNDARY, res)}
+    cells = old_cells()
+    kept = set(surviving_cells(NEW_BOUNDARY, cells, RESOLUTIONS, "polyfill", "centroid"))
+    assert kept == expected & {cell for cell, _ in cells}
+
+
+def test_cells_of_dropped_resolutions_are_not_kept():
+    cell = h3.str_to_int(h3.latlng_to_cell(41.02, 28.99, 9))
+    assert surviving_cells(NEW_BOUNDARY, [(cell, 9)], RESOLUTIONS, "polyfill", "centroid") == []
+    parent = h3_int.cell_to_parent(cell, 8)
+    assert surviving_cells(NEW_BOUNDARY, [(int(parent), 8)], RESOLUTIONS, "polyfill", "centroid") == [parent]
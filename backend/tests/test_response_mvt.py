@@ -0,0 +1,13 @@
+"""Response tiles: parsing of the selected cell stored with each answer."""
+import h3
+import pytest
+from app.routers.response_mvt import parse_selected_cell
+
+CELL = h3.latlng_to_cell(41.01, 28.97, 8)
+
+
+@pytest.mark.parametrize("value, valid", [
+    (CELL, True), ("not-hex", False), ("1", False), ("f" * 20, False), (None, False)
+])
+def test_parse_selected_cell_skips_invalid_answers(value, valid):
+    assert (parse_selected_cell(value) is not None) == valid
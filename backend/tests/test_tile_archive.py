@@ -0,0 +1,17 @@
+"""Tile archive footprints: which tiles a build has to render."""
+import shapely
+from app.utils.mvt_tiles import get_tile_bbox_4326
+from app.utils.tile_archive import footprint_tiles, tile_range
+
+
+def test_footprint_tiles_match_a_full_bbox_scan():
+    shapes = [shapely.Point(29, 41).buffer(0.3), shapely.Point(35, 39).buffer(0.2)]
+    footprint = shapely.union_all(shapes)
+    expected = set()
+    for z in range(5, 11):
+        x_min, y_min, x_max, y_max = tile_range(footprint.bounds, z)
+        expected.update(
+            (z, x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)
+            if footprint.intersects(shapely.box(*get_tile_bbox_4326(z, x, y)))
+        )
+    assert set(footprint_tiles(shapes, list(range(5, 11)))) == expected
@@ -0,0 +1,63 @@
+"""TileCache invalidation by grid version, in memory and on disk."""
+import asyncio
+import os
+from uuid import uuid4
+from app.utils.tile_cache import TileCache, TileKey
+
+PROJECT = uuid4()
+OTHER = uuid4()
+
+
+def key(version: int, project=PROJECT, x: int = 1, variant: str = "") -> TileKey:
+    return TileKey(project, None, 9, 12, x, 2, version, variant)
+
+
+def test_newer_version_frees_older_tiles(tmp_path):
+    cache = TileCache(1024, str(tmp_path))
+
+    async def run():
+        await cache.put(key(1), b"old")
+        await cache.put(key(1, OTHER), b"other")
+        assert await cache.get(key(1)) == b"old"
+        await cache.put(key(2, x=5), b"new")
+        assert os.path.exists(key(2, x=5).path(str(tmp_path)))
+        assert not os.path.exists(os.path.join(str(tmp_path), str(PROJECT), "1"))
+        assert await cache.get(key(1)) is None
+        # Other projects keep their own versions
+        assert await cache.get(key(1, OTHER)) == b"other"
+        assert await cache.get(key(2, x=5)) == b"new"
+    asyncio.run(run())
+    assert cache.size_bytes == len(b"other") + len(b"new")
+
+
+def test_tiles_of_a_stale_version_are_not_stored(tmp_path):
+    cache = TileCache(1024, str(tmp_path))
+
+    async def run():
+        await cache.put(key(3), b"current")
+        # A request that read version 2 before the bump finishes rendering after it
+        await cache.put(key(2, x=7), b"stale")
+        assert await cache.get(key(2, x=7)) is None
+        assert not os.path.exists(key(2, x=7).path(str(tmp_path)))
+        assert await cache.get(key(3)) == b"current"
+    asyncio.run(run())
+
+
+def test_disk_tier_survives_a_new_process(tmp_path):
+    asyncio.run(TileCache(1024, str(tmp_path)).put(key(1, variant="fields"), b"tile"))
+    restarted = TileCache(1024, str(tmp_path))
+    assert asyncio.run(restarted.get(key(1, variant="fields"))) == b"tile"
+    assert asyncio.run(restarted.get(key(1))) is None
+    assert (restarted.disk_hits, restarted.misses) == (1, 1)
+
+
+def test_memory_tier_is_capped_by_bytes():
+    cache = TileCache(10)
+
+    async def run():
+        for x in range(4):
+            await cache.put(key(1, x=x), b"1234")
+        assert await cache.get(key(1, x=0)) is None
+        assert await cache.get(key(1, x=3)) == b"1234"
+    asyncio.run(run())
+    assert cache.size_bytes <= 10 and cache.evictions == 2
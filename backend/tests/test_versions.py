@@ -0,0 +1,34 @@
+"""Version counters as ETags: matching If-None-Match and guarding the counter columns."""
+import asyncio
+import pytest
+from starlette.requests import Request
+from app.utils.versions import bump_project_version, etag_matches, make_etag, not_modified
+
+
+def request_with(headers: dict) -> Request:
+    return Request({
+        "type": "http", "method": "GET", "path": "/", "query_string": b"",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    })
+
+
+def test_etag_matches_weak_and_listed_validators():
+    etag = make_etag("tile", "p", 1, 2, 3, 4)
+    assert etag_matches(request_with({"If-None-Match": etag}), etag)
+    assert etag_matches(request_with({"If-None-Match": f'"other", W/{etag}'}), etag)
+    assert etag_matches(request_with({"If-None-Match": "*"}), etag)
+    assert not etag_matches(request_with({"If-None-Match": '"other"'}), etag)
+    assert not etag_matches(request_with({}), etag)
+    assert make_etag("tile", "p", 1) != make_etag("tile", "p", 2)
+
+
+def test_not_modified_repeats_the_validator():
+    response = not_modified('"v"')
+    assert response.status_code == 304 and response.headers["etag"] == '"v"'
+    assert response.headers["cache-control"] == "no-cache"
+
+
+def test_unknown_version_columns_are_rejected_before_any_sql():
+    # The column name is interpolated into the UPDATE, so anything else must fail without a session
+    with pytest.raises(ValueError):
+        asyncio.run(bump_project_version(None, "p", "name = 'x', grid_version"))
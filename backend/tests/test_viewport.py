@@ -0,0 +1,65 @@
+"""Viewport-limited by-zoom queries: bbox/tiles parsing and page envelopes."""
+import asyncio
+import json
+from uuid import uuid4
+import pytest
+from fastapi import FastAPI, HTTPException
+from app.database import get_db
+from app.routers import grids
+from app.utils.mvt_tiles import get_tile_bbox_4326
+
+
+def test_viewport_bbox_parses_bbox_and_tile_ranges():
+    assert grids.viewport_bbox("28.9,40.9,29.1,41.1", None) == (28.9, 40.9, 29.1, 41.1)
+    assert grids.viewport_bbox(None, None) is None
+    assert grids.viewport_bbox(None, "10/583/383") == pytest.approx(get_tile_bbox_4326(10, 583, 383))
+    west, south, east, north = grids.viewport_bbox(None, "10/583-584/383-385")
+    assert (west, north) == pytest.approx((get_tile_bbox_4326(10, 583, 383)[0], get_tile_bbox_4326(10, 583, 383)[3]))
+    assert (south, east) == pytest.approx((get_tile_bbox_4326(10, 584, 385)[1], get_tile_bbox_4326(10, 584, 385)[2]))
+
+
+@pytest.mark.parametrize("bbox, tiles", [
+    ("1,2,3", None), ("a,b,c,d", None), ("3,0,1,1", None), (None, "10/5"), (None, "2/4/0"), (None, "3/2-1/0")
+])
+def test_viewport_bbox_rejects_malformed_input(bbox, tiles):
+    with pytest.raises(HTTPException) as error:
+        grids.viewport_bbox(bbox, tiles)
+    assert error.value.status_code == 400
+
+
+def test_page_suffix_points_at_the_next_page():
+    assert json.loads('{"features":[' + grids.page_suffix(100, 200)(True)) == {
+        "features": [], "truncated": True, "next_offset": 300
+    }
+    assert json.loads('{"features":[' + grids.page_suffix(100, 200)(False))["next_offset"] is None
+
+
+def get_status(app, path: str, query: str) -> int:
+    """Status of a bare ASGI GET; validation errors answer before any database work"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "headers": [],
+        "client": ("test", 1), "server": ("test", 80), "root_path": ""
+    }
+    asyncio.run(app(scope, receive, send))
+    return next(message["status"] for message in messages if message["type"] == "http.response.start")
+
+
+async def no_db():
+    yield None
+
+
+@pytest.mark.parametrize("path", ["/grids/area/{id}/by-zoom", "/grids/{id}/by-zoom"])
+def test_by_zoom_pages_are_never_empty(path):
+    app = FastAPI()
+    app.include_router(grids.router)
+    app.dependency_overrides[get_db] = no_db
+    assert get_status(app, path.format(id=uuid4()), "zoom=10&limit=0") == 422
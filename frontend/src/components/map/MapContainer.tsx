@@ -47,6 +47,7 @@ interface MapContainerProps {
     onZoomChange?: (zoom: number) => void;
     fitTrigger?: number; // Increment this to trigger manual fitBounds
     autoZoom?: boolean;
+    showResponses?: boolean; // Draw the project's responses from the response vector tiles
 }
 
 const MapContainer: React.FC<MapContainerProps> = ({
@@ -65,7 +66,8 @@ const MapContainer: React.FC<MapContainerProps> = ({
     onSelectedCellsChange,
     onZoomChange,
     fitTrigger,
-    autoZoom = false
+    autoZoom = false,
+    showResponses = false
 }) => {
     const mapContainerRef = useRef<HTMLDivElement>(null);
     const mapRef = useRef<maplibregl.Map | null>(null);
@@ -180,15 +182,14 @@ const MapContainer: React.FC<MapContainerProps> = ({
         if (!map || !isMapReady || !projectId || projectId === 'undefined') return;
 
         const apiUrl = import.meta.env.VITE_API_URL || window.location.origin.replace(':5174', ':5173');
-        const mvtUrl = `${apiUrl}/grids/mvt/${projectId}/{z}/{x}/{y}.pbf${areaId ? `?area_id=${areaId}` : ''}`;
+        // The TileJSON pins tile URLs to the current grid version and limits requests to the grid's bounds and zooms
+        const tileJsonUrl = `${apiUrl}/grids/mvt/${projectId}/tilejson.json${areaId ? `?area_id=${areaId}` : ''}`;
 
         if (!map.getSource('h3-grid')) {
             // Initial source and layer creation
             map.addSource('h3-grid', {
                 type: 'vector',
-                tiles: [mvtUrl],
-                minzoom: 5,
-                maxzoom: 14
+                url: tileJsonUrl
             });
             map.addLayer({ id: 'h3-grid-fill', type: 'fill', source: 'h3-grid', 'source-layer': 'h3-layer', paint: { 'fill-color': '#4f46e5', 'fill-opacity': 0.3 } });
             map.addLayer({ id: 'h3-grid-outline', type: 'line', source: 'h3-grid', 'source-layer': 'h3-layer', paint: { 'line-color': '#4f46e5', 'line-width': 1, 'line-opacity': 0.5 } });
@@ -221,14 +222,42 @@ const MapContainer: React.FC<MapContainerProps> = ({
             // Sync current styles
             updateGridStyles();
         } else {
-            // Update existing source tiles
+            // Reload the TileJSON, which also picks up a new grid version
             const source = map.getSource('h3-grid') as maplibregl.VectorTileSource;
-            if (source && source.setTiles) {
-                source.setTiles([mvtUrl]);
+            if (source && source.setUrl) {
+                source.setUrl(tileJsonUrl);
             }
         }
     }, [projectId, areaId, isMapReady, updateGridStyles, showGrid]);
 
+    // Response vector tiles: hand-drawn geometries and selected cells, loaded only for the visible tiles
+    useEffect(() => {
+        const map = mapRef.current;
+        if (!map || !isMapReady || !projectId || projectId === 'undefined') return;
+
+        const layerIds = ['responses-fill', 'responses-line', 'responses-point', 'response-selections-fill', 'response-selections-outline'];
+        if (!showResponses) {
+            layerIds.forEach(layerId => { if (map.getLayer(layerId)) map.removeLayer(layerId); });
+            if (map.getSource('responses')) map.removeSource('responses');
+            return;
+        }
+
+        const apiUrl = import.meta.env.VITE_API_URL || window.location.origin.replace(':5174', ':5173');
+        const tilesUrl = `${apiUrl}/responses/mvt/${projectId}/{z}/{x}/{y}.pbf`;
+        const source = map.getSource('responses') as maplibregl.VectorTileSource | undefined;
+        if (source) {
+            source.setTiles([tilesUrl]);
+            return;
+        }
+
+        map.addSource('responses', { type: 'vector', tiles: [tilesUrl], minzoom: 5, maxzoom: 16 });
+        map.addLayer({ id: 'response-selections-fill', type: 'fill', source: 'responses', 'source-layer': 'selections', paint: { 'fill-color': '#10b981', 'fill-opacity': 0.35 } });
+        map.addLayer({ id: 'response-selections-outline', type: 'line', source: 'responses', 'source-layer': 'selections', paint: { 'line-color': '#10b981', 'line-width': 1 } });
+        map.addLayer({ id: 'responses-fill', type: 'fill', source: 'responses', 'source-layer': 'responses', filter: ['==', '$type', 'Polygon'], paint: { 'fill-color': '#f43f5e', 'fill-opacity': 0.25 } });
+        map.addLayer({ id: 'responses-line', type: 'line', source: 'responses', 'source-layer': 'responses', filter: ['!=', '$type', 'Point'], paint: { 'line-color': '#f43f5e', 'line-width': 2 } });
+        map.addLayer({ id: 'responses-point', type: 'circle', source: 'responses', 'source-layer': 'responses', filter: ['==', '$type', 'Point'], paint: { 'circle-radius': 5, 'circle-color': '#f43f5e', 'circle-stroke-width': 1, 'circle-stroke-color': '#fff' } });
+    }, [projectId, isMapReady, showResponses]);
+
     // Handle Basemap Switching and Opacity
     useEffect(() => {
         const map = mapRef.current;
@@ -276,7 +276,8 @@ const ProjectDetails: React.FC = () => {
     const fetchProjectAreas = async () => {
         try {
             const response = await api.get(`/areas/${id}`);
-            const areas = response.data || [];
+            // The internal project-boundary area is not user editable
+            const areas = (response.data || []).filter((area: any) => !area.is_project_boundary);
             setProjectAreas(areas);
 
             // Auto-select first area if none selected
@@ -453,6 +454,31 @@ const ProjectDetails: React.FC = () => {
         }
 
         try {
+            // Pre-flight: refuse configurations over the project's cell budget, confirm very large ones
+            const estimate = (await api.get(`/grids/area/${selectedAreaId}/estimate`)).data;
+            if (!estimate.budget.within_budget) {
+                alert(`Bu ayarlar yaklaşık ${estimate.total_cells.toLocaleString('tr-TR')} hücre üretir ve proje hücre bütçesini (${estimate.budget.budget.toLocaleString('tr-TR')}) aşar. En küçük grid alanını büyütün veya çözünürlük sayısını azaltın.`);
+                return;
+            }
+            if (estimate.total_cells > 1000000) {
+                const minutes = Math.ceil(estimate.total_seconds / 60);
+                const proceed = window.confirm(`Yaklaşık ${estimate.total_cells.toLocaleString('tr-TR')} hücre (~${estimate.total_storage_mb} MB, ~${minutes} dk) üretilecek. Devam edilsin mi?`);
+                if (!proceed) return;
+            }
+
+            // Area already has a grid: regeneration is incremental, so only responses in dropped cells are at risk
+            const selectedArea = projectAreas.find(a => a.id === selectedAreaId);
+            if (selectedArea?.grids_generated) {
+                const diffResponse = await api.get(`/grids/area/${selectedAreaId}/regeneration-diff`);
+                if (diffResponse.data.dropped_response_count > 0) {
+                    setAreaDataCount(diffResponse.data.dropped_response_count);
+                    setShowAreaDataWarning(true);
+                    return;
+                }
+                await executeAreaGridGeneration();
+                return;
+            }
+
             // Check if there's existing data for this area
             const checkResponse = await api.get(`/areas/${id}/${selectedAreaId}/check-data`);
             const checkData = checkResponse.data;
@@ -488,7 +514,8 @@ const ProjectDetails: React.FC = () => {
         setGenerationProgress(0);
         setGenerationMessage('Seçilen alan için grid üretimi başlatılıyor...');
         try {
-            const response = await fetch(`${import.meta.env.VITE_API_URL}/grids/area/${selectedAreaId}/generate`, {
+            const incremental = projectAreas.find(a => a.id === selectedAreaId)?.grids_generated;
+            const response = await fetch(`${import.meta.env.VITE_API_URL}/grids/area/${selectedAreaId}/generate${incremental ? '?incremental=true' : ''}`, {
                 method: 'POST',
                 headers: {
                     'X-User-Id': localStorage.getItem('user_id') || ''
@@ -724,6 +751,7 @@ const ProjectDetails: React.FC = () => {
                             }
                         }}
                         autoZoom={activeTab === 'data'}
+                        showResponses={activeTab === 'data'}
                     />
                 </div>
 
@@ -22,6 +22,7 @@ const MapEntry: React.FC = () => {
     const [activeDrawCol, setActiveDrawCol] = useState<string | null>(null);
     const activeDrawColRef = useRef<string | null>(null);
     const drawInstanceRef = useRef<any>(null); // Store draw instance to clear polygons
+    const mapRef = useRef<any>(null); // Map instance, for the viewport of grid queries
 
     // Multi-select grid states
     const [selectedGridCells, setSelectedGridCells] = useState<string[]>([]);
@@ -38,19 +39,30 @@ const MapEntry: React.FC = () => {
     const [currentZoom, setCurrentZoom] = useState(10);
     const [currentResolution, setCurrentResolution] = useState<number | null>(null);
 
+    // Only the resolution is read here (cells are drawn from vector tiles), so a single cell
+    // inside the visible area is enough
+    const gridsByZoomUrl = useCallback((zoom: number) => {
+        let url = `/grids/${projectId}/by-zoom?zoom=${zoom}&limit=1&format=h3`;
+        if (mapRef.current) {
+            const bounds = mapRef.current.getBounds();
+            url += `&bbox=${[bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()].join(',')}`;
+        }
+        return url;
+    }, [projectId]);
+
     // Load grids based on zoom level
     const loadGridsByZoom = useCallback(async (zoom: number) => {
         if (!projectId) return;
         try {
-            const res = await api.get(`/grids/${projectId}/by-zoom?zoom=${zoom}`);
-            if (res.data.features && res.data.features.length > 0) {
+            const res = await api.get(gridsByZoomUrl(zoom));
+            if (res.data.cells && res.data.cells.length > 0) {
                 setCurrentResolution(res.data.resolution);
             }
         } catch (err) {
             console.error('Error loading grids by zoom:', err);
             // Fallback to default grids
         }
-    }, [projectId]);
+    }, [projectId, gridsByZoomUrl]);
 
     useEffect(() => {
         const init = async () => {
@@ -60,8 +72,8 @@ const MapEntry: React.FC = () => {
             try {
                 // 1. Fetch Grids (initial load - will be updated on zoom)
                 try {
-                    const gridRes = await api.get(`/grids/${projectId}/by-zoom?zoom=10`);
-                    if (gridRes.data.features && gridRes.data.features.length > 0) {
+                    const gridRes = await api.get(gridsByZoomUrl(10));
+                    if (gridRes.data.cells && gridRes.data.cells.length > 0) {
                         setCurrentResolution(gridRes.data.resolution);
                     }
                 } catch {
@@ -85,7 +97,7 @@ const MapEntry: React.FC = () => {
         };
 
         init();
-    }, [projectId]);
+    }, [projectId, gridsByZoomUrl]);
 
     // Handle zoom change to load appropriate resolution grids
     const handleZoomChange = useCallback((zoom: number) => {
@@ -344,7 +356,8 @@ const MapEntry: React.FC = () => {
                         selectedCells={selectedGridCells}
                         onSelectedCellsChange={handleSelectedCellsChange}
                         onZoomChange={handleZoomChange}
-                        onLoad={(_map, draw) => {
+                        onLoad={(map, draw) => {
+                            mapRef.current = map;
                             drawInstanceRef.current = draw;
                         }}
                     />